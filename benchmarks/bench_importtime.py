@@ -0,0 +1,139 @@
+# benchmarks/bench_importtime.py
+
+"""
+Cold-start benchmark of the tranay entry points, based on `python -X importtime`.
+Each sample runs in a fresh interpreter and reports the cumulative import time
+of the module, the wall time until the MCP tools are registered, and the
+slowest imports.
+
+    python -m benchmarks.bench_importtime --repeat 5 --output importtime.json
+    python -m benchmarks.bench_importtime --compare old.json new.json
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_tools import git_commit, percentile
+
+
+MODULES = ('tranay.tools', 'tranay.mcp', 'tranay.studio')
+
+# Registers every tool the way `tranay_mcp` does before it can answer a tool list
+MCP_STARTUP = (
+    'from tranay.mcp import parse_sources, tranayMCP; '
+    'tranayMCP(parse_sources(["/dev/null/bench.csv"]))'
+)
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Map each imported module to its (self, cumulative) import time in microseconds."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def sample(code: str) -> tuple[float, dict]:
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f'{code!r} failed:\n{proc.stderr[-2000:]}')
+    return wall, parse_importtime(proc.stderr)
+
+
+def measure(name: str, code: str, module: str, repeat: int, top: int) -> dict:
+    # One unmeasured run so every sample sees the same warm OS file cache
+    sample(code)
+    walls, imports, last = [], [], {}
+    for _ in range(repeat):
+        wall, last = sample(code)
+        walls.append(wall)
+        imports.append(last.get(module, (0, 0))[1])
+
+    slowest = sorted(
+        ((mod, cumulative) for mod, (_, cumulative) in last.items() if mod != module),
+        key=lambda item: -item[1],
+    )[:top]
+    return {
+        'name': name,
+        'module': module,
+        'import_p50_ms': round(percentile(imports, 0.5) / 1000, 1),
+        'import_p95_ms': round(percentile(imports, 0.95) / 1000, 1),
+        'wall_p50_ms': round(percentile(walls, 0.5) * 1000, 1),
+        'wall_p95_ms': round(percentile(walls, 0.95) * 1000, 1),
+        'modules_imported': len(last),
+        'slowest_imports_ms': {mod: round(us / 1000, 1) for mod, us in slowest},
+    }
+
+
+def compare(old_path: str, new_path: str):
+    def index(path):
+        with open(path) as f:
+            return {r['name']: r for r in json.load(f)['results']}
+
+    old, new = index(old_path), index(new_path)
+    for name in sorted(old.keys() & new.keys()):
+        for field in ('import_p50_ms', 'wall_p50_ms'):
+            before, after = old[name][field], new[name][field]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f'{name:<24} {field:<14} {before:>9.1f} -> {after:>9.1f} ms  {change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to report.')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    cases = [(f'import {module}', f'import {module}', module) for module in MODULES]
+    cases.append(('tranay_mcp startup', MCP_STARTUP, 'tranay.mcp'))
+
+    results = []
+    for name, code, module in cases:
+        result = measure(name, code, module, args.repeat, args.top)
+        results.append(result)
+        print(
+            f"{name:<24} import p50 {result['import_p50_ms']:>8.1f} ms  "
+            f"wall p50 {result['wall_p50_ms']:>8.1f} ms  {result['modules_imported']} modules",
+            file=sys.stderr,
+        )
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
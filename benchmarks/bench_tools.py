@@ -0,0 +1,377 @@
+# benchmarks/bench_tools.py
+
+"""
+End-to-end benchmark of the tranay tool surface (`Core` and `Visualizations`)
+over synthetic datasets, reporting p50/p95 latency, peak RSS and bytes returned
+per tool, backend and dataset size as JSON.
+
+    python -m benchmarks.bench_tools --rows 10000 100000 1000000 --output results.json
+    python -m benchmarks.bench_tools --rows 10000 --api --mongo --repeat 3
+
+Datasets are generated once per size in --data-dir and reused by later runs.
+Compare two result files with `python -m benchmarks.bench_tools --compare old.json new.json`.
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import math
+import os
+from pathlib import Path
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+
+import duckdb
+
+from benchmarks import fake_tranay_api
+
+
+BACKENDS = ('duckdb', 'sqlite', 'csv', 'parquet')
+TABLE_NAMES = {'duckdb': 'measurements', 'sqlite': 'measurements', 'csv': 'CSV', 'parquet': 'PARQUET'}
+SENSORS = 200
+
+
+def generate_dataset(data_dir: Path, rows: int, backends=BACKENDS) -> dict:
+    """Write the synthetic measurements table in every backend format; return source configs."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    db_path = data_dir / f'measurements_{rows}.duckdb'
+    paths = {
+        'duckdb': db_path,
+        'sqlite': data_dir / f'measurements_{rows}.db',
+        'csv': data_dir / f'measurements_{rows}.csv',
+        'parquet': data_dir / f'measurements_{rows}.parquet',
+    }
+
+    if not db_path.exists():
+        tmp_path = db_path.with_suffix('.tmp')
+        tmp_path.unlink(missing_ok=True)
+        with duckdb.connect(str(tmp_path)) as conn:
+            conn.execute('SELECT setseed(0.42)')
+            conn.execute(f"""
+                CREATE TABLE measurements AS
+                SELECT
+                    i AS id,
+                    (i % {SENSORS})::INTEGER AS sensor_id,
+                    'lane_' || (i % 4) AS lane_id,
+                    TIMESTAMP '2025-01-01' + to_seconds((i // {SENSORS}) * 300) AS timestamp,
+                    round(5 + random() * 125, 2) AS speed,
+                    (random() * 2000)::INTEGER AS flow,
+                    round(random(), 3) AS occupancy
+                FROM range({rows}) t(i)
+            """)
+        os.replace(tmp_path, db_path)
+
+    with duckdb.connect(str(db_path), read_only=True) as conn:
+        if 'csv' in backends and not paths['csv'].exists():
+            conn.execute(f"COPY measurements TO '{paths['csv']}.tmp' (FORMAT CSV, HEADER)")
+            os.replace(f"{paths['csv']}.tmp", paths['csv'])
+        if 'parquet' in backends and not paths['parquet'].exists():
+            conn.execute(f"COPY measurements TO '{paths['parquet']}.tmp' (FORMAT PARQUET)")
+            os.replace(f"{paths['parquet']}.tmp", paths['parquet'])
+        if 'sqlite' in backends and not paths['sqlite'].exists():
+            _write_sqlite(conn, paths['sqlite'])
+
+    urls = {
+        'duckdb': str(paths['duckdb']),
+        'sqlite': f"sqlite:///{paths['sqlite']}",
+        'csv': str(paths['csv']),
+        'parquet': str(paths['parquet']),
+    }
+    return {
+        f'bench{rows}-{backend}': {'url': urls[backend], 'source_type': backend}
+        for backend in backends
+    }
+
+
+def _write_sqlite(conn, path: Path):
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.unlink(missing_ok=True)
+    with sqlite3.connect(tmp_path) as db:
+        db.execute(
+            'CREATE TABLE measurements (id INTEGER, sensor_id INTEGER, lane_id TEXT, '
+            'timestamp TEXT, speed REAL, flow INTEGER, occupancy REAL)'
+        )
+        cursor = conn.execute(
+            'SELECT id, sensor_id, lane_id, CAST(timestamp AS VARCHAR), speed, flow, occupancy FROM measurements'
+        )
+        while batch := cursor.fetchmany(100_000):
+            db.executemany('INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+    os.replace(tmp_path, path)
+
+
+def insert_mongo_documents(url: str, rows: int):
+    import pymongo
+    client = pymongo.MongoClient(url)
+    collection = client.get_default_database()['lane_data']
+    collection.drop()
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'timestamp': f'2025-01-01T{(i // 60) % 24:02d}:{i % 60:02d}:00',
+            'metadata': {'lane_id': str(i % 50), 'simulation_session_id': 'sim1'},
+            'measurement': {'speed': float(i % 130), 'density': (i % 17) / 17, 'occupancy': (i % 100) / 100},
+        })
+        if len(batch) == 10_000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def sql_cases(source_id: str, backend: str, plot_rows: int) -> list:
+    table = TABLE_NAMES[backend]
+    aggregate = (
+        f'SELECT sensor_id, lane_id, avg(speed) AS speed, sum(flow) AS flow '
+        f'FROM {table} GROUP BY sensor_id, lane_id ORDER BY sensor_id'
+    )
+    sample = f'SELECT * FROM {table} LIMIT {plot_rows}'
+    return [
+        ('run_query.aggregate', 'core', {'source': source_id, 'query': aggregate}),
+        ('run_query.scan', 'core', {'source': source_id, 'query': f'SELECT * FROM {table}', 'limit': 1000}),
+        ('describe_table', 'core', {'source': source_id, 'table': table}),
+        ('scatter_plot', 'viz', {'source': source_id, 'query': sample, 'x': 'speed', 'y': 'flow'}),
+        ('line_plot', 'viz', {'source': source_id, 'query': aggregate, 'x': 'sensor_id', 'y': 'speed'}),
+        ('histogram', 'viz', {'source': source_id, 'query': sample, 'column': 'speed'}),
+        ('strip_plot', 'viz', {'source': source_id, 'query': sample, 'x': 'lane_id', 'y': 'speed'}),
+        ('box_plot', 'viz', {'source': source_id, 'query': sample, 'x': 'lane_id', 'y': 'speed'}),
+        ('bar_plot', 'viz', {'source': source_id, 'query': aggregate, 'x': 'sensor_id', 'y': 'flow'}),
+    ]
+
+
+def api_cases(source_id: str) -> list:
+    base = {'source': source_id, 'project_id': 'p0'}
+    return [
+        ('list_projects', 'core', {'source': source_id}),
+        ('run_query.scan', 'core', {**base, 'limit': 1000}),
+        ('run_query.filter', 'core', {**base, 'dataframe_query': 'sensor_id == 2007'}),
+        ('describe_table', 'core', {'source': source_id, 'table': 'sensor_readings'}),
+        ('list_unique_values', 'core', {**base, 'column': 'sensor_id'}),
+        ('scatter_plot', 'viz', {**base, 'x': 'speed', 'y': 'flow', 'dataframe_query': 'sensor_id < 2010'}),
+        ('line_plot', 'viz', {**base, 'x': 'timestamp', 'y': 'speed', 'dataframe_query': 'sensor_id == 2007'}),
+        ('histogram', 'viz', {**base, 'column': 'speed'}),
+        ('strip_plot', 'viz', {**base, 'x': 'sensor_id', 'y': 'speed', 'dataframe_query': 'sensor_id < 2010'}),
+        ('box_plot', 'viz', {**base, 'x': 'sensor_id', 'y': 'speed', 'dataframe_query': 'sensor_id < 2010'}),
+        ('bar_plot', 'viz', {**base, 'x': 'sensor_id', 'y': 'flow', 'dataframe_query': 'sensor_id < 2010'}),
+    ]
+
+
+def mongo_cases(source_id: str) -> list:
+    base = {'source': source_id, 'collection': 'lane_data'}
+    pipeline = [{'$group': {'_id': '$metadata.lane_id', 'speed': {'$avg': '$measurement.speed'}}}]
+    return [
+        ('run_query.find', 'core', {**base, 'filter': '{"metadata.lane_id": "7"}', 'limit': 1000}),
+        ('run_query.aggregate', 'core', {**base, 'pipeline': pipeline}),
+        ('describe_table', 'core', {'source': source_id, 'table': 'lane_data'}),
+        ('scatter_plot', 'viz', {**base, 'filter': '{"metadata.lane_id": "7"}', 'x': 'measurement.speed', 'y': 'measurement.occupancy'}),
+        ('histogram', 'viz', {**base, 'filter': '{"metadata.lane_id": "7"}', 'column': 'measurement.speed'}),
+        ('bar_plot', 'viz', {**base, 'filter': '{"metadata.lane_id": "7"}', 'x': 'timestamp', 'y': 'measurement.speed'}),
+    ]
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process (Linux >= 4.0), so each case gets its own peak."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Without /proc this is the peak of the whole run
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def result_bytes(result) -> int:
+    if isinstance(result, str):
+        return len(result.encode())
+    data = getattr(result, 'data', None)
+    return len(data) if isinstance(data, str) else 0
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def run_case(tool, kwargs: dict, repeat: int) -> dict:
+    reset_peak_rss()
+    timings = []
+    result = error = None
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        result = tool(**kwargs)
+        timings.append(time.perf_counter() - start)
+        # Tools report failures as strings; timing an error message is meaningless
+        if isinstance(result, str) and result.startswith('Error'):
+            error = error or result
+    # The first call pays for connections, caches and imports; it is reported apart
+    first, timings = timings[0], timings[1:] or timings
+    return {
+        'first_ms': round(first * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'bytes': result_bytes(result),
+        'error': error[:300] if error else None,
+    }
+
+
+def run_suite(sources: dict, cases: dict, repeat: int, rows: int, only: set | None) -> list:
+    from tranay.tools.core import Core
+    from tranay.tools.visualizations import Visualizations
+
+    toolsets = {'core': Core(sources), 'viz': Visualizations(sources)}
+    results = []
+    for source_id, source_cases in cases.items():
+        backend = sources[source_id]['source_type']
+        for name, toolset, kwargs in source_cases:
+            if only and name.split('.')[0] not in only:
+                continue
+            tool = getattr(toolsets[toolset], name.split('.')[0])
+            stats = run_case(tool, kwargs, repeat)
+            results.append({'tool': name, 'backend': backend, 'rows': rows, **stats})
+            print(
+                f"{backend:>10} {rows:>10} {name:<22} p50 {stats['p50_ms']:>10.1f} ms  "
+                f"p95 {stats['p95_ms']:>10.1f} ms  rss {stats['peak_rss_mb']:>8.1f} MB  "
+                f"{stats['bytes']:>10} B{'  ERROR' if stats['error'] else ''}",
+                file=sys.stderr,
+            )
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path: str, new_path: str):
+    """Print the p50 change of every case present in both result files."""
+    def index(path):
+        with open(path) as f:
+            return {(r['tool'], r['backend'], r['rows']): r for r in json.load(f)['results']}
+
+    old, new = index(old_path), index(new_path)
+    for key in sorted(old.keys() & new.keys(), key=str):
+        if old[key].get('error') or new[key].get('error'):
+            print(f'{key[1]:>10} {key[2]:>10} {key[0]:<22} {"failed":>10}')
+            continue
+        before, after = old[key]['p50_ms'], new[key]['p50_ms']
+        change = (after - before) / before * 100 if before else 0.0
+        print(f'{key[1]:>10} {key[2]:>10} {key[0]:<22} {before:>10.1f} -> {after:>10.1f} ms  {change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+        help='Dataset sizes to benchmark, e.g. 10000 100000 1000000 10000000.')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case, after one untimed first run.')
+    parser.add_argument('--plot-rows', type=int, default=20_000, help='Rows sampled for point-based plots.')
+    parser.add_argument('--tools', nargs='+', help='Only run these tools, e.g. run_query bar_plot.')
+    parser.add_argument('--no-plots', action='store_true', help='Skip the Visualizations tools.')
+    parser.add_argument('--api', action='store_true', help='Also benchmark a local stand-in tranay API.')
+    parser.add_argument('--mongo', action='store_true', help='Also benchmark MongoDB through mongomock.')
+    parser.add_argument('--max-service-rows', type=int, default=1_000_000,
+        help='Row cap for the API and mongomock datasets, which are built in memory.')
+    parser.add_argument('--data-dir', default='benchmarks/data')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    only = set(args.tools) if args.tools else None
+    results = []
+    for rows in args.rows:
+        sources = generate_dataset(Path(args.data_dir), rows, args.backends)
+        cases = {
+            source_id: sql_cases(source_id, source['source_type'], args.plot_rows)
+            for source_id, source in sources.items()
+        }
+
+        servers = []
+        if args.api:
+            service_rows = min(rows, args.max_service_rows)
+            sensors = min(100, service_rows)
+            server = fake_tranay_api.serve(sensors=sensors, readings=max(1, service_rows // sensors))
+            servers.append(server)
+            source_id = f'bench{rows}-tranay_api'
+            sources[source_id] = {
+                'url': f'http://127.0.0.1:{server.server_port}', 'source_type': 'tranay_api',
+            }
+            cases[source_id] = api_cases(source_id)
+
+        patcher = None
+        if args.mongo:
+            try:
+                import mongomock
+            except ImportError:
+                sys.exit('--mongo needs mongomock: pip install mongomock')
+            patcher = mongomock.patch(servers=(('localhost', 27017),))
+            patcher.start()
+            url = 'mongodb://localhost:27017/bench'
+            insert_mongo_documents(url, min(rows, args.max_service_rows))
+            source_id = f'bench{rows}-mongodb'
+            sources[source_id] = {'url': url, 'source_type': 'mongodb'}
+            cases[source_id] = mongo_cases(source_id)
+
+        if args.no_plots:
+            cases = {s: [c for c in source_cases if c[1] != 'viz'] for s, source_cases in cases.items()}
+
+        try:
+            results.extend(run_suite(sources, cases, args.repeat, rows, only))
+        finally:
+            for server in servers:
+                server.shutdown()
+            if patcher:
+                patcher.stop()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'plot_rows': args.plot_rows,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    failed = [r for r in results if r['error']]
+    for r in failed:
+        print(f"FAILED {r['backend']} {r['rows']} {r['tool']}: {r['error']}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+# benchmarks/fake_overpass.py
+
+"""
+Local stand-in for Overpass API mirrors. Each mirror answers the highway query
+of `sumo_handler._download_osm` with a synthetic street grid covering the
+requested bbox, after an optional delay, gzipped when the client accepts it.
+Mirrors can also be slow to stream, fail with an HTTP error, answer HTML or
+drop the connection mid-transfer. Like Overpass, a mirror stops working on a
+query whose client went away; `server.stats` counts requests and such aborts.
+
+    python -m benchmarks.fake_overpass --mirror delay=2 --mirror status=429 --mirror delay=0.1
+    TRANAY_OVERPASS_MIRRORS=<printed urls> tranay_mcp ...
+
+    python -m benchmarks.fake_overpass --bench --grid 400
+"""
+
+import argparse
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import re
+import select
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qs
+
+HIGHWAY_TYPES = ('primary', 'secondary', 'tertiary', 'residential', 'residential', 'service')
+BBOX_PATTERN = re.compile(r'\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)')
+WRITE_CHUNK = 64 * 1024
+
+
+def osm_document(bbox: tuple[float, float, float, float], grid: int) -> bytes:
+    """An OSM street grid of grid×grid nodes, one way per row and per column."""
+    south, west, north, east = bbox
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="fake_overpass">']
+    for i in range(grid):
+        lat = south + (north - south) * i / max(grid - 1, 1)
+        for j in range(grid):
+            lon = west + (east - west) * j / max(grid - 1, 1)
+            lines.append(f'  <node id="{i * grid + j + 1}" lat="{lat:.7f}" lon="{lon:.7f}"/>')
+
+    way_id = 1
+    for axis in ('row', 'col'):
+        for i in range(grid):
+            lines.append(f'  <way id="{way_id}">')
+            for j in range(grid):
+                node = i * grid + j + 1 if axis == 'row' else j * grid + i + 1
+                lines.append(f'    <nd ref="{node}"/>')
+            lines.append(f'    <tag k="highway" v="{HIGHWAY_TYPES[i % len(HIGHWAY_TYPES)]}"/>')
+            lines.append(f'    <tag k="name" v="{axis} {i}"/>')
+            lines.append('  </way>')
+            way_id += 1
+    lines.append('</osm>')
+    return '\n'.join(lines).encode()
+
+
+def make_handler(
+    delay: float, status: int, content_type: str, grid: int, rate: float | None, truncate: int | None,
+):
+    """
+    `delay` seconds pass before the headers, `rate` caps the body transfer in
+    bytes per second to mimic a slow mirror, and `truncate` closes the
+    connection after that many bytes of the body.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle(self):
+            try:
+                super().handle()
+            except ConnectionResetError:
+                # Losing clients of a race drop their kept-alive connection
+                pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            query = parse_qs(self.rfile.read(length).decode()).get('data', [''])[0]
+            with self.server.stats_lock:
+                self.server.stats['requests'] += 1
+            if not self._wait(delay):
+                with self.server.stats_lock:
+                    self.server.stats['aborted'] += 1
+                self.close_connection = True
+                return
+
+            match = BBOX_PATTERN.search(query)
+            if status != 200 or not match:
+                body = b'<html><body>rate_limited</body></html>'
+                self._send(status if status != 200 else 400, 'text/html', body)
+                return
+
+            body = osm_document(tuple(map(float, match.groups())), grid)
+            encoding = None
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body, encoding = gzip.compress(body, compresslevel=1), 'gzip'
+            self._send(200, content_type, body, encoding)
+
+        def _wait(self, seconds: float) -> bool:
+            """Sleep `seconds`; False as soon as the client closes its connection."""
+            deadline = time.monotonic() + seconds
+            while (left := deadline - time.monotonic()) > 0:
+                readable, _, _ = select.select([self.connection], [], [], min(left, 0.05))
+                if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                    return False
+            return True
+
+        def _send(self, code: int, ctype: str, body: bytes, encoding: str | None = None):
+            self.send_response(code)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(body)))
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            try:
+                for start in range(0, len(body), WRITE_CHUNK):
+                    if truncate is not None and start >= truncate:
+                        self.close_connection = True
+                        return
+                    self.wfile.write(body[start:start + WRITE_CHUNK])
+                    if rate:
+                        time.sleep(WRITE_CHUNK / rate)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client lost the race and dropped the response
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(
+    port: int = 0,
+    delay: float = 0.0,
+    status: int = 200,
+    content_type: str = 'application/osm3s+xml',
+    grid: int = 100,
+    rate: float | None = None,
+    truncate: int | None = None,
+) -> ThreadingHTTPServer:
+    """Start a mirror on a background thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', port), make_handler(delay, status, content_type, grid, rate, truncate),
+    )
+    server.daemon_threads = True
+    server.stats = {'requests': 0, 'aborted': 0}
+    server.stats_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='fake-overpass', daemon=True).start()
+    return server
+
+
+def mirror_url(server: ThreadingHTTPServer) -> str:
+    return f'http://127.0.0.1:{server.server_port}/api/interpreter'
+
+
+def parse_mirror(spec: str) -> dict:
+    """'delay=2,status=429' → serve() keyword arguments."""
+    kwargs = {}
+    for item in filter(None, spec.split(',')):
+        key, value = item.split('=', 1)
+        kwargs[key] = value if key == 'content_type' else float(value) if key in ('delay', 'rate') else int(value)
+    return kwargs
+
+
+def bench(grid: int):
+    """Download the same extract from one fast mirror raced against slow and broken ones."""
+    from tranay.tools import sumo_handler
+
+    mirrors = [
+        serve(status=503),
+        serve(delay=3.0, grid=grid),
+        serve(delay=0.2, grid=grid),
+        serve(content_type='text/html', grid=grid),
+    ]
+    urls = [mirror_url(m) for m in mirrors]
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = Path(tmp) / 'extract.osm.xml'
+        for compress in (False, True):
+            start = time.perf_counter()
+            sumo_handler._download_osm('48.70,2.20,48.75,2.30', dest, mirrors=urls, compress=compress)
+            elapsed = time.perf_counter() - start
+            print(f'gzip={compress!s:<5} {elapsed * 1000:8.1f} ms  {dest.stat().st_size / 1e6:8.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mirror', action='append', default=[], metavar='OPTIONS',
+        help='Start a mirror, e.g. "delay=2", "status=429", "rate=1000000", "truncate=65536" or "content_type=text/html". Repeatable.')
+    parser.add_argument('--grid', type=int, default=100, help='Nodes per side of the street grid.')
+    parser.add_argument('--bench', action='store_true',
+        help='Race _download_osm against a fast, a slow and two broken mirrors and report timings.')
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.grid)
+        return
+
+    servers = [serve(grid=args.grid, **parse_mirror(spec)) for spec in args.mirror or ['']]
+    print(f"TRANAY_OVERPASS_MIRRORS={','.join(mirror_url(s) for s in servers)}", file=sys.stderr)
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
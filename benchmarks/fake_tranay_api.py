@@ -0,0 +1,110 @@
+# benchmarks/fake_tranay_api.py
+
+"""
+Local stand-in for the tranay API, serving synthetic projects and sensor data
+in the same shape as the real `/projects` and `/sensors` endpoints.
+
+    python -m benchmarks.fake_tranay_api --port 8765 --sensors 100 --readings 1000
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+from urllib.parse import parse_qs, urlparse
+
+
+PAGE_SIZE = 50
+
+
+def sensors_document(project_id: str, sensors: int, readings: int, seed: int = 0) -> dict:
+    rng = random.Random(f'{seed}-{project_id}')
+    start = datetime(2025, 1, 1)
+    features = []
+    for sensor in range(sensors):
+        data = []
+        for i in range(readings):
+            flow = rng.randint(0, 2000)
+            data.append({
+                'timestamp': (start + timedelta(minutes=5 * i)).isoformat(),
+                'speed': round(rng.uniform(5, 130), 2),
+                'flow': flow,
+                'occupancy': round(rng.uniform(0, 1), 3),
+                'count': flow // 12,
+            })
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [2.3 + sensor * 1e-3, 48.7 + sensor * 1e-3]},
+            'properties': {'id': str(2000 + sensor), 'data': data},
+        })
+    return {'map': {'type': 'FeatureCollection', 'features': features}}
+
+
+def make_handler(projects: int, sensors: int, readings: int):
+    # Sensor documents are built once per project, so requests measure transfer and parsing
+    cache = {}
+    cache_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == '/projects':
+                page = int(params.get('page', 1))
+                size = int(params.get('page_size', PAGE_SIZE))
+                ids = range((page - 1) * size, min(page * size, projects))
+                body = {'projects': [{'id': f'p{i}', 'name': f'Project {i}'} for i in ids]}
+                self._send(json.dumps(body).encode())
+            elif url.path == '/sensors':
+                project_id = params.get('project_id', 'p0')
+                with cache_lock:
+                    if project_id not in cache:
+                        cache[project_id] = json.dumps(
+                            sensors_document(project_id, sensors, readings)
+                        ).encode()
+                self._send(cache[project_id])
+            else:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        def _send(self, body: bytes):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 0, projects: int = 3, sensors: int = 100, readings: int = 100) -> ThreadingHTTPServer:
+    """Start the server on a background thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(projects, sensors, readings))
+    threading.Thread(target=server.serve_forever, name='fake-tranay-api', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--projects', type=int, default=3)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--readings', type=int, default=100)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.projects, args.sensors, args.readings)
+    print(f'Serving a stand-in tranay API on http://127.0.0.1:{server.server_port}')
+    print(f'Add it as a source with tranay-api://http://127.0.0.1:{server.server_port}')
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
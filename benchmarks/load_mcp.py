@@ -0,0 +1,142 @@
+# benchmarks/load_mcp.py
+
+"""
+Load test for tranay_mcp served over HTTP: concurrent MCP clients each open a
+session and call a tool repeatedly; latency percentiles and throughput are
+reported as JSON.
+
+    tranay_mcp --transport http --port 8000 /path/to/data.csv
+    python -m benchmarks.load_mcp --url http://127.0.0.1:8000/mcp --clients 32 --calls 20 \\
+        --tool run_query --args '{"source": "data-csv", "query": "SELECT count(*) FROM CSV"}'
+
+With --spawn the server is started (and stopped) by the script, e.g.
+    python -m benchmarks.load_mcp --spawn "--workers 4 /path/to/data.csv" --clients 64
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import json
+import platform
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+from fastmcp import Client
+
+from benchmarks.bench_tools import git_commit, percentile
+
+
+async def run_client(url: str, tool: str, arguments: dict, calls: int, latencies: list, errors: list):
+    async with Client(url) as client:
+        for _ in range(calls):
+            start = time.perf_counter()
+            try:
+                result = await client.call_tool(tool, arguments, raise_on_error=False)
+                if result.is_error:
+                    errors.append(str(result.content[:1]))
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            latencies.append(time.perf_counter() - start)
+
+
+async def load(url: str, tool: str, arguments: dict, clients: int, calls: int) -> dict:
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_client(url, tool, arguments, calls, latencies, errors) for _ in range(clients)
+    ])
+    elapsed = time.perf_counter() - start
+    return {
+        'tool': tool,
+        'clients': clients,
+        'calls_per_client': calls,
+        'calls': len(latencies),
+        'errors': len(errors),
+        'first_errors': errors[:5],
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def spawn_server(server_args: str, port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, '-c', 'from tranay.mcp import main; main()',
+         '--transport', 'http', '--port', str(port), *shlex.split(server_args)],
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f'Server exited with code {proc.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit('Server did not start listening within 120 s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000/mcp')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32],
+        help='Numbers of concurrent clients to run, one load step each.')
+    parser.add_argument('--calls', type=int, default=20, help='Tool calls per client.')
+    parser.add_argument('--tool', default='list_sources')
+    parser.add_argument('--args', default='{}', help='JSON arguments of the tool call.')
+    parser.add_argument('--spawn', metavar='SERVER_ARGS',
+        help='Start tranay_mcp over HTTP with these extra arguments for the duration of the test.')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.spawn is not None:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        server = spawn_server(args.spawn, port)
+        url = f'http://127.0.0.1:{port}/mcp'
+
+    results = []
+    try:
+        for clients in args.clients:
+            result = asyncio.run(load(url, args.tool, json.loads(args.args), clients, args.calls))
+            results.append(result)
+            print(
+                f"{clients:>5} clients  {result['throughput_rps']:>8.1f} calls/s  "
+                f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+                f"{result['errors']} errors",
+                file=sys.stderr,
+            )
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'url': url,
+            'server_args': args.spawn,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,18 @@ from __future__ import annotations
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import polars as pl
 from attrs import define, field
 
 from sumo_env.models.constants import Tags
 from sumo_env.models.measurement import Measurement
+from sumo_env.outputs.common.dataframe import stream_to_parquet
 from sumo_env.utils.constants import MPS_TO_KPH
 from sumo_env.utils.dataframe import transform_columns
 from sumo_env.utils.datetime import to_naive_tz
-from sumo_env.utils.xml import create_elem, to_attrs
+from sumo_env.utils.xml import create_elem, iterparse_elements, to_attrs
 
 # TODO: move the output par into outputs/induction_loop
 
@@ -63,6 +64,24 @@ def parse_sumo_measurements(
     ]
 
 
+def parse_sumo_measurements_stream(
+    xml_file: Path, ref_datetime: datetime
+) -> Iterator[InductionLoopMeasurement]:
+    for interval in iterparse_elements(str(xml_file), "interval"):
+        yield InductionLoopMeasurement.from_xml(interval, ref_datetime)
+
+
+def measurements_to_parquet(
+    measurements: Iterator[InductionLoopMeasurement],
+    file_path: Path,
+    chunk_size: int = 100000,
+) -> int:
+    """Write a stream of induction loop measurements to Parquet in row groups."""
+    return stream_to_parquet(
+        measurements, lambda m: [m.to_dict()], SCHEMA, file_path, chunk_size
+    )
+
+
 def aggregate_by_edge(measurements_df: pl.DataFrame) -> pl.DataFrame:
     return (
         measurements_df.with_columns(
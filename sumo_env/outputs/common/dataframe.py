@@ -1,6 +1,9 @@
+import os
+from pathlib import Path
 from typing import Any, Callable, Iterator, TypeVar
 
 import polars as pl
+import pyarrow.parquet as pq
 
 T = TypeVar("T")
 
@@ -94,3 +97,50 @@ def stream_to_polars(
     """
     records_iter = map_to_record_chunks(items, map_fn, chunk_size)
     return to_lazy_frame(records_iter, schema)
+
+
+def stream_to_parquet(
+    items: Iterator[T],
+    map_fn: Callable[[T], list[dict[str, Any]]],
+    schema: dict[str, Any],
+    file_path: Path,
+    chunk_size: int = 100000,
+) -> int:
+    """
+    Write a stream of items to a Parquet file, one row group per chunk.
+
+    Unlike `stream_to_polars`, only a single chunk of records is held in
+    memory at any time.
+
+    Args:
+        items: Iterator of objects to transform
+        map_fn: Function to map each item to a list of records
+        schema: Polars schema for the written file
+        file_path: Destination Parquet file
+        chunk_size: Number of records per row group
+
+    Returns:
+        Number of rows written
+    """
+    # The file schema comes from `schema`, not from the first chunk: an optional
+    # attribute absent from every record of a chunk would leave a column out
+    arrow_schema = pl.DataFrame(schema=schema).to_arrow().schema
+    file_path = Path(file_path)
+    # Written aside and renamed, so an interrupted run leaves no truncated file behind
+    tmp_path = file_path.with_name(f".{file_path.name}.part")
+    rows = 0
+    try:
+        with pq.ParquetWriter(str(tmp_path), arrow_schema) as writer:
+            for chunk in map_to_record_chunks(items, map_fn, chunk_size):
+                df = pl.DataFrame(chunk)
+                df = df.with_columns(
+                    pl.lit(None).alias(name) for name in schema if name not in df.columns
+                )
+                df = df.select(list(schema)).cast(schema)  # type: ignore[arg-type]
+                writer.write_table(df.to_arrow().cast(arrow_schema))
+                rows += df.height
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return rows
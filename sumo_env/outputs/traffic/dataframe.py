@@ -1,8 +1,13 @@
+from pathlib import Path
 from typing import Any, Iterator, Optional
 
 import polars as pl
 
-from sumo_env.outputs.common.dataframe import stream_to_polars, to_polars
+from sumo_env.outputs.common.dataframe import (
+    stream_to_parquet,
+    stream_to_polars,
+    to_polars,
+)
 from sumo_env.outputs.traffic.models import Interval, TrafficData
 
 SCHEMA = {
@@ -89,3 +94,22 @@ def intervals_to_polars_lazy(
         Polars LazyFrame with traffic data
     """
     return stream_to_polars(intervals, map_interval_data, SCHEMA, chunk_size)
+
+
+def intervals_to_parquet(
+    intervals: Iterator[Interval], file_path: Path, chunk_size: int = 100000
+) -> int:
+    """
+    Write a stream of traffic intervals to Parquet in row groups.
+
+    Args:
+        intervals: Iterator yielding Interval objects
+        file_path: Destination Parquet file
+        chunk_size: Number of edge/lane records per row group
+
+    Returns:
+        Number of rows written
+    """
+    return stream_to_parquet(
+        intervals, map_interval_data, SCHEMA, file_path, chunk_size
+    )
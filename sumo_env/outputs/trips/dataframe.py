@@ -1,9 +1,10 @@
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
+from pathlib import Path
 from typing import Any
 
 import polars as pl
 
-from sumo_env.outputs.common.dataframe import to_polars
+from sumo_env.outputs.common.dataframe import stream_to_parquet, to_polars
 from sumo_env.outputs.trips.models import TripInfo
 
 SCHEMA = {
@@ -68,3 +69,12 @@ def map_tripinfo_data(tripinfos: TripInfo | Iterable[TripInfo]) -> list[dict[str
 def tripinfos_to_polars(tripinfos: TripInfo | Iterable[TripInfo]) -> pl.DataFrame:
     """Convert tripinfo objects to a Polars DataFrame."""
     return to_polars([tripinfos], map_tripinfo_data, SCHEMA)
+
+
+def tripinfos_to_parquet(
+    tripinfos: Iterator[TripInfo], file_path: Path, chunk_size: int = 100000
+) -> int:
+    """Write a stream of tripinfos to Parquet in row groups of `chunk_size`."""
+    return stream_to_parquet(
+        tripinfos, map_tripinfo_data, SCHEMA, file_path, chunk_size
+    )
@@ -15,7 +15,13 @@ def iterparse_stream(file_path: str) -> Iterator[tuple[str, ET.Element]]:
     """
     context = ET.iterparse(file_path, events=("start", "end"))
     _, root = next(context)
-    yield from context
+    depth = 0
+    for event, elem in context:
+        depth += 1 if event == "start" else -1
+        yield event, elem
+        if event == "end" and depth == 0:
+            # Drop consumed top-level elements so memory stays bounded
+            del root[:]
     root.clear()
 
 
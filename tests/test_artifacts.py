@@ -0,0 +1,81 @@
+# tests/test_artifacts.py
+
+import os
+
+import pytest
+
+from tranay.tools import artifacts
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, 'ARTIFACTS_DIR', tmp_path / 'artifacts')
+    monkeypatch.setattr(artifacts, 'ARTIFACTS_MAX_BYTES', 10**6)
+    return tmp_path
+
+
+def _builder(content: str, calls: list):
+    def build(path):
+        calls.append(path)
+        path.write_text(content)
+    return build
+
+
+def test_miss_then_hit(cache):
+    calls = []
+    key = artifacts.artifact_key('net', osm='abc', options=['--x'])
+    path, hit = artifacts.ensure(key, '.net.xml', _builder('<net/>', calls))
+    assert not hit and len(calls) == 1
+    again, hit = artifacts.ensure(key, '.net.xml', _builder('<other/>', calls))
+    assert hit and again == path and len(calls) == 1
+    assert path.read_text() == '<net/>'
+
+
+def test_inputs_change_the_key():
+    assert artifacts.artifact_key('net', osm='a') != artifacts.artifact_key('net', osm='b')
+    assert artifacts.artifact_key('net', a=1, b=2) == artifacts.artifact_key('net', b=2, a=1)
+
+
+def test_cached_files_are_read_only(cache):
+    path, _ = artifacts.ensure('k-1', '.xml', _builder('x', []))
+    assert os.stat(path).st_mode & artifacts.READ_ONLY_MASK == 0
+
+
+def test_dest_is_hardlinked(cache):
+    dest = cache / 'sim' / 'net.xml'
+    path, _ = artifacts.ensure('k-1', '.xml', _builder('x', []), dest)
+    assert os.path.samefile(path, dest)
+    # Linking a second time over the same inode is a no-op
+    assert artifacts.get_or_build('k-1', dest, _builder('y', []), suffix='.xml')
+    assert os.path.samefile(path, dest)
+
+
+def test_dest_is_copied_across_filesystems(cache, monkeypatch):
+    def cross_device(src, dst):
+        raise OSError(18, 'Invalid cross-device link')
+
+    monkeypatch.setattr(os, 'link', cross_device)
+    dest = cache / 'sim' / 'net.xml'
+    path, _ = artifacts.ensure('k-1', '.xml', _builder('x', []), dest)
+    assert not os.path.samefile(path, dest)
+    assert dest.read_text() == 'x'
+    assert not list(dest.parent.glob('.*.tmp'))
+
+
+def test_eviction_keeps_linked_files(cache, monkeypatch):
+    monkeypatch.setattr(artifacts, 'ARTIFACTS_MAX_BYTES', 150)
+    first = cache / 'sim' / 'first.xml'
+    old, _ = artifacts.ensure('k-1', '.xml', _builder('a' * 100, []), first)
+    os.utime(old, (1, 1))
+    new, _ = artifacts.ensure('k-2', '.xml', _builder('b' * 100, []))
+    assert not old.exists() and new.exists()
+    assert first.read_text() == 'a' * 100
+    assert artifacts.cache_size() == 100
+
+
+def test_eviction_of_a_fresh_artifact_keeps_its_dest(cache, monkeypatch):
+    monkeypatch.setattr(artifacts, 'ARTIFACTS_MAX_BYTES', 10)
+    dest = cache / 'sim' / 'big.xml'
+    path, hit = artifacts.ensure('k-1', '.xml', _builder('c' * 100, []), dest)
+    assert not hit and not path.exists()
+    assert dest.read_text() == 'c' * 100
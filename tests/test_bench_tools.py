@@ -0,0 +1,40 @@
+# tests/test_bench_tools.py
+
+import json
+
+from benchmarks import bench_tools
+
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert bench_tools.percentile(values, 0.5) == 3
+    assert bench_tools.percentile(values, 0.95) == 5
+    assert bench_tools.percentile([7], 0.5) == 7
+
+
+def test_error_answer_fails_the_case():
+    answers = iter(['ok', 'Error: no such table', 'ok'])
+    stats = bench_tools.run_case(lambda **_: next(answers), {}, repeat=2)
+    assert stats['error'] == 'Error: no such table'
+    assert stats['first_ms'] >= 0 and stats['p50_ms'] >= 0
+
+
+def test_successful_case_has_no_error():
+    stats = bench_tools.run_case(lambda n: 'x' * n, {'n': 10}, repeat=3)
+    assert stats['error'] is None
+
+
+def test_compare_skips_failed_cases(tmp_path, capsys):
+    def results(path, ok_ms, error):
+        path.write_text(json.dumps({'results': [
+            {'tool': 'run_query.scan', 'backend': 'duckdb', 'rows': 10, 'p50_ms': ok_ms, 'error': None},
+            {'tool': 'histogram', 'backend': 'duckdb', 'rows': 10, 'p50_ms': 1.0, 'error': error},
+        ]}))
+        return str(path)
+
+    old = results(tmp_path / 'old.json', 10.0, None)
+    new = results(tmp_path / 'new.json', 5.0, 'Error: boom')
+    bench_tools.compare(old, new)
+    lines = capsys.readouterr().out.splitlines()
+    assert any('histogram' in line and 'failed' in line for line in lines)
+    assert any('run_query.scan' in line and '-50.0%' in line for line in lines)
@@ -0,0 +1,78 @@
+# tests/test_compaction.py
+
+import json
+
+from tranay.studio.agent_wrapper import IMAGE_TOKENS, Agent, estimate_tokens
+
+
+def make_agent(**options) -> Agent:
+    return Agent(endpoint='http://127.0.0.1:9', api_key='', model='test', **options)
+
+
+def turn(index: int, output: str, images: int = 0) -> list:
+    content = [{'type': 'text', 'text': json.dumps(output)}]
+    content += [{'type': 'image_url', 'image_url': {'url': f'/blobs/{index}-{i}'}} for i in range(images)]
+    return [
+        {'role': 'user', 'content': f'question {index}'},
+        {'role': 'assistant', 'content': None, 'tool_calls': [
+            {'id': f'call_{index}', 'type': 'function', 'function': {'name': 'run_query', 'arguments': '{}'}},
+        ]},
+        {'role': 'tool', 'tool_call_id': f'call_{index}', 'name': 'run_query', 'content': content},
+        {'role': 'assistant', 'content': f'answer {index}'},
+    ]
+
+
+def history(turns: int, output_size: int = 4000) -> list:
+    return [message for i in range(turns) for message in turn(i, 'x' * output_size)]
+
+
+def size(agent: Agent, messages: list) -> int:
+    return estimate_tokens(agent._system_message) + sum(agent._message_tokens(m) for m in messages)
+
+
+def test_earlier_tool_outputs_are_summarized():
+    agent = make_agent(context_turns=2, context_budget=None)
+    messages = agent._compact_messages(history(5))
+
+    tool_texts = [json.loads(m['content'][0]['text']) for m in messages if m['role'] == 'tool']
+    assert all(text.startswith('[Output of earlier call') for text in tool_texts[:3])
+    assert tool_texts[3:] == ['x' * 4000] * 2
+
+
+def test_cache_is_keyed_by_content_not_by_list():
+    agent = make_agent(context_turns=1, context_budget=None)
+    first = agent._compact_messages(history(4))
+    # Another list with the same turns, as a reloaded chat would be, reuses the compaction
+    second = agent._compact_messages(history(4))
+
+    assert first == second
+    assert len(agent._compacted) == 3
+    # Only compacted turns are kept, never the histories they came from
+    assert all(
+        json.loads(m['content'][0]['text']).startswith('[Output')
+        for compacted, _ in agent._compacted.values() for m in compacted if m['role'] == 'tool'
+    )
+
+
+def test_budget_holds_when_recent_turns_alone_exceed_it():
+    agent = make_agent(context_turns=4, context_budget=3000)
+    messages = agent._compact_messages(history(2, output_size=20000))
+
+    assert size(agent, messages) <= 3000
+    assert [m['role'] for m in messages] == ['user', 'assistant', 'tool', 'assistant'] * 2
+
+
+def test_images_count_for_models_accepting_them():
+    messages = [message for i in range(2) for message in turn(i, 'x' * 8000, images=2)]
+
+    budget = estimate_tokens(make_agent()._system_message) + 5000
+    blind = make_agent(context_turns=4, context_budget=budget)
+    seeing = make_agent(context_turns=4, context_budget=budget, image_input=True)
+    assert seeing._message_tokens(messages[2]) == blind._message_tokens(messages[2]) + 2 * IMAGE_TOKENS
+
+    # 4000 tokens of text fit the budget on their own, not with the 4 images
+    assert blind._compact_messages(messages) == messages
+    compacted = seeing._compact_messages(messages)
+    assert size(seeing, compacted) <= budget
+    # Images are kept; the text around them is what gets cut
+    assert sum(part['type'] == 'image_url' for m in compacted if m['role'] == 'tool' for part in m['content']) == 4
@@ -0,0 +1,31 @@
+# tests/test_demand.py
+
+import pytest
+
+from tranay.tools.sumo_handler import parse_vehicle_classes
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('passenger', {'passenger': 1.0}),
+    ('passenger:0.8,truck:0.2', {'passenger': 0.8, 'truck': 0.2}),
+    ('passenger:0.6, truck, bus', {'passenger': 0.6, 'truck': 0.2, 'bus': 0.2}),
+    ('passenger:3,truck:1', {'passenger': 0.75, 'truck': 0.25}),
+])
+def test_shares(spec, expected):
+    assert parse_vehicle_classes(spec) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('spec, message', [
+    ('', 'No vehicle class'),
+    ('passenger:0,truck:1', 'must be positive'),
+    ('passenger:-0.5,truck:1', 'must be positive'),
+    ('passenger:nan', 'must be positive'),
+    ('passenger:inf', 'must be positive'),
+    ('passenger:lots', 'not a number'),
+    ('passenger:1,truck', 'leaving nothing for truck'),
+    ('passenger:0.7,truck:0.5,bus', 'leaving nothing for bus'),
+    ('passengr:0.9,truck:0.1', "Unknown vehicle class 'passengr'"),
+])
+def test_invalid_specs(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_vehicle_classes(spec)
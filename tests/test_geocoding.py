@@ -0,0 +1,92 @@
+# tests/test_geocoding.py
+
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from tranay.tools import geocoding
+
+
+class StubGeocoder:
+    """Stands in for geopy's Nominatim, answering from a dict of boundingbox lists."""
+
+    def __init__(self, places: dict):
+        self.places = places
+        self.queries = []
+
+    def geocode(self, name, exactly_one=True, addressdetails=False):
+        self.queries.append(name)
+        box = self.places.get(name)
+        return SimpleNamespace(raw={'boundingbox': box}) if box else None
+
+
+@pytest.fixture
+def geocoder(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocoding, 'USER_DATA_DIR', tmp_path)
+    monkeypatch.setattr(geocoding, 'GEOCODE_DB', tmp_path / 'geocode.db')
+    monkeypatch.setattr(geocoding, 'GAZETTEER', None)
+    monkeypatch.setattr(geocoding, '_local', threading.local())
+    # Fast enough for the tests, slow enough to observe the spacing
+    monkeypatch.setattr(geocoding, 'NOMINATIM_RATE', 20.0)
+    stub = StubGeocoder({'Massy': ['48.7184', '48.7432', '2.2268', '2.3142']})
+    monkeypatch.setattr(geocoding, '_geocoder', lambda: stub)
+    geocoding._seed_configured_gazetteer.cache_clear()
+    yield stub
+    geocoding._seed_configured_gazetteer.cache_clear()
+
+
+def test_lookup_is_cached(geocoder):
+    assert geocoding.geocode_bbox('Massy') == '48.7184,2.2268,48.7432,2.3142'
+    assert geocoding.geocode_bbox('  MASSY ') == '48.7184,2.2268,48.7432,2.3142'
+    assert geocoder.queries == ['Massy']
+
+
+def test_not_found_is_cached(geocoder):
+    for _ in range(2):
+        with pytest.raises(ValueError, match='not found'):
+            geocoding.geocode_bbox('Atlantis')
+    assert geocoder.queries == ['Atlantis']
+
+
+def test_expired_entries_are_looked_up_again(geocoder):
+    geocoding.save_bbox('Massy', '0,0,1,1', ttl=-1)
+    assert geocoding.cached_bbox('Massy') == (None, False)
+    assert geocoding.geocode_bbox('Massy') == '48.7184,2.2268,48.7432,2.3142'
+    assert geocoder.queries == ['Massy']
+
+
+def test_gazetteer_answers_offline(geocoder, tmp_path, monkeypatch):
+    gazetteer = tmp_path / 'places.csv'
+    gazetteer.write_text('name,south,west,north,east\n# comment\nLyon,45.7,4.77,45.81,4.9\n')
+    monkeypatch.setattr(geocoding, 'GAZETTEER', str(gazetteer))
+    assert geocoding.geocode_bbox('lyon') == '45.7,4.77,45.81,4.9'
+    assert geocoder.queries == []
+    # Gazetteer entries never expire
+    assert geocoding._connect().execute(
+        "SELECT expires_at, source FROM places WHERE name = 'lyon'"
+    ).fetchone() == (None, 'gazetteer')
+
+
+def test_missing_gazetteer_is_logged_once(geocoder, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(geocoding, 'GAZETTEER', str(tmp_path / 'missing.csv'))
+    with caplog.at_level(logging.ERROR, logger=geocoding.__name__):
+        assert geocoding.geocode_bbox('Massy') == '48.7184,2.2268,48.7432,2.3142'
+        geocoding._local.conn = None
+        geocoding.geocode_bbox('Massy')
+    assert caplog.text.count('Cannot load the gazetteer') == 1
+
+
+def test_rate_limit_slots_are_shared(geocoder):
+    # Each thread has its own connection, as separate processes would
+    start = time.monotonic()
+    threads = [threading.Thread(target=geocoding._acquire_slot, args=('test', 20.0)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    # Four calls at 20 per second: the last one waits for three intervals
+    assert elapsed >= 0.14
@@ -0,0 +1,57 @@
+# tests/test_jobs.py
+
+import sqlite3
+
+import pytest
+
+from tranay.tools import jobs
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'USER_DATA_DIR', tmp_path)
+    monkeypatch.setattr(jobs, 'JOBS_DB', tmp_path / 'jobs.db')
+    monkeypatch.setattr(jobs, '_schema_ready', False)
+    return tmp_path / 'jobs.db'
+
+
+def test_outputs_are_merged(registry):
+    jobs.create_job('j1', 'sim', '/sims/sim.sumocfg')
+    jobs.update_job('j1', state='STARTED', outputs={'tripinfo': '/out/trips.xml'})
+    jobs.update_job('j1', outputs={'edgedata': '/out/edges.xml'})
+
+    job = jobs.get_job('j1')
+    assert job['state'] == 'STARTED'
+    assert job['outputs'] == {'tripinfo': '/out/trips.xml', 'edgedata': '/out/edges.xml'}
+
+
+def test_task_ids_are_kept_apart_from_outputs(registry):
+    jobs.create_job('single', 'sim', '/sims/sim.sumocfg')
+    jobs.create_job('staged', 'sim', '/sims/sim.sumocfg', task_ids=['staged-osm', 'staged-net'])
+
+    assert jobs.get_job('single')['task_ids'] == ['single']
+    staged = jobs.get_job('staged')
+    assert staged['task_ids'] == ['staged-osm', 'staged-net']
+    assert staged['outputs'] == {}
+
+
+def test_worker_reports_before_the_job_is_created(registry):
+    jobs.update_job('early', state='STARTED')
+    jobs.create_job('early', 'sim', '/sims/sim.sumocfg')
+
+    job = jobs.get_job('early')
+    assert (job['state'], job['sim_name']) == ('STARTED', 'sim')
+
+
+def test_registry_without_task_ids_is_migrated(registry):
+    conn = sqlite3.connect(registry)
+    conn.execute(
+        'CREATE TABLE jobs (job_id TEXT PRIMARY KEY, sim_name TEXT, config_path TEXT, state TEXT NOT NULL, '
+        'created_at REAL NOT NULL, started_at REAL, finished_at REAL, outputs TEXT, error TEXT)'
+    )
+    conn.execute("INSERT INTO jobs (job_id, state, created_at) VALUES ('old', 'SUCCESS', 0)")
+    conn.commit()
+    conn.close()
+
+    assert jobs.get_job('old')['task_ids'] == ['old']
+    assert [job['job_id'] for job in jobs.list_jobs(state='success')] == ['old']
@@ -0,0 +1,82 @@
+# tests/test_mcp_async.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import time
+
+import pytest
+
+from tranay.mcp import async_tool
+from tranay.tools import tracing
+
+
+def slow_tool(seconds: float, label: str = 'x') -> str:
+    """Sleeps, then answers."""
+    time.sleep(seconds)
+    return label
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=2)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_wrapper_keeps_the_tool_signature(executor):
+    run = async_tool(slow_tool, executor)
+    assert asyncio.iscoroutinefunction(run)
+    assert run.__name__ == 'slow_tool' and run.__doc__ == slow_tool.__doc__
+    assert list(inspect.signature(run).parameters) == ['seconds', 'label']
+
+
+def test_calls_run_side_by_side(executor):
+    run = async_tool(slow_tool, executor)
+
+    async def main():
+        return await asyncio.gather(run(0.3, 'a'), run(0.3, label='b'))
+
+    start = time.monotonic()
+    assert asyncio.run(main()) == ['a', 'b']
+    assert time.monotonic() - start < 0.55
+
+
+def test_cancelled_call_waiting_for_a_worker_is_dropped(executor):
+    started = []
+
+    def tool(label: str) -> str:
+        started.append(label)
+        time.sleep(0.2)
+        return label
+
+    run = async_tool(tool, executor)
+
+    async def main():
+        busy = [asyncio.ensure_future(run(f'busy{i}')) for i in range(2)]
+        queued = asyncio.ensure_future(run('queued'))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        return await asyncio.gather(*busy)
+
+    assert asyncio.run(main()) == ['busy0', 'busy1']
+    executor.shutdown(wait=True)
+    assert 'queued' not in started
+
+
+def test_calls_are_traced_under_the_request_span(executor, monkeypatch):
+    spans = []
+    monkeypatch.setattr(tracing, '_export', spans.append)
+    run = async_tool(slow_tool, executor)
+
+    async def main():
+        with tracing.span('request') as request:
+            await run(0, 'x')
+        return request
+
+    request = asyncio.run(main())
+    call = next(s for s in spans if s.name == 'tool.call')
+    assert call.attributes['tool'] == 'slow_tool'
+    assert call.parent_id == request.span_id
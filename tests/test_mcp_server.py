@@ -0,0 +1,51 @@
+# tests/test_mcp_server.py
+
+import asyncio
+import json
+import sys
+
+import pytest
+from fastmcp import Client
+
+import tranay.mcp as tranay_mcp
+
+
+@pytest.fixture
+def csv_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(tranay_mcp, 'SOURCES_FILE', str(tmp_path / 'sources.txt'))
+    path = tmp_path / 'counts.csv'
+    path.write_text('sensor_id,flow\ns1,10\ns2,20\n')
+    return str(path)
+
+
+def test_http_app_factory_reads_its_options(csv_source, monkeypatch):
+    monkeypatch.setenv('TRANAY_MCP_OPTIONS', json.dumps({
+        'sources': [csv_source], 'max_workers': 2, 'path': '/tranay',
+    }))
+    app = tranay_mcp.http_app()
+    assert [route.path for route in app.routes] == ['/tranay']
+
+
+def test_several_workers_require_http(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['tranay_mcp', '--transport', 'sse', '--workers', '2'])
+    with pytest.raises(SystemExit, match='requires --transport http'):
+        tranay_mcp.main()
+
+
+def test_tools_are_served_asynchronously(csv_source):
+    server = tranay_mcp.tranayMCP(tranay_mcp.load_sources([csv_source]), max_workers=2)
+
+    async def main():
+        async with Client(server) as client:
+            names = [tool.name for tool in await client.list_tools()]
+            calls = [
+                client.call_tool('run_query', {'source': 'counts-csv', 'query': 'SELECT SUM(flow) AS total FROM CSV'})
+                for _ in range(2)
+            ]
+            return names, await asyncio.gather(*calls)
+
+    names, results = asyncio.run(main())
+    assert 'run_query' in names
+    for result in results:
+        assert not result.is_error
+        assert '30' in result.content[0].text
@@ -0,0 +1,106 @@
+# tests/test_osm_download.py
+
+import time
+from pathlib import Path
+
+import pytest
+
+from benchmarks import fake_overpass
+from tranay.tools import sumo_handler
+
+BBOX = '48.70,2.20,48.71,2.21'
+GRID = 60
+
+
+@pytest.fixture
+def mirrors():
+    """Start fake Overpass mirrors on demand; all are shut down after the test."""
+    servers = []
+
+    def start(**options):
+        server = fake_overpass.serve(grid=GRID, **options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def expected_osm() -> bytes:
+    return fake_overpass.osm_document(tuple(map(float, BBOX.split(','))), GRID)
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def leftovers(directory: Path) -> list[str]:
+    return [p.name for p in directory.iterdir() if p.name.endswith('.part')]
+
+
+def test_fast_mirror_wins_and_slow_one_is_abandoned(mirrors, tmp_path):
+    slow, fast = mirrors(delay=10), mirrors(delay=0.2)
+    dest = tmp_path / 'extract.osm.xml'
+
+    start = time.monotonic()
+    sumo_handler._download_osm(BBOX, dest, mirrors=[fake_overpass.mirror_url(m) for m in (slow, fast)])
+
+    assert time.monotonic() - start < 5
+    assert dest.read_bytes() == expected_osm()
+    # The slow mirror sees its client leave long before it would have answered
+    assert wait_for(lambda: slow.stats['aborted'] == 1)
+
+
+def test_rate_limited_and_html_mirrors_are_skipped(mirrors, tmp_path):
+    limited, html, good = mirrors(status=429), mirrors(content_type='text/html'), mirrors(delay=0.3)
+    dest = tmp_path / 'extract.osm.xml'
+
+    sumo_handler._download_osm(BBOX, dest, mirrors=[fake_overpass.mirror_url(m) for m in (limited, html, good)])
+
+    assert dest.read_bytes() == expected_osm()
+    assert limited.stats['requests'] == html.stats['requests'] == 1
+
+
+def test_mid_transfer_failure_hands_the_race_back(mirrors, tmp_path):
+    broken, backup = mirrors(truncate=fake_overpass.WRITE_CHUNK), mirrors(delay=0.5)
+    dest = tmp_path / 'extract.osm.xml'
+    urls = [fake_overpass.mirror_url(m) for m in (broken, backup)]
+
+    sumo_handler._download_osm(BBOX, dest, mirrors=urls, compress=False)
+
+    assert dest.read_bytes() == expected_osm()
+    # The backup lost the first round to the broken mirror, then won the second one
+    assert backup.stats['requests'] == 2
+    assert leftovers(tmp_path) == []
+
+
+def test_gzip_and_identity_downloads_are_identical(mirrors, tmp_path):
+    url = fake_overpass.mirror_url(mirrors())
+    plain, gzipped = tmp_path / 'plain.osm.xml', tmp_path / 'gzip.osm.xml'
+
+    sumo_handler._download_osm(BBOX, plain, mirrors=[url], compress=False)
+    sumo_handler._download_osm(BBOX, gzipped, mirrors=[url], compress=True)
+
+    assert plain.read_bytes() == gzipped.read_bytes() == expected_osm()
+
+
+def test_total_failure_leaves_dest_untouched(mirrors, tmp_path):
+    urls = [
+        fake_overpass.mirror_url(m)
+        for m in (mirrors(status=503), mirrors(content_type='text/html'), mirrors(truncate=0))
+    ]
+    dest = tmp_path / 'extract.osm.xml'
+    dest.write_text('previous extract')
+
+    with pytest.raises(RuntimeError, match='failed on all 3 mirrors'):
+        sumo_handler._download_osm(BBOX, dest, mirrors=urls, compress=False)
+
+    assert dest.read_text() == 'previous extract'
+    assert leftovers(tmp_path) == []
@@ -0,0 +1,49 @@
+# tests/test_osm_merge.py
+
+import xml.etree.ElementTree as ET
+
+from tranay.tools import sumo_handler
+
+# Way 10 crosses the border of both tiles, so each carries it and its nodes
+WEST = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="48.70" lon="2.20"/>
+  <node id="2" lat="48.70" lon="2.25"><tag k="highway" v="traffic_signals"/></node>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="primary"/></way>
+</osm>
+"""
+EAST = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="48.70" lon="2.20"/>
+  <node id="2" lat="48.70" lon="2.25"><tag k="highway" v="traffic_signals"/></node>
+  <node id="3" lat="48.70" lon="2.30"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="primary"/></way>
+  <way id="11"><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+</osm>
+"""
+
+
+def test_merge_keeps_each_element_once(tmp_path):
+    (tmp_path / 'west.osm.xml').write_text(WEST)
+    (tmp_path / 'east.osm.xml').write_text(EAST)
+    dest = tmp_path / 'merged.osm.xml'
+    sumo_handler._merge_osm([tmp_path / 'west.osm.xml', tmp_path / 'east.osm.xml'], dest)
+
+    root = ET.parse(dest).getroot()
+    assert [(e.tag, e.get('id')) for e in root] == [
+        ('node', '1'), ('node', '2'), ('node', '3'), ('way', '10'), ('way', '11'),
+    ]
+    assert root.find("node[@id='2']/tag").get('v') == 'traffic_signals'
+    assert [nd.get('ref') for nd in root.find("way[@id='10']") if nd.tag == 'nd'] == ['1', '2', '3']
+    assert not (tmp_path / '.merged.osm.xml.part').exists()
+
+
+def test_tiles_cover_the_bbox_on_a_shared_grid():
+    tiles = sumo_handler.bbox_tiles('48.70,2.20,48.75,2.30')
+    assert tiles and len(set(tiles)) == len(tiles)
+    south, west, north, east = map(float, sumo_handler.tile_bbox(min(tiles)).split(','))
+    assert south <= 48.70 and west <= 2.20
+    south, west, north, east = map(float, sumo_handler.tile_bbox(max(tiles)).split(','))
+    assert north >= 48.75 and east >= 2.30
+    # An overlapping bbox reuses the same tiles
+    assert set(sumo_handler.bbox_tiles('48.71,2.21,48.72,2.22')) <= set(tiles)
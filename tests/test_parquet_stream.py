@@ -0,0 +1,42 @@
+# tests/test_parquet_stream.py
+
+import polars as pl
+import pytest
+
+from sumo_env.outputs.common.dataframe import stream_to_parquet
+
+SCHEMA = {"id": pl.Utf8, "speed": pl.Float64, "lane": pl.Utf8}
+
+
+def _records(item):
+    return [item]
+
+
+def test_chunk_without_optional_column(tmp_path):
+    path = tmp_path / "out.parquet"
+    items = iter([{"id": "a", "speed": 1.0, "lane": "l0"}, {"id": "b", "speed": 2.0}])
+    assert stream_to_parquet(items, _records, SCHEMA, path, chunk_size=1) == 2
+    df = pl.read_parquet(path)
+    assert df.schema == pl.Schema(SCHEMA)
+    assert df["lane"].to_list() == ["l0", None]
+    assert not list(tmp_path.glob(".*.part"))
+
+
+def test_empty_stream_writes_schema(tmp_path):
+    path = tmp_path / "out.parquet"
+    assert stream_to_parquet(iter([]), _records, SCHEMA, path) == 0
+    assert pl.read_parquet(path).schema == pl.Schema(SCHEMA)
+
+
+def test_failure_leaves_destination_untouched(tmp_path):
+    path = tmp_path / "out.parquet"
+    path.write_bytes(b"previous")
+
+    def items():
+        yield {"id": "a", "speed": 1.0, "lane": "l0"}
+        raise RuntimeError("simulation output cut short")
+
+    with pytest.raises(RuntimeError):
+        stream_to_parquet(items(), _records, SCHEMA, path, chunk_size=1)
+    assert path.read_bytes() == b"previous"
+    assert list(tmp_path.iterdir()) == [path]
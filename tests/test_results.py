@@ -0,0 +1,29 @@
+# tests/test_results.py
+
+import duckdb
+
+from tranay.tools import sumo_handler
+
+TRIPINFO = """<tripinfos>
+    <tripinfo id="v1" depart="5.00" arrival="50.00" duration="45.00" routeLength="300.00" waitingTime="0.00"
+        timeLoss="3.00" vType="DEFAULT_VEHTYPE" departLane="e1_0" arrivalLane="e1_0" departPos="0" arrivalPos="10"
+        departSpeed="0" arrivalSpeed="10" departDelay="0" waitingCount="0" stopTime="0" speedFactor="1" vaporized=""/>
+</tripinfos>
+"""
+
+
+def test_results_of_a_run_with_quotes_in_its_name(tmp_path):
+    output_dir = tmp_path / "run 'one'"
+    output_dir.mkdir()
+    paths = sumo_handler.simulation_output_paths(str(output_dir), "it's")
+    with open(paths['tripinfo'], 'w') as f:
+        f.write(TRIPINFO)
+
+    db_path, counts = sumo_handler.results_to_duckdb(str(output_dir), "it's")
+
+    assert counts == {'trips': 1, 'edge_data': 0, 'induction_loops': 0}
+    with duckdb.connect(db_path, read_only=True) as conn:
+        assert conn.execute('SELECT id, depart FROM trips').fetchall() == [('v1', 5.0)]
+        indexes = {name for (name,) in conn.execute('SELECT index_name FROM duckdb_indexes()').fetchall()}
+    # Every table is indexed on its time column as well as its ids
+    assert {'trips_depart_idx', 'edge_data_begin_idx', 'induction_loops_timestamp_idx'} <= indexes
@@ -0,0 +1,67 @@
+# tests/test_storage.py
+
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from tranay.studio import storage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    chats_dir = tmp_path / 'chats'
+    chats_dir.mkdir()
+    monkeypatch.setattr(storage, 'CHATS_DIR', chats_dir)
+    monkeypatch.setattr(storage, 'CHATS_DB', tmp_path / 'chats.db')
+    monkeypatch.setattr(storage, '_local', threading.local())
+    return tmp_path
+
+
+def test_json_chats_are_migrated_and_bad_files_skipped(store, caplog):
+    (store / 'chats' / 'good.json').write_text(json.dumps({'messages': [{'role': 'user', 'content': 'hi'}]}))
+    (store / 'chats' / 'corrupt.json').write_text('{"messages": [')
+    (store / 'chats' / 'shapeless.json').write_text('[1, 2]')
+
+    assert storage.list_chats() == ['good']
+    assert storage.load_chat('good')['messages'] == [{'role': 'user', 'content': 'hi'}]
+    assert {r.getMessage().split()[2] for r in caplog.records} == {'corrupt.json', 'shapeless.json'}
+
+
+def test_expired_responses_are_deleted_on_save(store, monkeypatch):
+    storage.save_response('old', {'content': 'old'}, ttl=60)
+    now = time.time()
+    monkeypatch.setattr(storage.time, 'time', lambda: now + 120)
+    storage.save_response('new', {'content': 'new'}, ttl=60)
+
+    assert storage.load_response('new', ttl=60) == {'content': 'new'}
+    keys = [key for (key,) in storage._connect().execute('SELECT key FROM responses')]
+    assert keys == ['new']
+
+
+def test_rendered_cache_keeps_the_most_recently_shown(store):
+    storage.save_rendered({'a': {'html': 'a'}, 'b': {'html': 'b'}}, max_rows=2)
+    time.sleep(0.01)
+    # Showing 'a' again makes 'b' the least recently used
+    assert storage.load_rendered(['a']) == {'a': {'html': 'a'}}
+    time.sleep(0.01)
+    storage.save_rendered({'c': {'html': 'c'}}, max_rows=2)
+
+    assert set(storage.load_rendered(['a', 'b', 'c'])) == {'a', 'c'}
+
+
+def test_rendered_table_of_an_older_store_is_migrated(store):
+    conn = sqlite3.connect(store / 'chats.db')
+    conn.executescript(
+        'CREATE TABLE rendered (key TEXT PRIMARY KEY, fields TEXT NOT NULL);'
+        'PRAGMA user_version = 1;'
+    )
+    conn.execute('INSERT INTO rendered VALUES (?, ?)', ('old', json.dumps({'html': 'old'})))
+    conn.commit()
+    conn.close()
+
+    assert storage.load_rendered(['old']) == {'old': {'html': 'old'}}
+    storage.save_rendered({'new': {'html': 'new'}}, max_rows=1)
+    assert set(storage.load_rendered(['old', 'new'])) == {'new'}
@@ -0,0 +1,97 @@
+# tests/test_tool_calls.py
+
+import json
+import threading
+import time
+
+from tranay.studio.agent_wrapper import Agent
+
+
+def make_agent(tools, **options) -> Agent:
+    return Agent(endpoint='http://127.0.0.1:9', api_key='', model='test', tools=tools, **options)
+
+
+def call(name: str, index: int, **args) -> dict:
+    return {'id': f'call_{index}', 'function': {'name': name, 'arguments': json.dumps(args)}}
+
+
+def texts(messages) -> list:
+    return [json.loads(m['content'][0]['text']) for m in messages]
+
+
+def test_results_come_back_in_call_order():
+    def wait(seconds: float) -> str:
+        """Sleep, then return how long."""
+        time.sleep(seconds)
+        return f'slept {seconds}'
+
+    agent = make_agent([wait], max_parallel_tools=3)
+    start = time.monotonic()
+    messages = list(agent._iter_tool_calls([call('wait', i, seconds=s) for i, s in enumerate([0.3, 0.1, 0.2])]))
+
+    assert texts(messages) == ['slept 0.3', 'slept 0.1', 'slept 0.2']
+    assert [m['tool_call_id'] for m in messages] == ['call_0', 'call_1', 'call_2']
+    assert time.monotonic() - start < 0.6
+
+
+def test_parallelism_is_capped_per_turn():
+    lock = threading.Lock()
+    active = {'now': 0, 'peak': 0}
+
+    def busy() -> str:
+        """Hold a slot for a moment."""
+        with lock:
+            active['now'] += 1
+            active['peak'] = max(active['peak'], active['now'])
+        time.sleep(0.1)
+        with lock:
+            active['now'] -= 1
+        return 'ok'
+
+    agent = make_agent([busy], max_parallel_tools=2)
+    turns = [
+        threading.Thread(target=lambda: list(agent._iter_tool_calls([call('busy', i) for i in range(4)])))
+        for _ in range(2)
+    ]
+    for turn in turns:
+        turn.start()
+    for turn in turns:
+        turn.join()
+
+    # Two turns of the shared agent, each with its own two slots
+    assert active['peak'] == 4
+
+
+def test_timeout_counts_from_start_and_frees_the_slot():
+    release = threading.Event()
+
+    def hang() -> str:
+        """Never returns in time."""
+        release.wait(10)
+        return 'late'
+
+    def quick() -> str:
+        """Returns at once."""
+        return 'quick'
+
+    agent = make_agent([hang, quick], max_parallel_tools=1, tool_timeout=0.3)
+    try:
+        messages = list(agent._iter_tool_calls([call('hang', 0), call('quick', 1), call('hang', 2)]))
+    finally:
+        release.set()
+
+    # The quick call waited behind the hung one without being charged for it
+    assert texts(messages) == [
+        "Error: Tool 'hang' timed out after 0.3s.",
+        'quick',
+        "Error: Tool 'hang' timed out after 0.3s.",
+    ]
+
+
+def test_tool_errors_become_messages():
+    def broken() -> str:
+        """Always fails."""
+        raise ValueError('boom')
+
+    agent = make_agent([broken])
+    assert texts(agent._iter_tool_calls([call('broken', 0)])) == ["Error running tool 'broken': boom"]
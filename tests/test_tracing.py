@@ -0,0 +1,32 @@
+# tests/test_tracing.py
+
+import logging
+import queue
+import time
+
+from tranay.tools import tracing
+
+
+def _finished_span():
+    span = tracing.Span('test', {}, None)
+    span.duration = 0.01
+    return span
+
+
+def test_failed_export_is_logged(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(tmp_path / 'missing' / 'traces.jsonl'))
+    monkeypatch.setattr(tracing, 'OTLP_ENDPOINT', None)
+    with caplog.at_level(logging.WARNING, logger=tracing.__name__):
+        tracing._write([_finished_span()])
+    assert 'Trace export of 1 spans failed' in caplog.text
+
+
+def test_final_flush_gives_up_after_timeout(monkeypatch, caplog):
+    stuck = queue.Queue()
+    stuck.put(_finished_span())  # no worker ever takes it
+    monkeypatch.setattr(tracing, '_export_queue', stuck)
+    start = time.monotonic()
+    with caplog.at_level(logging.WARNING, logger=tracing.__name__):
+        tracing._flush(timeout=0.2)
+    assert time.monotonic() - start < 1
+    assert 'dropping 1 unsent spans' in caplog.text
@@ -1,111 +1,197 @@
 import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+from importlib import resources
+import json
 import os
 import platformdirs
-import pkg_resources
 import sys
 
 from fastmcp import FastMCP
 
-from tranay.tools import tranayTools
+from tranay.tools import tracing, tranayTools
 
 # Basic Setup
 USER_DATA_DIR = platformdirs.user_data_dir('tranay', 'tranay')
 SOURCES_FILE = os.path.join(USER_DATA_DIR, 'sources.txt')
 
-# Parse command line args
-parser = argparse.ArgumentParser(
-    description="tranay MCP: A read-only BI tool for analyzing various data sources"
-)
-parser.add_argument('sources', nargs=argparse.REMAINDER, default=[], 
-    help='Data source (can be specified multiple times). Can be a MongoDB, SQLite, MySQL, PostgreSQL connection string, or a path to CSV, Parquet, or DuckDB file.'
-)
-args = parser.parse_args()
-
-source_list = []
-if os.path.exists(SOURCES_FILE):
-    with open(SOURCES_FILE) as f:
-        source_list = [line.strip('\n') for line in f.readlines() if line.strip('\n')]
-
-if not source_list:
-    source_list = args.sources
-
-if not source_list:
-    source_list = [
-        pkg_resources.resource_filename(
-            'tranay',
-            os.path.join('mcp', 'example_data', 'all_pokemon_data.csv')
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="tranay MCP: A read-only BI tool for analyzing various data sources"
+    )
+    parser.add_argument('--max-workers', type=int, default=8,
+        help='Number of tool calls run at the same time; further calls wait for a free worker.'
+    )
+    parser.add_argument('--transport', choices=['stdio', 'http', 'sse'], default='stdio',
+        help='stdio (default) serves one client per process; http (streamable HTTP) and sse run a long-lived server shared by many clients.'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on with --transport http/sse.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on with --transport http/sse.')
+    parser.add_argument('--path', default=None, help='URL path of the MCP endpoint (default /mcp, or /sse for sse).')
+    parser.add_argument('--workers', type=int, default=1,
+        help='Server processes for --transport http. More than one serves stateless HTTP, each process with its own pools and caches.'
+    )
+    parser.add_argument('sources', nargs=argparse.REMAINDER, default=[], 
+        help='Data source (can be specified multiple times). Can be a MongoDB, SQLite, MySQL, PostgreSQL connection string, or a path to CSV, Parquet, or DuckDB file.'
+    )
+    return parser
+
+
+def parse_sources(argv: list[str] | None = None) -> dict:
+    """
+    Build the data sources from the sources file, or else from the command line.
+    Done when the server starts rather than on import, so importing the package
+    (e.g. by tools or tests) neither reads argv nor prints anything.
+    """
+    return load_sources(build_parser().parse_args(argv).sources)
+
+
+def load_sources(cli_sources: list[str]) -> dict:
+    source_list = []
+    if os.path.exists(SOURCES_FILE):
+        with open(SOURCES_FILE) as f:
+            source_list = [line.strip('\n') for line in f.readlines() if line.strip('\n')]
+
+    if not source_list:
+        source_list = cli_sources
+
+    if not source_list:
+        source_list = [
+            str(resources.files('tranay.tools').joinpath('example_data', 'all_pokemon_data.csv'))
+        ]
+        # stdout carries the MCP stdio protocol, so messages go to stderr
+        print("No data sources provided. Loading example dataset for demonstration.", file=sys.stderr)
+        print(f"\nTo load your datasets, add them to {SOURCES_FILE} (one source URL or full file path per line)", file=sys.stderr)
+        print("\nOr use command line args to specify data sources:", file=sys.stderr)
+        print("tranay_mcp mongodb://localhost/mydb sqlite:///path/to/mydata.db /path/to/my_file.csv", file=sys.stderr)
+        print(f"\nNOTE: Sources in command line args will be ignored if sources are found in {SOURCES_FILE}", file=sys.stderr)
+
+    sources = {}
+    for s in source_list:
+        source = s.lower()
+        if source.startswith('sqlite://'):
+            source_type = 'sqlite'
+            source_name = source.split('/')[-1].split('?')[0].split('.db')[0]
+        elif source.startswith('postgresql://'):
+            source_type = 'postgresql'
+            source_name = source.split('/')[-1].split('?')[0]
+        elif source.startswith("mysql://") or source.startswith("mysql+pymysql://"):
+            source_type = 'mysql'
+            s = s.replace('mysql://', 'mysql+pymysql://')
+            source_name = source.split('/')[-1].split('?')[0]
+        elif source.startswith('mongodb://') or source.startswith('mongodb+srv://'):
+            source_type = 'mongodb'
+            source_name = source.split('/')[-1].split('?')[0]
+            if not source_name: 
+                source_name = 'mongodb_db'
+        elif source.startswith('tranay-api://'):
+            source_type = 'tranay_api'
+            source_name = source.split('://')[1]
+
+
+        elif source.startswith('clickhouse://'):
+            source_type = 'clickhouse'
+            source_name = source.split('/')[-1].split('?')[0]
+        elif source.endswith(".duckdb"):
+            source_type = "duckdb"
+            source_name = source.split('/')[-1].split('.')[0]
+        elif source.endswith(".csv"):
+            source_type = "csv"
+            source_name = source.split('/')[-1].split('.')[0]
+        elif source.endswith(".parquet") or source.endswith(".pq"):
+            source_type = "parquet"
+            source_name = source.split('/')[-1].split('.')[0]
+        else:
+            continue
+
+        source_id = f'{source_name}-{source_type}'
+        if source_id in sources:
+            i = 2
+            while True:
+                source_id = f'{source_name}{i}-{source_type}'
+                if source_id not in sources:
+                    break
+                i += 1
+
+        sources[source_id] = {'url': s, 'source_type': source_type}
+
+    return sources
+
+
+def async_tool(tool, executor: ThreadPoolExecutor):
+    """
+    Wrap a blocking tool so the server runs it on `executor` and keeps serving
+    other requests meanwhile. If the client cancels the request, a call still
+    waiting for a worker is dropped; one already running finishes in the
+    background and its result is discarded.
+    """
+    @functools.wraps(tool)
+    async def run(*args, **kwargs):
+        # Run in a copy of the request context so tracing spans nest under it
+        call = functools.partial(
+            contextvars.copy_context().run, traced_call, tool, args, kwargs,
         )
-    ]
-    print("No data sources provided. Loading example dataset for demonstration.")
-    print(f"\nTo load your datasets, add them to {SOURCES_FILE} (one source URL or full file path per line)")
-    print("\nOr use command line args to specify data sources:")
-    print("tranay_mcp mongodb://localhost/mydb sqlite:///path/to/mydata.db /path/to/my_file.csv")
-    print(f"\nNOTE: Sources in command line args will be ignored if sources are found in {SOURCES_FILE}")
-
-    
-SOURCES = {}
-for s in source_list:
-    source = s.lower()
-    if source.startswith('sqlite://'):
-        source_type = 'sqlite'
-        source_name = source.split('/')[-1].split('?')[0].split('.db')[0]
-    elif source.startswith('postgresql://'):
-        source_type = 'postgresql'
-        source_name = source.split('/')[-1].split('?')[0]
-    elif source.startswith("mysql://") or source.startswith("mysql+pymysql://"):
-        source_type = 'mysql'
-        s = s.replace('mysql://', 'mysql+pymysql://')
-        source_name = source.split('/')[-1].split('?')[0]
-    elif source.startswith('mongodb://') or source.startswith('mongodb+srv://'):
-        source_type = 'mongodb'
-        source_name = source.split('/')[-1].split('?')[0]
-        if not source_name: 
-            source_name = 'mongodb_db'
-    elif source.startswith('tranay-api://'):
-        source_type = 'tranay_api'
-        source_name = source.split('://')[1]
-
-
-    elif source.startswith('clickhouse://'):
-        source_type = 'clickhouse'
-        source_name = source.split('/')[-1].split('?')[0]
-    elif source.endswith(".duckdb"):
-        source_type = "duckdb"
-        source_name = source.split('/')[-1].split('.')[0]
-    elif source.endswith(".csv"):
-        source_type = "csv"
-        source_name = source.split('/')[-1].split('.')[0]
-    elif source.endswith(".parquet") or source.endswith(".pq"):
-        source_type = "parquet"
-        source_name = source.split('/')[-1].split('.')[0]
-    else:
-        continue
+        future = executor.submit(call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
 
-    source_id = f'{source_name}-{source_type}'
-    if source_id in SOURCES:
-        i = 2
-        while True:
-            source_id = f'{source_name}{i}-{source_type}'
-            if source_id not in SOURCES:
-                break
-            i += 1
+    return run
 
-    SOURCES[source_id] = {'url': s, 'source_type': source_type}
 
+def traced_call(tool, args, kwargs):
+    with tracing.span('tool.call', tool=tool.__name__) as span:
+        result = tool(*args, **kwargs)
+        span.set(**tracing.payload_size(result))
+        return result
 
-def tranayMCP(sources):
+
+def tranayMCP(sources, max_workers: int = 8):
     tranay_tools = tranayTools(sources)
     tranay_mcp = FastMCP()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tranay-mcp-tool')
     for tool in tranay_tools.tools:
-        tranay_mcp.add_tool(tool)
+        tranay_mcp.add_tool(async_tool(tool, executor))
 
     return tranay_mcp
 
 
+def http_app():
+    """
+    ASGI app factory for the worker processes started by `main` with --workers > 1.
+    Options reach the workers through TRANAY_MCP_OPTIONS.
+    """
+    options = json.loads(os.environ['TRANAY_MCP_OPTIONS'])
+    server = tranayMCP(load_sources(options['sources']), max_workers=options['max_workers'])
+    # Successive requests of a client may reach different processes, so no session state is kept
+    return server.http_app(path=options['path'], transport='http', stateless_http=True)
+
+
 def main():
-    # print("Final SOURCES dictionary passed to tranayMCP:")
-    # print(SOURCES)
-    tranayMCP(SOURCES).run()
+    args = build_parser().parse_args()
+
+    if args.transport == 'stdio':
+        tranayMCP(load_sources(args.sources), max_workers=args.max_workers).run()
+    elif args.workers > 1:
+        if args.transport != 'http':
+            sys.exit('--workers > 1 requires --transport http, as SSE sessions are bound to one process')
+        import uvicorn
+
+        os.environ['TRANAY_MCP_OPTIONS'] = json.dumps({
+            'sources': args.sources,
+            'max_workers': args.max_workers,
+            'path': args.path,
+        })
+        uvicorn.run('tranay.mcp:http_app', factory=True, host=args.host, port=args.port, workers=args.workers)
+    else:
+        tranayMCP(load_sources(args.sources), max_workers=args.max_workers).run(
+            transport=args.transport, host=args.host, port=args.port, path=args.path,
+        )
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,127 @@
 import asyncio
+from base64 import b64decode
+from collections import OrderedDict
+import contextvars
+import hashlib
 import json
+import queue
+import random
+import threading
+import time
 
 from function_schema import get_function_schema
 import httpx
 from mcp.types import ImageContent
 
+from tranay.tools import tracing
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_MAX_DELAY = 30.0  # seconds; also caps the Retry-After of a provider
+# Rough size of a token for the context budget; close enough for English, JSON and markdown
+CHARS_PER_TOKEN = 4
+# Number of compacted turns kept by an agent, shared by all its chats
+COMPACTION_CACHE_SIZE = 256
+# Tokens an image sent to a model accepting images takes, about one 1024×1024 tile
+IMAGE_TOKENS = 1000
+# Tokens a recent tool output keeps at least when truncated to fit the context budget
+MIN_TOOL_TOKENS = 500
+
+
+def estimate_tokens(message) -> int:
+    """Fast estimate of the tokens a message takes in the context window."""
+    return len(json.dumps(message)) // CHARS_PER_TOKEN + 4
+
+
+def split_turns(messages) -> list[list]:
+    """Split a history into turns, each starting at a user message."""
+    turns = []
+    for message in messages:
+        if message['role'] == 'user' or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def summarize_tool_message(message) -> dict:
+    """Replace the output of an earlier tool call with a short reference to it."""
+    content = message['content']
+    if type(content) is list:
+        texts = [json.loads(part['text']) for part in content if part['type'] == 'text']
+        images = sum(part['type'] == 'image_url' for part in content)
+    else:
+        texts, images = [content], 0
+
+    text = '\n'.join(str(t) for t in texts)
+    lines = text.splitlines()
+    summary = f"[Output of earlier call {message['tool_call_id']} omitted to save context"
+    if images:
+        summary += f"; it showed {images} image(s) to the user"
+    if lines:
+        summary += f"; {len(lines)} line(s) starting with: {lines[0][:200]}"
+    summary += '. Call the tool again if its result is needed.]'
+    return {
+        'role': 'tool',
+        'tool_call_id': message['tool_call_id'],
+        'name': message['name'],
+        'content': [{'type': 'text', 'text': json.dumps(summary)}],
+    }
+
+
+def truncate_tool_message(message, max_tokens: int) -> dict:
+    """Cut the text output of a tool call down to about `max_tokens` tokens."""
+    content = message['content']
+    parts = content if type(content) is list else [{'type': 'text', 'text': json.dumps(content)}]
+    texts = [str(json.loads(part['text'])) for part in parts if part['type'] == 'text']
+    total = sum(len(t) for t in texts)
+    chars = max(max_tokens * CHARS_PER_TOKEN - 200, 0)
+    if total <= chars:
+        return message
+
+    new_content, left, truncated = [], chars, False
+    for part in parts:
+        # Images are kept: they are counted apart and cannot be cut
+        if part['type'] != 'text':
+            new_content.append(part)
+            continue
+        if truncated:
+            continue
+        text = str(json.loads(part['text']))
+        if left < len(text):
+            text = text[:left] + f"\n[Output truncated to fit the context: {chars} of {total} characters shown.]"
+            truncated = True
+        else:
+            left -= len(text)
+        new_content.append({'type': 'text', 'text': json.dumps(text)})
+    if type(content) is not list:
+        new_content = json.loads(new_content[0]['text'])
+    return {
+        'role': 'tool',
+        'tool_call_id': message['tool_call_id'],
+        'name': message['name'],
+        'content': new_content,
+    }
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def agent_loop() -> asyncio.AbstractEventLoop:
+    """
+    The event loop shared by every agent. Running all LLM round trips on one
+    long-lived loop lets them reuse the pooled HTTP client across requests.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target = _loop.run_forever,
+                name = 'tranay-agent-loop',
+                daemon = True,
+            ).start()
+        return _loop
+
 
 class Agent:
 
@@ -14,12 +131,51 @@ class Agent:
         model: str,
         tools: list = [],
         image_input: bool = False,
+        max_parallel_tools: int = 4,
+        tool_timeout: float = 120.0,
+        max_connections: int = 20,
+        max_retries: int = 3,
+        http2: bool = True,
+        save_image = None,
+        load_image = None,
+        context_turns: int = 4,
+        context_budget: int | None = 32000,
+        prompt_cache: bool = False,
+        load_response = None,
+        save_response = None,
     ):
     
         self._post_url = f'{endpoint}/chat/completions'
         self._api_key = api_key
         self._model = model
         self._image_input = image_input
+        # Optional image store: save_image(png_bytes) -> url, load_image(url) -> data url
+        self._save_image = save_image
+        self._load_image = load_image or (lambda url: url)
+        self._tool_timeout = tool_timeout
+        # The last `context_turns` turns are sent verbatim, older tool outputs are
+        # summarized and the oldest turns dropped to stay within `context_budget` tokens
+        self._context_turns = context_turns
+        self._context_budget = context_budget
+        self._compacted = OrderedDict()
+        self._compacted_lock = threading.Lock()
+        # Mark the static prefix (system prompt) for providers that cache prompts
+        self._prompt_cache = prompt_cache
+        # Optional response cache: load_response(key) -> reply or None, save_response(key, reply)
+        self._load_response = load_response
+        self._save_response = save_response
+        self._max_retries = max_retries
+        self._client_options = {
+            'http2': http2,
+            'limits': httpx.Limits(
+                max_connections = max_connections,
+                max_keepalive_connections = max_connections,
+            ),
+            'timeout': httpx.Timeout(240.0, connect=10.0),
+        }
+        self._client = None
+        # Tool calls of one assistant message are independent, so they run side by side
+        self._max_parallel_tools = max(1, max_parallel_tools)
         self._system_message = {
             'role': 'system',
                 'content': """You are an expert data analysis assistant. Your goal is to help users understand their data by using the tools provided.
@@ -102,24 +258,125 @@ class Agent:
             })
             self._tool_map[tool_schema['name']] = tool
 
+        if self._prompt_cache:
+            self._system_message = {
+                'role': 'system',
+                'content': [{
+                    'type': 'text',
+                    'text': self._system_message['content'],
+                    'cache_control': {'type': 'ephemeral'},
+                }],
+            }
+        self._tools_hash = hashlib.sha256(
+            json.dumps(self._tools, sort_keys=True).encode()
+        ).hexdigest()
+
+
+    def _compact_prefix(self, messages, boundary: int) -> list:
+        """
+        Compacted turns of `messages[:boundary]` with their token estimates. An
+        earlier turn never changes, so its compaction is cached under a hash of
+        its content and reused for the later round trips and questions of a chat.
+        """
+        turns = []
+        for turn in split_turns(messages[:boundary]):
+            key = hashlib.sha256(json.dumps(turn, sort_keys=True).encode()).digest()
+            with self._compacted_lock:
+                cached = self._compacted.get(key)
+                if cached is not None:
+                    self._compacted.move_to_end(key)
+            if cached is None:
+                compacted = [
+                    summarize_tool_message(message) if message['role'] == 'tool' else message
+                    for message in turn
+                ]
+                cached = (compacted, sum(self._message_tokens(message) for message in compacted))
+                with self._compacted_lock:
+                    self._compacted[key] = cached
+                    while len(self._compacted) > COMPACTION_CACHE_SIZE:
+                        self._compacted.popitem(last=False)
+            turns.append(cached)
+        return turns
+
+
+    def _message_tokens(self, message) -> int:
+        """Token estimate of a message, with the images it inlines for models accepting them."""
+        tokens = estimate_tokens(message)
+        if self._image_input and message['role'] == 'tool' and type(message['content']) is list:
+            tokens += IMAGE_TOKENS * sum(part['type'] == 'image_url' for part in message['content'])
+        return tokens
+
+
+    def _compact_messages(self, messages) -> list:
+        """
+        Messages to send for a history, compacted to fit the context budget:
+        outputs of earlier tool calls are summarized, the oldest turns dropped,
+        then the largest recent tool outputs truncated.
+        """
+        turns = split_turns(messages)
+        if len(turns) <= self._context_turns:
+            recent, prefix = messages, []
+        else:
+            recent = turns[-self._context_turns:] if self._context_turns > 0 else turns[-1:]
+            recent = [message for turn in recent for message in turn]
+            prefix = self._compact_prefix(messages, len(messages) - len(recent))
+
+        if self._context_budget is not None:
+            sizes = [self._message_tokens(m) for m in recent]
+            used = estimate_tokens(self._system_message) + sum(sizes)
+            used += sum(tokens for _, tokens in prefix)
+            first = 0
+            while first < len(prefix) and used > self._context_budget:
+                used -= prefix[first][1]
+                first += 1
+            prefix = prefix[first:]
+
+            if used > self._context_budget:
+                recent = list(recent)
+                tools = sorted(
+                    (i for i, m in enumerate(recent) if m['role'] == 'tool'),
+                    key=lambda i: sizes[i], reverse=True,
+                )
+                for i in tools:
+                    if used <= self._context_budget:
+                        break
+                    target = max(sizes[i] - (used - self._context_budget), MIN_TOOL_TOKENS)
+                    # What is left once all the text is cut, images included, is not negotiable
+                    fixed = self._message_tokens(truncate_tool_message(recent[i], 0))
+                    recent[i] = truncate_tool_message(recent[i], target - fixed)
+                    used -= sizes[i] - self._message_tokens(recent[i])
+
+        return [message for turn, _ in prefix for message in turn] + recent
+
 
     def _prepare_input_messages(self, messages):
         input_messages = [self._system_message]
+        messages = self._compact_messages(messages)
+        # Tool messages cannot carry images, so models accepting images get them
+        # in a user message once the run of tool results is over
+        pending_images = []
         for message in messages:
+            if pending_images and message['role']!='tool':
+                input_messages.append({'role': 'user', 'content': pending_images})
+                pending_images = []
+
             if message['role']!='tool':
                 input_messages.append(message)
             elif type(message['content']) is not list:
                 input_messages.append(message)
             else:
                 new_content = []
-                image_content = None
                 for content in message['content']:
                     if content['type']=='image_url':
-                        image_content = content
                         new_content.append({
                             'type': 'text',
                             'text': 'Tool call returned an image to the user.',
                         })
+                        if self._image_input:
+                            pending_images.append({
+                                'type': 'image_url',
+                                'image_url': {'url': self._load_image(content['image_url']['url'])},
+                            })
                     else:
                         new_content.append(content)
                 input_messages.append({
@@ -129,73 +386,310 @@ class Agent:
                     'content': new_content,
                 })
 
+        if pending_images:
+            input_messages.append({'role': 'user', 'content': pending_images})
+
         return input_messages                
         
     
-    def run(self, messages):
-        if type(messages) is str:
-            messages = [{'role': 'user', 'content': messages}]
-    
-        while True:
-            # Conditionally create the headers
+    def _call_tool(self, tool_call):
+        tool_name = tool_call['function']['name']
+        tool_args = json.loads(tool_call['function']['arguments'])
+        
+        # Check if tool exists before calling
+        if tool_name in self._tool_map:
+            with tracing.span('tool.call', tool=tool_name) as span:
+                result = self._tool_map[tool_name](**tool_args)
+                span.set(**tracing.payload_size(result))
+                return result
+        else:
+            return f"Error: Tool '{tool_name}' not found. Available tools: {list(self._tool_map.keys())}"
+
+
+    def _iter_tool_calls(self, tool_calls):
+        """
+        Run the tool calls of one assistant message concurrently, at most
+        `max_parallel_tools` of this message at a time, and yield the tool messages
+        in call order. A call still running `tool_timeout` seconds after it started
+        is reported as timed out and its slot goes to the next call.
+        Each call runs on a thread of its own: the agent is shared by all chats,
+        and a hung tool must not hold a thread that other turns wait for.
+        """
+        done = queue.Queue()
+
+        def run(index: int, tool_call):
+            try:
+                done.put((index, self._call_tool(tool_call)))
+            except Exception as e:
+                tool_name = tool_call['function']['name']
+                done.put((index, f"Error running tool '{tool_name}': {e}"))
+
+        responses = {}
+        running = {}  # index of the call → time it started
+        next_start = next_yield = 0
+        while next_yield < len(tool_calls):
+            while next_start < len(tool_calls) and len(running) < self._max_parallel_tools:
+                # Each call runs in a copy of the caller's context, so its span has the right parent
+                threading.Thread(
+                    target = contextvars.copy_context().run,
+                    args = (run, next_start, tool_calls[next_start]),
+                    name = 'tranay-tool',
+                    daemon = True,
+                ).start()
+                running[next_start] = time.monotonic()
+                next_start += 1
+
+            if next_yield in responses:
+                yield self._tool_message(tool_calls[next_yield], responses.pop(next_yield))
+                next_yield += 1
+                continue
+
+            deadline = min(running.values()) + self._tool_timeout
+            try:
+                index, response = done.get(timeout=max(deadline - time.monotonic(), 0))
+                # Calls reported as timed out may still finish; their result is dropped
+                if running.pop(index, None) is not None:
+                    responses[index] = response
+            except queue.Empty:
+                now = time.monotonic()
+                for index, started in list(running.items()):
+                    if now - started >= self._tool_timeout:
+                        del running[index]
+                        tool_name = tool_calls[index]['function']['name']
+                        responses[index] = f"Error: Tool '{tool_name}' timed out after {self._tool_timeout:g}s."
+
+
+    def _tool_message(self, tool_call, tool_response) -> dict:
+        tool_name = tool_call['function']['name']
+        if type(tool_response) is ImageContent:
+            b64_data = tool_response.data
+            if self._save_image:
+                url = self._save_image(b64decode(b64_data))
+            else:
+                url = f'data:image/png;base64,{b64_data}'
+            content = [{
+                'type': 'image_url',
+                'image_url': {
+                    "url": url,
+                }                            
+            }]
+        else:
+            content = [{
+                'type': 'text',
+                'text': json.dumps(tool_response)
+            }]
+            
+        return {
+            'role': 'tool',
+            'tool_call_id': tool_call['id'],
+            'name': tool_name,
+            'content': content
+        }
+
+
+    def close(self):
+        """Release the HTTP connection pool of an agent no longer in use."""
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), agent_loop())
+
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the agent loop
+        if self._client is None:
             headers = {}
             if self._api_key:
                 headers['Authorization'] = f'Bearer {self._api_key}'
-            
-            # Make the request using the new headers variable
-            res = httpx.post(
-                url = self._post_url,
-                headers = headers,
-                timeout = 240.0,
-                json = {
-                    'model': self._model,
-                    'messages': self._prepare_input_messages(messages),
-                    'tools': self._tools,
-                    'reasoning': {'exclude': True},
-                }
-            )
-    
-            print(res.text)
-            resj = res.json()
-            reply = resj['choices'][0]['message']
+            self._client = httpx.AsyncClient(headers=headers, **self._client_options)
+        return self._client
+
+
+    async def _stream_completion(self, messages):
+        """
+        Request a streamed completion, yielding ('token', text) for each piece of
+        assistant text as it arrives and finally ('reply', assistant_message).
+        Connection errors and 429/5xx responses are retried with exponential backoff.
+        """
+        payload = {
+            'model': self._model,
+            'messages': self._prepare_input_messages(messages),
+            'tools': self._tools,
+            'reasoning': {'exclude': True},
+            'stream': True,
+        }
+
+        with tracing.span('llm.completion', model=self._model, cached=False) as span:
+            async for event in self._stream_completion_attempts(payload, span):
+                yield event
+
+
+    async def _stream_completion_attempts(self, payload, span):
+        cache_key = None
+        if self._load_response:
+            cache_key = self.response_key(payload['messages'])
+            reply = await asyncio.to_thread(self._load_response, cache_key)
+            if reply is not None:
+                span.set(cached=True)
+                if reply.get('content'):
+                    yield 'token', reply['content']
+                yield 'reply', reply
+                return
+
+        for attempt in range(self._max_retries + 1):
+            span.set(attempts=attempt + 1)
+            delay = min(0.5 * 2 ** attempt + random.uniform(0, 0.5), RETRY_MAX_DELAY)
+            streamed = False
+            try:
+                async with self._get_client().stream('POST', self._post_url, json=payload) as res:
+                    if res.status_code in RETRY_STATUS_CODES and attempt < self._max_retries:
+                        retry_after = res.headers.get('Retry-After', '')
+                        if retry_after.isdigit():
+                            delay = min(float(retry_after), RETRY_MAX_DELAY)
+                        await asyncio.sleep(delay)
+                        continue
+                    if res.is_error:
+                        await res.aread()
+                    res.raise_for_status()
+
+                    content = ''
+                    tool_calls = {}
+                    received = 0
+                    async for line in res.aiter_lines():
+                        received += len(line)
+                        if not line.startswith('data:'):
+                            continue
+                        data = line[len('data:'):].strip()
+                        if data == '[DONE]':
+                            break
+                        chunk = json.loads(data)
+                        if not chunk.get('choices'):
+                            continue
+
+                        delta = chunk['choices'][0].get('delta') or {}
+                        if delta.get('content'):
+                            content += delta['content']
+                            streamed = True
+                            yield 'token', delta['content']
+
+                        # Tool calls arrive in fragments addressed by their index
+                        for fragment in delta.get('tool_calls') or []:
+                            tool_call = tool_calls.setdefault(fragment.get('index', 0), {
+                                'id': None,
+                                'type': 'function',
+                                'function': {'name': '', 'arguments': ''},
+                            })
+                            if fragment.get('id'):
+                                tool_call['id'] = fragment['id']
+                            function = fragment.get('function') or {}
+                            tool_call['function']['name'] += function.get('name') or ''
+                            tool_call['function']['arguments'] += function.get('arguments') or ''
+            except httpx.TransportError:
+                # Tokens already shown to the client cannot be taken back
+                if attempt < self._max_retries and not streamed:
+                    await asyncio.sleep(delay)
+                    continue
+                raise
+
+            span.set(bytes=received, tool_calls=len(tool_calls))
+            reply = {'role': 'assistant', 'content': content}
+            if tool_calls:
+                reply['tool_calls'] = [tool_calls[index] for index in sorted(tool_calls)]
+                for tool_call in reply['tool_calls']:
+                    tool_call['function']['arguments'] = tool_call['function']['arguments'] or '{}'
+            if cache_key and self._save_response:
+                await asyncio.to_thread(self._save_response, cache_key, reply)
+            yield 'reply', reply
+            return
+
+
+    def response_key(self, input_messages) -> str:
+        """Cache key of a completion: the model, the messages sent and the tool schemas."""
+        messages_hash = hashlib.sha256(
+            json.dumps(input_messages, sort_keys=True).encode()
+        ).hexdigest()
+        return hashlib.sha256(
+            f'{self._model}:{messages_hash}:{self._tools_hash}'.encode()
+        ).hexdigest()
+
+
+    async def run_stream_async(self, messages):
+        """
+        Run the agent loop, extending `messages` in place and yielding progress events:
+        ('token', text), ('message', assistant_message), ('tool_start', tool_call)
+        and ('tool_end', tool_message). Must run on `agent_loop()`.
+        """
+        with tracing.span('agent.run', model=self._model) as span:
+            async for event in self._run_rounds(messages, span):
+                yield event
+
+
+    async def _run_rounds(self, messages, span):
+        rounds = 0
+        while True:
+            rounds += 1
+            span.set(rounds=rounds)
+            async for event, data in self._stream_completion(messages):
+                if event == 'reply':
+                    reply = data
+                else:
+                    yield event, data
             messages.append(reply)
-    
+            yield 'message', reply
+
             tool_calls = reply.get('tool_calls')
-            if tool_calls:
-                for tool_call in tool_calls:
-                    tool_name = tool_call['function']['name']
-                    tool_args = json.loads(tool_call['function']['arguments'])
-                    
-                    # Check if tool exists before calling
-                    if tool_name in self._tool_map:
-                        tool_response = self._tool_map[tool_name](**tool_args)
-                    else:
-                        tool_response = f"Error: Tool '{tool_name}' not found. Available tools: {list(self._tool_map.keys())}"
-                    
-                    if type(tool_response) is ImageContent:
-                        b64_data = tool_response.data
-                        data_url = f'data:image/png;base64,{b64_data}'
-                        content = [{
-                            'type': 'image_url',
-                            'image_url': {
-                                "url": data_url,
-                            }                            
-                        }]
-                    else:
-                        content = [{
-                            'type': 'text',
-                            'text': json.dumps(tool_response)
-                        }]
-                        
-                    messages.append({
-                        'role': 'tool',
-                        'tool_call_id': tool_call['id'],
-                        'name': tool_name,
-                        'content': content
-                    })
-            else:
+            if not tool_calls:
                 break
-            
+
+            for tool_call in tool_calls:
+                yield 'tool_start', tool_call
+            # Tools are blocking; they run on the tool pool while the loop serves other chats
+            tool_messages = self._iter_tool_calls(tool_calls)
+            while (tool_message := await asyncio.to_thread(next, tool_messages, None)) is not None:
+                messages.append(tool_message)
+                yield 'tool_end', tool_message
+
+
+    def run_stream(self, messages):
+        """Synchronous bridge over `run_stream_async` for WSGI views."""
+        events = queue.Queue()
+
+        async def pump():
+            try:
+                async for event in self.run_stream_async(messages):
+                    events.put(event)
+            except Exception as e:
+                events.put(('error', e))
+            finally:
+                events.put(None)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), agent_loop())
+        try:
+            while (event := events.get()) is not None:
+                if event[0] == 'error':
+                    raise event[1]
+                yield event
+        finally:
+            # Stops the run if the consumer went away, e.g. a closed SSE stream
+            future.cancel()
+
+
+    async def arun(self, messages):
+        """Run the agent loop from any event loop, e.g. a Flask async view."""
+        if type(messages) is str:
+            messages = [{'role': 'user', 'content': messages}]
+
+        async def consume():
+            async for _ in self.run_stream_async(messages):
+                pass
+
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(consume(), agent_loop()))
         return messages
 
-    
+
+    def run(self, messages):
+        if type(messages) is str:
+            messages = [{'role': 'user', 'content': messages}]
+
+        for _ in self.run_stream(messages):
+            pass
+            
+        return messages
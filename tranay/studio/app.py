@@ -1,16 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import contextlib
+import functools
+import hashlib
 import json
+import multiprocessing
+import re
+import threading
 
-from flask import Flask, make_response, redirect, request, render_template
+from flask import Flask, Response, abort, make_response, redirect, request, render_template, send_file, stream_with_context
 from flask_cors import CORS
 import httpx
 import mistune
+import os
+import redis
 import tomli_w
 from werkzeug.utils import secure_filename
 from celery import Celery, Task
 
 from tranay.studio import storage, agent_wrapper
-from tranay.tools import tranayTools
+from tranay.tools import tracing, tranayTools
 
 
 app = Flask(__name__)
@@ -37,10 +46,16 @@ def make_celery(app):
 
 app.config.update(
     CELERY_BROKER_URL='redis://localhost:6379/0',
-    CELERY_RESULT_BACKEND='redis://localhost:6379/0'
+    CELERY_RESULT_BACKEND='redis://localhost:6379/0',
+    # 'thread' runs agent turns in the web process, 'celery' on workers of the 'agent' queue
+    AGENT_BACKEND=os.getenv('TRANAY_AGENT_BACKEND', 'thread'),
+    AGENT_TURN_TIMEOUT=int(os.getenv('TRANAY_AGENT_TURN_TIMEOUT', '900')),
 )
 
 celery_app = make_celery(app)
+celery_app.conf.task_routes = {
+    'tranay.studio.tasks.run_agent_turn': {'queue': 'agent'},
+}
 
 
 def boost(content: str, fallback=None, retarget=None, reswap=None, push_url=None) -> str:
@@ -226,6 +241,25 @@ def delete_source():
     return redirect('/sources/manage')
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint with the latency breakdown of traced operations."""
+    return Response(tracing.prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/blobs/<name>')
+def blob(name: str):
+    """Serve a content-addressed image; its name never changes meaning, so it is cached forever."""
+    if not re.fullmatch(r'[0-9a-f]{64}\.png', name):
+        abort(404)
+    path = storage.blob_path(name)
+    if not path.exists():
+        abort(404)
+    response = send_file(path, mimetype='image/png', etag=name.split('.')[0], max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 def get_active_sources():
     sources = {}
     for key in app.config['state']['sources']:
@@ -235,52 +269,339 @@ def get_active_sources():
     return sources
 
 
+_agent_cache = {}
+_agent_cache_lock = threading.RLock()
+# Turns running on each agent; agents replaced by a settings change are closed
+# once their last turn ends rather than under the feet of that turn
+_agent_users = {}
+_retired_agents = set()
+
+
+def response_cache_options(ttl: float | None) -> dict:
+    """Agent options replaying identical LLM requests from the chat store for `ttl` seconds."""
+    if not ttl:
+        return {}
+    return {
+        'load_response': functools.partial(storage.load_response, ttl=ttl),
+        'save_response': functools.partial(storage.save_response, ttl=ttl),
+    }
+
+
+def get_agent():
+    """
+    Return the agent for the current settings and active sources. Tools and their
+    schemas are only rebuilt when either changes, so connections, caches and
+    sources registered by tools survive between requests.
+    """
+    state = app.config['state']
+    sources = get_active_sources()
+    key = json.dumps({
+        'sources': sources,
+        'settings': [state.get(k) for k in [
+            'api_endpoint', 'api_key', 'api_model', 'api_image_input', 'max_parallel_tools', 'tool_timeout',
+            'context_turns', 'context_budget', 'prompt_cache', 'response_cache_ttl',
+        ]],
+    }, sort_keys=True)
+
+    with _agent_cache_lock:
+        if key not in _agent_cache:
+            for stale_agent in _agent_cache.values():
+                if _agent_users.get(stale_agent):
+                    _retired_agents.add(stale_agent)
+                else:
+                    stale_agent.close()
+            _agent_cache.clear()
+            _agent_cache[key] = agent_wrapper.Agent(
+                endpoint = state['api_endpoint'],
+                api_key = state['api_key'],
+                model = state['api_model'],
+                tools = tranayTools(sources).tools,
+                image_input = state['api_image_input'],
+                save_image = storage.save_image,
+                load_image = storage.image_data_url,
+                max_parallel_tools = state.get('max_parallel_tools', 4),
+                tool_timeout = state.get('tool_timeout', 120.0),
+                context_turns = state.get('context_turns', 4),
+                context_budget = state.get('context_budget', 32000),
+                prompt_cache = state.get('prompt_cache', False),
+                **response_cache_options(state.get('response_cache_ttl')),
+            )
+        return _agent_cache[key]
+
+
+@contextlib.contextmanager
+def use_agent():
+    """The agent of `get_agent`, kept open until the caller is done with it."""
+    with _agent_cache_lock:
+        # Taken under the lock so a settings change cannot close it in between
+        agent = get_agent()
+        _agent_users[agent] = _agent_users.get(agent, 0) + 1
+    try:
+        yield agent
+    finally:
+        with _agent_cache_lock:
+            _agent_users[agent] -= 1
+            if not _agent_users[agent]:
+                del _agent_users[agent]
+                if agent in _retired_agents:
+                    _retired_agents.discard(agent)
+                    agent.close()
+
+
+# Bump when the rendering below changes, so cached HTML is not reused
+RENDER_VERSION = 1
+# Number of uncached messages from which a render is spread over processes.
+# A message renders in well under a millisecond, so only very long cold
+# histories (e.g. chats imported from the JSON files) are worth the workers' startup.
+PARALLEL_RENDER_MIN = 2000
+
+
+def render_message(msg) -> dict:
+    """
+    Render the HTML of one message, independently of the rest of the chat.
+    Assistant tool calls give their rendered arguments by call id under 'calls'.
+    """
+    if msg.get('role')=='assistant':
+        if msg.get('tool_calls'):
+            return {
+                'is_tool_call': True,
+                'calls': {
+                    tool_call['id']: {
+                        'name': tool_call['function']['name'],
+                        'arguments': tomli_w.dumps(
+                            json.loads(tool_call['function']['arguments'])
+                        ).replace('\n', '<br>'),
+                    }
+                    for tool_call in msg['tool_calls']
+                },
+            }
+        return {'html': mistune.html(msg['content'])}
+    if msg.get('role')=='tool':
+        if type(msg['content']) is str:
+            return {'html': mistune.html(json.loads(msg['content']))}
+        html = ''
+        for content in msg['content']:
+            if content['type'] == 'image_url':
+                data_url = content['image_url']['url']
+                html += f'<img src="{data_url}">'
+            else:
+                html += mistune.html(json.loads(content['text']))
+        return {'html': html}
+    return {}
+
+
+def render_key(msg) -> str:
+    content = json.dumps(msg, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{RENDER_VERSION}:{content}'.encode()).hexdigest()
+
+
+_render_pool = None
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _render_pool
+
+
+def prepare_message_for_render(msg, fn_calls, fields=None):
+    """Return a copy of the message with its render fields; `msg` is left untouched."""
+    msg = {**msg, **(fields if fields is not None else render_message(msg))}
+    if msg.get('is_tool_call'):
+        fn_calls.update(msg['calls'])
+    if msg.get('role')=='tool':
+        msg['call_details'] = fn_calls[msg['tool_call_id']]
+    return msg
+
+
 def prepare_chat_for_render(chat):
+    """
+    Render a chat for display. Render fields are cached by the content hash of
+    each message, so only messages not displayed before are rendered.
+    """
+    keys = [render_key(msg) for msg in chat['messages']]
+    cached = storage.load_rendered(keys)
+    missing = {key: msg for key, msg in zip(keys, chat['messages']) if key not in cached}
+    if missing:
+        if len(missing) >= PARALLEL_RENDER_MIN:
+            rendered = get_render_pool().map(render_message, missing.values(), chunksize=8)
+        else:
+            rendered = map(render_message, missing.values())
+        new = dict(zip(missing, rendered))
+        storage.save_rendered(new)
+        cached.update(new)
+
     fn_calls = {}
-    for msg in chat['messages']:
-        if msg.get('role')=='assistant':
-            if msg.get('tool_calls'):
-                msg['is_tool_call'] = True
-                for tool_call in msg['tool_calls']:
-                    fn_call = tool_call['function']
-                    fn_call['arguments'] = tomli_w.dumps(
-                        json.loads(fn_call['arguments'])
-                    ).replace('\n', '<br>')
-                    fn_calls[tool_call['id']] = fn_call
-            else:
-                msg['html'] = mistune.html(msg['content'])
-        if msg.get('role')=='tool':
-            msg['call_details'] = fn_calls[msg['tool_call_id']]
-            if type(msg['content']) is str:
-                msg['html'] = mistune.html(json.loads(msg['text']))
-            elif type(msg['content']) is list:
-                msg['html'] = ''
-                for content in msg['content']:
-                    if content['type'] == 'image_url':
-                        data_url = content['image_url']['url']
-                        msg['html'] += f'<img src="{data_url}">'
+    return {
+        **chat,
+        'messages': [
+            prepare_message_for_render(msg, fn_calls, cached[key])
+            for key, msg in zip(keys, chat['messages'])
+        ],
+    }
+
+
+def sse(event: str, data) -> str:
+    """Format one Server-Sent Event carrying a JSON payload."""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def drop_unanswered_tool_calls(messages):
+    """Remove a trailing assistant tool-call request whose results never all arrived."""
+    for i in range(len(messages) - 1, -1, -1):
+        msg = messages[i]
+        if msg.get('role') == 'assistant' and msg.get('tool_calls'):
+            if len(messages) - 1 - i < len(msg['tool_calls']):
+                del messages[i:]
+            return
+
+
+def agent_turn_events(slug: str, chat: dict):
+    """
+    Run the agent on a chat awaiting an answer and yield (event, payload) pairs
+    with rendered HTML: token, message, tool_start, tool_end, failure and finally done.
+    The chat is saved once the turn ends, even if it stopped mid-way.
+    """
+    fn_calls = {}
+    try:
+        with use_agent() as agent:
+            for event, data in agent.run_stream(chat['messages']):
+                if event == 'token':
+                    yield 'token', data
+                elif event == 'message':
+                    msg = prepare_message_for_render(data, fn_calls)
+                    if not msg.get('is_tool_call'):
+                        yield 'message', render_template('ai_message.html', msg=msg)
+                    elif msg.get('content'):
+                        yield 'message', render_template('ai_message.html', msg={
+                            'html': mistune.html(msg['content']),
+                        })
                     else:
-                        msg['html'] += mistune.html(json.loads(content['text']))
-                
-    return chat
+                        yield 'message', ''
+                elif event == 'tool_start':
+                    yield 'tool_start', {
+                        'id': data['id'],
+                        'html': render_template('function_call.html', msg={
+                            'call_details': fn_calls[data['id']],
+                            'html': render_template('loader.html'),
+                        }),
+                    }
+                elif event == 'tool_end':
+                    msg = prepare_message_for_render(data, fn_calls)
+                    yield 'tool_end', {
+                        'id': data['tool_call_id'],
+                        'html': render_template('function_call.html', msg=msg),
+                    }
+    except Exception as e:
+        yield 'failure', render_template('ai_message.html', msg={
+            'html': mistune.html(f'Error: {e}'),
+        })
+    finally:
+        # Keep the history valid for the next turn if the run stopped mid-way
+        drop_unanswered_tool_calls(chat['messages'])
+        storage.save_chat(slug, chat)
+    yield 'done', {}
+
+
+def chat_channel(slug: str) -> str:
+    """Redis pub/sub channel carrying the events of a chat turn run by a Celery worker."""
+    return f'tranay:chat:{slug}'
+
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(app.config['CELERY_BROKER_URL'])
+    return _redis
+
+
+def relay_agent_turn(slug: str):
+    """
+    Dispatch the turn to a Celery worker (unless one is already running it) and
+    relay the events it publishes as Server-Sent Events.
+    """
+    channel = chat_channel(slug)
+    pubsub = get_redis().pubsub()
+    # Subscribe before dispatching so no event is missed
+    pubsub.subscribe(channel)
+    try:
+        # The worker refreshes the expiry on every event it publishes
+        if get_redis().set(f'{channel}:running', 1, nx=True, ex=app.config['AGENT_TURN_TIMEOUT']):
+            celery_app.send_task('tranay.studio.tasks.run_agent_turn', args=[slug])
+
+        while True:
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=15.0)
+            if message is None:
+                if not get_redis().exists(f'{channel}:running'):
+                    # The worker finished before we subscribed, or died
+                    yield sse('done', {})
+                    return
+                # Also detects clients that went away
+                yield ': keepalive\n\n'
+                continue
+
+            event, payload = json.loads(message['data'])
+            yield sse(event, payload)
+            if event == 'done':
+                return
+    finally:
+        pubsub.close()
+
+
+_streaming = set()
+_streaming_lock = threading.Lock()
+
+
+@app.route('/c/<slug>/stream')
+def stream_chat(slug: str):
+    """
+    Run the agent on a chat awaiting an answer, pushing assistant tokens,
+    tool call starts/results and rendered messages as Server-Sent Events.
+    """
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    chat = storage.load_chat(slug)
+    if not chat or chat['messages'][-1]['role'] != 'user':
+        return Response(sse('done', {}), mimetype='text/event-stream', headers=headers)
+
+    if app.config['AGENT_BACKEND'] == 'celery':
+        return Response(stream_with_context(relay_agent_turn(slug)), mimetype='text/event-stream', headers=headers)
+
+    with _streaming_lock:
+        if slug in _streaming:
+            return Response(sse('done', {}), mimetype='text/event-stream', headers=headers)
+        _streaming.add(slug)
+
+    def events():
+        try:
+            for event, payload in agent_turn_events(slug, chat):
+                yield sse(event, payload)
+        finally:
+            with _streaming_lock:
+                _streaming.discard(slug)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
 
 
 @app.route('/create_new_chat', methods=['POST'])
-def create_new_chat():
+async def create_new_chat():
     question = request.form['question']
     slug = storage.create_chat(question)
     chat = storage.load_chat(slug)
 
-    state = app.config['state']
-    agent = agent_wrapper.Agent(
-        endpoint = state['api_endpoint'],
-        api_key = state['api_key'],
-        model = state['api_model'],
-        tools = tranayTools(get_active_sources()).tools,
-        image_input = state['api_image_input'],
-    )
-    chat['messages'] = agent.run(chat['messages'])
-    storage.save_chat(slug, chat)
+    if request.headers.get('hx-boosted'):
+        # The answer is streamed by /c/<slug>/stream once the page is shown
+        chat['stream_url'] = f'/c/{slug}/stream'
+    else:
+        with use_agent() as agent:
+            chat['messages'] = await agent.arun(chat['messages'])
+        storage.save_chat(slug, chat)
     chat = prepare_chat_for_render(chat)
     
     return boost(
@@ -301,6 +622,9 @@ def show_chat(slug: str):
     chat = storage.load_chat(slug)
     if not chat:
         return redirect('/')
+    if chat['messages'][-1]['role'] == 'user':
+        # An unanswered question, e.g. the page was reloaded while streaming
+        chat['stream_url'] = f'/c/{slug}/stream'
     chat = prepare_chat_for_render(chat)
     return boost(render_template('chat.html', chat=chat))
 
@@ -318,7 +642,7 @@ def new_chat_page():
 
 
 @app.route('/follow_up_message', methods=['POST'])
-def follow_up_message():
+async def follow_up_message():
     slug = request.form['slug']
     chat = storage.load_chat(slug)
     chat['messages'].append({
@@ -326,16 +650,13 @@ def follow_up_message():
         'content': request.form['question'],
     })
 
-    state = app.config['state']
-    agent = agent_wrapper.Agent(
-        endpoint = state['api_endpoint'],
-        api_key = state['api_key'],
-        model = state['api_model'],
-        tools = tranayTools(get_active_sources()).tools,
-        image_input = state['api_image_input'],
-    )
-    chat['messages'] = agent.run(chat['messages'])
-    storage.save_chat(slug, chat)
+    if request.headers.get('hx-boosted'):
+        storage.save_chat(slug, chat)
+        chat['stream_url'] = f'/c/{slug}/stream'
+    else:
+        with use_agent() as agent:
+            chat['messages'] = await agent.arun(chat['messages'])
+        storage.save_chat(slug, chat)
     chat = prepare_chat_for_render(chat)
 
     return boost(
@@ -0,0 +1,90 @@
+(function() {
+  // Streams an agent answer from the server (Server-Sent Events) into #chat-stream.
+  function fragment(html) {
+    var template = document.createElement('template')
+    template.innerHTML = html.trim()
+    return template.content.firstElementChild
+  }
+
+  function scrollToEnd() {
+    window.scrollTo(0, document.body.scrollHeight)
+  }
+
+  function stream(container) {
+    var url = container.getAttribute('data-stream-url')
+    container.removeAttribute('data-stream-url')
+
+    var loader = container.querySelector('.loader')
+    var source = new EventSource(url)
+    var answer = null
+
+    function insert(element) {
+      if (element) {
+        container.insertBefore(element, loader)
+        scrollToEnd()
+      }
+      return element
+    }
+
+    source.addEventListener('token', function(e) {
+      if (!answer) {
+        answer = insert(fragment('<div class="ai-message"><div></div></div>'))
+      }
+      answer.firstElementChild.textContent += JSON.parse(e.data)
+      scrollToEnd()
+    })
+
+    source.addEventListener('message', function(e) {
+      var html = JSON.parse(e.data)
+      if (answer) {
+        if (html) {
+          answer.replaceWith(fragment(html))
+        } else {
+          answer.remove()
+        }
+      } else if (html) {
+        insert(fragment(html))
+      }
+      answer = null
+    })
+
+    source.addEventListener('tool_start', function(e) {
+      var call = JSON.parse(e.data)
+      var element = insert(fragment(call.html))
+      element.id = 'call-' + call.id
+    })
+
+    source.addEventListener('tool_end', function(e) {
+      var call = JSON.parse(e.data)
+      var element = document.getElementById('call-' + call.id)
+      if (element) {
+        element.replaceWith(fragment(call.html))
+      } else {
+        insert(fragment(call.html))
+      }
+    })
+
+    source.addEventListener('failure', function(e) {
+      insert(fragment(JSON.parse(e.data)))
+    })
+
+    source.addEventListener('done', function() {
+      source.close()
+      container.classList.remove('streaming')
+      scrollToEnd()
+    })
+
+    source.onerror = function() {
+      // Do not let EventSource reconnect and run the agent again
+      source.close()
+      container.classList.remove('streaming')
+    }
+  }
+
+  htmx.onLoad(function(element) {
+    var containers = element.querySelectorAll('[data-stream-url]')
+    for (var i = 0; i < containers.length; i++) {
+      stream(containers[i])
+    }
+  })
+})()
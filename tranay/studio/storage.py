@@ -1,7 +1,13 @@
+from base64 import b64encode
 from datetime import datetime
+import hashlib
 import json
+import logging
 import os
 from pathlib import Path
+import sqlite3
+import threading
+import time
 import urllib.parse
 
 
@@ -12,8 +18,44 @@ from slugify import slugify
 USER_DATA_DIR = Path(platformdirs.user_data_dir('tranay', 'tranay'))
 STATE_FILE = USER_DATA_DIR / 'studio.json'
 CHATS_DIR = USER_DATA_DIR / 'chats'
+CHATS_DB = USER_DATA_DIR / 'chats.db'
+BLOBS_DIR = USER_DATA_DIR / 'blobs'
+BLOB_URL_PREFIX = '/blobs/'
 os.makedirs(CHATS_DIR, exist_ok=True)
 
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    slug       TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chats_created_at_idx ON chats (created_at);
+CREATE TABLE IF NOT EXISTS messages (
+    slug TEXT NOT NULL REFERENCES chats (slug),
+    seq  INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (slug, seq)
+);
+CREATE TABLE IF NOT EXISTS rendered (
+    key     TEXT PRIMARY KEY,
+    fields  TEXT NOT NULL,
+    used_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS responses (
+    key        TEXT PRIMARY KEY,
+    reply      TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_created_at_idx ON responses (created_at);
+"""
+
+# Rendered messages kept; the least recently shown are dropped beyond it
+RENDERED_MAX_ROWS = 100_000
+
+_local = threading.local()
+_migration_lock = threading.Lock()
+
 
 def load_state() -> dict:
     if os.path.exists(STATE_FILE):
@@ -45,41 +87,201 @@ def remove_datafile(filepath):
     os.remove(filepath)
 
 
+def blob_path(name: str) -> Path:
+    return BLOBS_DIR / name[:2] / name
+
+
+def save_blob(data: bytes, suffix: str = '.png') -> str:
+    """Store content once under its SHA-256 and return its name, e.g. '<sha256>.png'."""
+    name = hashlib.sha256(data).hexdigest() + suffix
+    path = blob_path(name)
+    if not path.exists():
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_name(f'{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return name
+
+
+def save_image(data: bytes) -> str:
+    """Store a PNG in the blob store and return the URL it is served at."""
+    return BLOB_URL_PREFIX + save_blob(data)
+
+
+def image_data_url(url: str) -> str:
+    """Inline a blob store image URL as a data URL; other URLs are returned unchanged."""
+    if not url.startswith(BLOB_URL_PREFIX):
+        return url
+    data = blob_path(url[len(BLOB_URL_PREFIX):]).read_bytes()
+    return f'data:image/png;base64,{b64encode(data).decode()}'
+
+
+def _connect() -> sqlite3.Connection:
+    """Per-thread connection to the chat store, created (and migrated) on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(CHATS_DB, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.executescript(_SCHEMA)
+        with _migration_lock:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < 1:
+                _migrate_json_chats(conn)
+            if conn.execute('PRAGMA user_version').fetchone()[0] < 2:
+                _migrate_rendered_used_at(conn)
+        _local.conn = conn
+    return conn
+
+
+def _migrate_json_chats(conn: sqlite3.Connection):
+    """
+    One-time import of the chats stored as one JSON file each, oldest first.
+    Unreadable files are skipped with a warning and left in place.
+    """
+    files = sorted(CHATS_DIR.glob('*.json'), key=os.path.getctime)
+    with conn:
+        for path in files:
+            try:
+                with open(path) as f:
+                    chat = json.loads(f.read())
+                messages = chat['messages']
+                if not isinstance(messages, list):
+                    raise TypeError('messages is not a list')
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning('Skipping chat %s during migration: %s', path.name, e)
+                continue
+            conn.execute(
+                'INSERT OR IGNORE INTO chats (slug, created_at) VALUES (?, ?)',
+                (path.stem, os.path.getctime(path)),
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO messages (slug, seq, body) VALUES (?, ?, ?)',
+                [(path.stem, seq, json.dumps(msg)) for seq, msg in enumerate(messages)],
+            )
+        conn.execute('PRAGMA user_version = 1')
+
+
+def _migrate_rendered_used_at(conn: sqlite3.Connection):
+    """Track when each rendered message was last shown, for its eviction."""
+    with conn:
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(rendered)')}
+        if 'used_at' not in columns:
+            conn.execute('ALTER TABLE rendered ADD COLUMN used_at REAL NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS rendered_used_at_idx ON rendered (used_at)')
+        conn.execute('PRAGMA user_version = 2')
+
+
 def create_chat(question: str):
     slug = slugify(question[:20]).strip("-")
     slug += '-' + str(hex(int(datetime.now().timestamp() * 1000000)))[2:]
     
-    chat = {
-        'slug': slug,
-        'messages': [{
-            'role': 'user',
-            'content': question,
-        }]
-    }
-    
-    filename = CHATS_DIR / f'{slug}.json'
-    with open(filename, 'w') as f:
-        f.write(json.dumps(chat, indent=2))
+    conn = _connect()
+    with conn:
+        conn.execute(
+            'INSERT INTO chats (slug, created_at) VALUES (?, ?)',
+            (slug, datetime.now().timestamp()),
+        )
+        conn.execute(
+            'INSERT INTO messages (slug, seq, body) VALUES (?, 0, ?)',
+            (slug, json.dumps({'role': 'user', 'content': question})),
+        )
         
     return slug
 
 
 def load_chat(slug: str):
-    try:
-        with open(CHATS_DIR / f'{slug}.json') as f:
-            return json.loads(f.read())
-    except:
+    conn = _connect()
+    if not conn.execute('SELECT 1 FROM chats WHERE slug = ?', (slug,)).fetchone():
         return None
+    rows = conn.execute(
+        'SELECT body FROM messages WHERE slug = ? ORDER BY seq', (slug,)
+    ).fetchall()
+    return {
+        'slug': slug,
+        'messages': [json.loads(body) for (body,) in rows],
+    }
 
 
 def save_chat(slug: str, chat: dict):
-    filename = CHATS_DIR / f'{slug}.json'
-    with open(filename, 'w') as f:
-        f.write(json.dumps(chat, indent=2))
+    """
+    Persist the messages added since the chat was last saved. Messages are
+    append-only, except that trailing messages dropped from the chat are removed.
+    """
+    conn = _connect()
+    with conn:
+        (stored,) = conn.execute(
+            'SELECT COUNT(*) FROM messages WHERE slug = ?', (slug,)
+        ).fetchone()
+        messages = chat['messages']
+        if len(messages) < stored:
+            conn.execute(
+                'DELETE FROM messages WHERE slug = ? AND seq >= ?', (slug, len(messages))
+            )
+        conn.executemany(
+            'INSERT INTO messages (slug, seq, body) VALUES (?, ?, ?)',
+            [(slug, seq, json.dumps(messages[seq])) for seq in range(stored, len(messages))],
+        )
+
+
+def load_rendered(keys) -> dict:
+    """Cached render fields of messages, by the content hash of each message."""
+    keys = list(set(keys))
+    conn = _connect()
+    found = {}
+    # Stay below SQLite's limit on bound parameters
+    for i in range(0, len(keys), 500):
+        batch = keys[i:i + 500]
+        rows = conn.execute(
+            f"SELECT key, fields FROM rendered WHERE key IN ({', '.join('?' * len(batch))})",
+            batch,
+        ).fetchall()
+        found.update((key, json.loads(fields)) for key, fields in rows)
+
+    if found:
+        now = time.time()
+        with conn:
+            conn.executemany('UPDATE rendered SET used_at = ? WHERE key = ?', [(now, key) for key in found])
+    return found
+
+
+def save_rendered(rendered: dict, max_rows: int = RENDERED_MAX_ROWS):
+    """Cache render fields, dropping the least recently shown beyond `max_rows`."""
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO rendered (key, fields, used_at) VALUES (?, ?, ?)',
+            [(key, json.dumps(fields), now) for key, fields in rendered.items()],
+        )
+        conn.execute(
+            'DELETE FROM rendered WHERE key IN '
+            '(SELECT key FROM rendered ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+            (max_rows,),
+        )
+
+
+def load_response(key: str, ttl: float) -> dict | None:
+    """A cached LLM reply, unless it is older than `ttl` seconds."""
+    row = _connect().execute(
+        'SELECT reply FROM responses WHERE key = ? AND created_at >= ?',
+        (key, time.time() - ttl),
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_response(key: str, reply: dict, ttl: float | None = None):
+    """Cache an LLM reply; with a `ttl`, replies older than it are deleted meanwhile."""
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO responses (key, reply, created_at) VALUES (?, ?, ?)',
+            (key, json.dumps(reply), now),
+        )
+        if ttl is not None:
+            conn.execute('DELETE FROM responses WHERE created_at < ?', (now - ttl,))
 
 
 def list_chats():
-    return sorted(
-        [Path(f).stem for f in os.listdir(CHATS_DIR)],
-        key = lambda stem: os.path.getctime(CHATS_DIR / f'{stem}.json'),
-    )[::-1]
+    conn = _connect()
+    rows = conn.execute('SELECT slug FROM chats ORDER BY created_at DESC').fetchall()
+    return [slug for (slug,) in rows]
@@ -2,30 +2,57 @@
 
 import subprocess
 import tempfile
+import time
 import os
-from .app import celery_app
+import json
+from . import storage
+from .app import app, agent_turn_events, celery_app, chat_channel, get_redis
+from tranay.tools import jobs, sumo_handler
 
-@celery_app.task
-def run_sumo_simulation(config_file_path: str, output_prefix: str):
+@celery_app.task(bind=True)
+def run_sumo_simulation(self, config_file_path: str, output_prefix: str):
     """
     Runs a SUMO simulation as a background Celery task.
+    Progress and artifacts are recorded in the job registry under the task id.
 
     Args:
         config_file_path: The absolute path to the .sumocfg file.
         output_prefix: A prefix for all output files (e.g., tripinfo, fcd-output).
     """
+    result = _run_sumo_simulation(self.request.id, config_file_path, output_prefix)
+    outputs = None
+    if result["status"] == "SUCCESS":
+        outputs = {"output_dir": result["output_dir"], **result["outputs"]}
+    jobs.update_job(
+        self.request.id,
+        state = result["status"],
+        finished_at = time.time(),
+        outputs = outputs,
+        error = result.get("error"),
+    )
+    return result
+
+
+def _run_sumo_simulation(job_id: str, config_file_path: str, output_prefix: str):
+    jobs.update_job(job_id, state="STARTED", started_at=time.time())
     try:
         sim_dir = os.path.dirname(config_file_path)
         output_dir = os.path.join(sim_dir, "output")
         os.makedirs(output_dir, exist_ok=True)
-        tripinfo_path = os.path.join(output_dir, f"{output_prefix}_tripinfo.xml")
+        outputs = sumo_handler.simulation_output_paths(output_dir, output_prefix)
+
+        # Periodic per-edge statistics (meandata) and induction loops are requested through an additional file
+        outputs_add = sumo_handler.write_outputs_additional(
+            config_file_path, output_dir, output_prefix
+        )
 
         # Construct the SUMO command
         # This is a safe way to build command-line arguments, preventing security issues.
         sumo_command = [
             "sumo",
             "-c", config_file_path,
-            "--tripinfo-output", tripinfo_path,
+            "--tripinfo-output", outputs["tripinfo"],
+            "--additional-files", outputs_add,
             "--log", os.path.join(output_dir, f"{output_prefix}_sumo.log"),
             "--verbose"
         ]
@@ -52,6 +79,7 @@ def run_sumo_simulation(config_file_path: str, output_prefix: str):
         return {
             "status": "SUCCESS",
             "output_dir": output_dir,
+            "outputs": outputs,
             "stdout": result.stdout
         }
 
@@ -77,4 +105,62 @@ def run_sumo_simulation(config_file_path: str, output_prefix: str):
         # Catch any other unexpected errors
         error_message = f"An unexpected error occurred: {str(e)}"
         print(error_message)
-        return {"status": "FAILURE", "error": error_message}
\ No newline at end of file
+        return {"status": "FAILURE", "error": error_message}
+
+
+# Acknowledged once done, so a stage whose worker process dies is marked
+# failed (WorkerLostError) and its job no longer shows STARTED forever
+@celery_app.task(bind=True, acks_late=True)
+def build_scenario_stage(self, state: dict, stage: str, job_id: str):
+    """
+    Runs one stage of a scenario build. The stages of a build are chained,
+    each receiving the state returned by the previous one; progress and stage
+    timings are recorded in the job registry under `job_id`.
+    """
+    if stage == sumo_handler.SCENARIO_STAGES[0]:
+        jobs.update_job(job_id, state="STARTED", started_at=time.time())
+    try:
+        state = sumo_handler.run_scenario_stage(state, stage)
+    except Exception as e:
+        # Raising stops the chain; rebuilding resumes from the cached stages
+        jobs.update_job(job_id, state="FAILURE", finished_at=time.time(), error=f"Stage '{stage}' failed: {e}")
+        raise
+
+    if stage == sumo_handler.SCENARIO_STAGES[-1]:
+        jobs.update_job(
+            job_id,
+            state="SUCCESS",
+            finished_at=time.time(),
+            outputs={"scenario_stages": state["timings"], "config_path": state["paths"]["config"]},
+        )
+    else:
+        jobs.update_job(job_id, outputs={"scenario_stages": state["timings"]})
+    return state
+
+
+@celery_app.task
+def run_agent_turn(slug: str):
+    """
+    Runs one agent turn of a chat on a worker, publishing its progress on the
+    chat's Redis channel for the studio to relay to the browser.
+    """
+    channel = chat_channel(slug)
+    try:
+        # Settings and sources may have changed since the worker started
+        app.config['state'] = storage.load_state()
+        chat = storage.load_chat(slug)
+        if not chat or chat['messages'][-1]['role'] != 'user':
+            get_redis().publish(channel, json.dumps(['done', {}]))
+            return
+
+        # The running flag expires AGENT_TURN_TIMEOUT after the last sign of
+        # life, so a long turn keeps it while a dead worker lets it lapse
+        ttl = app.config['AGENT_TURN_TIMEOUT']
+        get_redis().expire(f'{channel}:running', ttl)
+        for event, payload in agent_turn_events(slug, chat):
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.publish(channel, json.dumps([event, payload]))
+            pipe.expire(f'{channel}:running', ttl)
+            pipe.execute()
+    finally:
+        get_redis().delete(f'{channel}:running')
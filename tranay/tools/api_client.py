@@ -2,6 +2,8 @@
 
 import requests
 
+from tranay.tools import tracing
+
 USER_ID = "686cc6029cd2bfe70bb8d126"
 
 def get_all_projects(base_api_url):
@@ -13,9 +15,11 @@ def get_all_projects(base_api_url):
         endpoint = "/projects"
         params = {"user_id": USER_ID, "page": page, "page_size": 50}
         try:
-            response = requests.get(base_api_url + endpoint, params=params, timeout=20)
-            response.raise_for_status()
-            data = response.json()
+            with tracing.span('api.request', endpoint=endpoint, page=page) as span:
+                response = requests.get(base_api_url + endpoint, params=params, timeout=20)
+                span.set(status=response.status_code, bytes=len(response.content))
+                response.raise_for_status()
+                data = response.json()
             projects_on_page = data.get('projects', [])
             if not projects_on_page:
                 break
@@ -34,25 +38,28 @@ def get_sensor_data_for_project(base_api_url, project_id):
     endpoint = f"/sensors"
     params = {'project_id': project_id}
     try:
-        response = requests.get(base_api_url + endpoint, params=params, timeout=30)
-        response.raise_for_status()
-        sensor_data_raw = response.json()
-        
-        all_sensor_readings = []
-        if sensor_data_raw and 'map' in sensor_data_raw and 'features' in sensor_data_raw['map']:
-            for feature in sensor_data_raw['map']['features']:
-                for reading in feature['properties'].get('data', []):
-                    clean_document = {
-                        "project_id": project_id,
-                        "sensor_id": int(feature['properties']['id']),
-                        "location": str(feature['geometry']['coordinates']),
-                        "timestamp": reading["timestamp"],
-                        "speed": reading.get("speed"),
-                        "flow": reading.get("flow"),
-                        "occupancy": reading.get("occupancy"),
-                        "count": reading.get("count")
-                    }
-                    all_sensor_readings.append(clean_document)
+        with tracing.span('api.request', endpoint=endpoint, project_id=project_id) as span:
+            response = requests.get(base_api_url + endpoint, params=params, timeout=30)
+            span.set(status=response.status_code, bytes=len(response.content))
+            response.raise_for_status()
+            sensor_data_raw = response.json()
+
+            all_sensor_readings = []
+            if sensor_data_raw and 'map' in sensor_data_raw and 'features' in sensor_data_raw['map']:
+                for feature in sensor_data_raw['map']['features']:
+                    for reading in feature['properties'].get('data', []):
+                        clean_document = {
+                            "project_id": project_id,
+                            "sensor_id": int(feature['properties']['id']),
+                            "location": str(feature['geometry']['coordinates']),
+                            "timestamp": reading["timestamp"],
+                            "speed": reading.get("speed"),
+                            "flow": reading.get("flow"),
+                            "occupancy": reading.get("occupancy"),
+                            "count": reading.get("count")
+                        }
+                        all_sensor_readings.append(clean_document)
+            span.set(rows=len(all_sensor_readings))
         return all_sensor_readings
     except requests.exceptions.RequestException as e:
         print(f"API Client Error: Could not fetch sensor data for project {project_id}. {e}")
@@ -0,0 +1,131 @@
+# tranay/tools/artifacts.py
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+import platformdirs
+
+
+ARTIFACTS_DIR = Path(os.getenv(
+    "TRANAY_ARTIFACTS_DIR",
+    Path(platformdirs.user_cache_dir('tranay', 'tranay')) / 'artifacts',
+))
+# Least recently used artifacts are evicted beyond this size
+ARTIFACTS_MAX_BYTES = int(os.getenv("TRANAY_ARTIFACTS_MAX_BYTES", 10 * 1024**3))
+READ_ONLY_MASK = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+
+def artifact_key(kind: str, **params) -> str:
+    """Key of an artifact: a hash of its kind and of every input it is built from."""
+    doc = json.dumps({'kind': kind, **params}, sort_keys=True, default=str)
+    return f"{kind}-{hashlib.sha256(doc.encode()).hexdigest()[:32]}"
+
+
+def _path(key: str, suffix: str) -> Path:
+    return ARTIFACTS_DIR / key[-2:] / f"{key}{suffix}"
+
+
+def lookup(key: str, suffix: str) -> Path | None:
+    path = _path(key, suffix)
+    if not path.exists():
+        return None
+    # The modification time orders artifacts for eviction
+    os.utime(path)
+    return path
+
+
+def store(key: str, suffix: str, src: Path) -> Path:
+    """
+    Move a freshly built file into the cache, atomically. Cached files are
+    read-only: their hardlinks in simulation directories share the inode.
+    """
+    path = _path(key, suffix)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.chmod(src, stat.S_IMODE(os.stat(src).st_mode) & ~READ_ONLY_MASK)
+    os.replace(src, path)
+    evict()
+    return path
+
+
+def link(cached: Path, dest: Path):
+    """
+    Place an artifact at `dest`, as a hardlink when the cache is on the same
+    filesystem and as a copy otherwise. Either way it survives eviction.
+    A hardlink is the cached file itself, so it stays read-only: replace it
+    (write a new file and rename it over `dest`) rather than editing it in place.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    # Renaming a hardlink onto another link of the same file is a no-op
+    if dest.exists() and os.path.samefile(cached, dest):
+        return
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(cached, tmp)
+    except OSError:
+        shutil.copyfile(cached, tmp)
+    os.replace(tmp, dest)
+
+
+def ensure(
+    key: str, suffix: str, build: Callable[[Path], None], dest: Path | None = None,
+) -> tuple[Path, bool]:
+    """
+    Path of the cached artifact `key`, building it with `build(path)` on a miss
+    and linking it at `dest` if given. Returns the path and whether it was a cache hit.
+    """
+    cached = lookup(key, suffix)
+    if cached is not None:
+        if dest is not None:
+            link(cached, dest)
+        return cached, True
+    staging = ARTIFACTS_DIR / 'staging'
+    staging.mkdir(parents=True, exist_ok=True)
+    # Tools may write side files (e.g. duarouter's .alt.xml); they go with the directory
+    with tempfile.TemporaryDirectory(dir=staging) as tmp_dir:
+        tmp = Path(tmp_dir) / f"{key}{suffix}"
+        build(tmp)
+        if dest is not None:
+            # Linked before storing, as the eviction that follows may remove it from the cache
+            link(tmp, dest)
+        return store(key, suffix, tmp), False
+
+
+def get_or_build(key: str, dest: Path, build: Callable[[Path], None], suffix: str | None = None) -> bool:
+    """
+    Place the artifact `key` at `dest`, building it with `build(path)` on a cache miss.
+    Returns True on a cache hit.
+    """
+    _, hit = ensure(key, suffix or ''.join(dest.suffixes), build, dest)
+    return hit
+
+
+def evict(max_bytes: int | None = None):
+    """Delete the least recently used artifacts until the cache fits in `max_bytes`."""
+    max_bytes = ARTIFACTS_MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    for path in ARTIFACTS_DIR.glob('*/*'):
+        if path.parent.name == 'staging' or not path.is_file():
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def cache_size() -> int:
+    return sum(p.stat().st_size for p in ARTIFACTS_DIR.glob('*/*') if p.is_file())
@@ -5,15 +5,16 @@ from typing import Annotated, Union
 import pandas as pd
 from pydantic import Field
 import subprocess 
+import time
+import uuid
 from tranay.tools import query_utils
-from . import api_client, sumo_handler
+from . import api_client, jobs, sumo_handler
 import os
 
 class Core:
 
     def __init__(self, data_sources): 
         self.data_sources = data_sources
-        self.simulation_jobs = {}
         # The self.tools list now includes our new `list_api_projects` tool.
         self.tools = [
             self.list_sources,
@@ -25,6 +26,7 @@ class Core:
             self.create_sumo_configuration,
             self.start_simulation,
             self.check_simulation_status,
+            self.list_simulation_jobs,
             self.load_simulation_results,
             self.get_bounding_box 
         ]
@@ -42,25 +44,59 @@ class Core:
 
     def create_sumo_configuration(self, 
         sim_name: Annotated[str, Field(description="A descriptive name for the simulation run, e.g., 'massy_morning_rush'.")],
-        bbox: Annotated[str, Field(description="The geographic bounding box for the map data, in the format 'lat_min,lon_min,lat_max,lon_max'. For example: '48.7184,2.2268,48.7432,2.3142' for Massy, France.")]
+        bbox: Annotated[str, Field(description="The geographic bounding box for the map data, in the format 'lat_min,lon_min,lat_max,lon_max'. For example: '48.7184,2.2268,48.7432,2.3142' for Massy, France.")],
+        duration: Annotated[int, Field(description="Seconds of traffic to generate; also the simulation end time.")] = sumo_handler.TRIPS_END,
+        period: Annotated[float, Field(description="Average seconds between two vehicle departures; lower means denser traffic.")] = sumo_handler.TRIPS_PERIOD,
+        fringe_factor: Annotated[float, Field(description="How much more likely trips start and end at the map border than inside it, e.g. 10 for through traffic.")] = 1.0,
+        vehicle_classes: Annotated[str, Field(description="SUMO vehicle classes and their share of the traffic, e.g. 'passenger:0.9,truck:0.1'.")] = "passenger",
+        route_shards: Annotated[int, Field(description="Number of parallel route computations for large scenarios, each over a departure time window.")] = 1,
     ) -> str:
         """
-        Generates configuration files for a new SUMO simulation based on a real-world map area.
-        Downloads map data from OpenStreetMap, converts it, and generates random traffic.
-        Returns the path to the main .sumocfg file needed to start the simulation.
+        Starts building the configuration files for a new SUMO simulation based on a real-world map area,
+        as a background job: downloads map data from OpenStreetMap, converts it, and generates random traffic.
+        Returns a job ID to follow with `check_simulation_status`, and the path of the main .sumocfg file
+        needed to start the simulation once the job succeeds.
         """
         try:
             # Create a dedicated directory for this simulation's files
             sim_dir = os.path.join(os.getcwd(), "simulations", sim_name)
 
-            # Call our new, more powerful handler function
-            config_path = sumo_handler.create_scenario_from_bbox(
+            # Parameters are validated here; the stages run on the Celery workers
+            state = sumo_handler.plan_scenario(
                 sim_name=sim_name,
                 sim_dir=sim_dir,
-                bbox=bbox
+                bbox=bbox,
+                end=duration,
+                period=period,
+                fringe_factor=fringe_factor,
+                vehicle_classes=sumo_handler.parse_vehicle_classes(vehicle_classes),
+                route_shards=route_shards,
             )
+            config_path = state["paths"]["config"]
 
-            return f"Successfully created configuration for '{sim_name}' in '{sim_dir}'. The config file path is: {config_path}"
+            # Defer import to avoid circular app/core import
+            from celery import chain
+            from tranay.studio.app import celery_app
+
+            job_id = str(uuid.uuid4())
+            # Each stage is a Celery task of its own; their ids are recorded with
+            # the job so the status check can see a stage whose worker was lost
+            stage_tasks = {stage: f"{job_id}-{stage}" for stage in sumo_handler.SCENARIO_STAGES}
+            jobs.create_job(job_id, sim_name, config_path, task_ids=list(stage_tasks.values()))
+            task = "tranay.studio.tasks.build_scenario_stage"
+            first, *rest = sumo_handler.SCENARIO_STAGES
+            chain(
+                celery_app.signature(task, args=(state, first, job_id)).set(task_id=stage_tasks[first]),
+                *[
+                    celery_app.signature(task, args=(stage, job_id)).set(task_id=stage_tasks[stage])
+                    for stage in rest
+                ],
+            ).apply_async()
+
+            return (
+                f"Started building the configuration for '{sim_name}' in '{sim_dir}' (job ID: {job_id}). "
+                f"Follow it with `check_simulation_status`; once it succeeds, the config file path is: {config_path}"
+            )
         except Exception as e:
             return f"Error creating SUMO configuration: {e}"
         
@@ -159,77 +195,104 @@ class Core:
                 args=[cfg, sim_name],
             )
             job_id = task.id
-            # Track the job in memory
-            self.simulation_jobs[job_id] = {
-                "status": "STARTED",
-                "config_path": cfg,
-                "sim_name": sim_name,
-            }
+            # Track the job in the persistent registry shared with the workers
+            jobs.create_job(job_id, sim_name, cfg)
             return f"Simulation started successfully (job ID: {job_id})"
         except Exception as e:
             return f"Error starting simulation: {e}"
         
     def check_simulation_status(self, 
-        job_id: Annotated[str, Field(description="The unique job ID returned by `start_simulation`.")]
+        job_id: Annotated[str, Field(description="The unique job ID returned by `start_simulation` or `create_sumo_configuration`.")]
     ) -> str:
-        """Checks the status (e.g., PENDING, SUCCESS, FAILURE) of a running simulation job."""
+        """Checks the status (e.g., PENDING, SUCCESS, FAILURE) of a running simulation or scenario build job."""
         try:
-            from tranay.studio.app import celery_app
-            task_result = celery_app.AsyncResult(job_id)
-            status = task_result.state
-            
+            job = jobs.get_job(job_id)
+            if not job:
+                return f"Error: Unknown job ID {job_id}. Use `list_simulation_jobs` to see recorded jobs."
+
+            if job['state'] not in jobs.TERMINAL_STATES:
+                # Workers record their own progress; Celery only knows about crashes outside the task body
+                from tranay.studio.app import celery_app
+                for task_id in job['task_ids']:
+                    task_result = celery_app.AsyncResult(task_id)
+                    if task_result.failed():
+                        jobs.update_job(job_id, state='FAILURE', finished_at=time.time(), error=str(task_result.info))
+                        job = jobs.get_job(job_id)
+                        break
+
+            status = job['state']
             response = f"Status for job {job_id}: {status}.\n"
-            
-            if task_result.failed():
-                response += f"Error details: {task_result.info}"
-            elif task_result.successful():
+
+            if status == 'FAILURE':
+                response += f"Error details: {job['error']}"
+            elif status == 'SUCCESS' and 'scenario_stages' in job['outputs']:
+                response += f"Scenario configuration built. Start it with `start_simulation` using the config file: {job['outputs']['config_path']}"
+            elif status == 'SUCCESS':
                 response += "Simulation completed successfully. You can now load the results using `load_simulation_results`."
-                # Store the result data
-                self.simulation_jobs[job_id]['status'] = 'SUCCESS'
-                self.simulation_jobs[job_id]['result'] = task_result.info
-                
+
             return response
         except Exception as e:
             return f"Error checking status for job {job_id}: {e}"
-        
+
+    def list_simulation_jobs(self,
+        state: Annotated[str | None, Field(description="Optional; only list jobs in this state, e.g. 'SUCCESS' or 'STARTED'.")] = None,
+        sim_name: Annotated[str | None, Field(description="Optional; only list jobs of this simulation name.")] = None,
+        limit: Annotated[int, Field(description="Maximum number of jobs to list.")] = 20,
+    ) -> str:
+        """Lists recorded simulation jobs, newest first, with their state, timings and outputs."""
+        try:
+            recorded = jobs.list_jobs(state=state, sim_name=sim_name, limit=limit)
+            if not recorded:
+                return "No simulation jobs found."
+
+            df = pd.DataFrame(recorded)
+            df['run_seconds'] = (df['finished_at'] - df['started_at']).round(1)
+            for col in ['created_at', 'started_at', 'finished_at']:
+                df[col] = pd.to_datetime(df[col], unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
+            # Output files as name=path; stage timings and row counts are left to `check_simulation_status`
+            df['outputs'] = df['outputs'].apply(lambda outputs: ', '.join(
+                f'{name}={path}' for name, path in outputs.items() if isinstance(path, str)
+            ))
+            return df[['job_id', 'sim_name', 'state', 'created_at', 'run_seconds', 'outputs', 'error']].to_markdown(index=False)
+        except Exception as e:
+            return f"Error listing simulation jobs: {e}"
 
     def load_simulation_results(self,
         job_id: Annotated[str, Field(description="The job ID of a successfully completed simulation.")]
     ) -> str:
         """
-        For a completed job, this tool parses the XML output and loads it as a new, temporary data source
-        that can be used by other analysis tools like `run_query` or `line_plot`.
+        For a completed job, this tool loads the XML outputs (trips, per-edge interval data and
+        induction loop measurements) as tables of a new DuckDB data source that can be used by
+        other analysis tools like `run_query` or `line_plot`.
         Returns the new source_id for the results.
         """
         try:
-            job_info = self.simulation_jobs.get(job_id)
-            if not job_info or job_info.get('status') != 'SUCCESS':
+            job = jobs.get_job(job_id)
+            if not job or job['state'] != 'SUCCESS':
                 return f"Error: Job {job_id} is not yet completed successfully. Please check its status first."
 
-            result_data = job_info['result']
-            output_dir = result_data['output_dir']
-            sim_name = job_info['sim_name']
-            
-            tripinfo_file = os.path.join(output_dir, f"{sim_name}_tripinfo.xml")
-            
-            # Parse the XML to a list of dicts
-            records = sumo_handler.parse_tripinfo_xml(tripinfo_file)
-            if not records:
+            outputs = job['outputs']
+            db_path = outputs.get('results_db')
+            if db_path and os.path.exists(db_path):
+                # Already converted, possibly by another process
+                counts = outputs['results_rows']
+            else:
+                # Stream every output into one per-run DuckDB database
+                db_path, counts = sumo_handler.results_to_duckdb(outputs['output_dir'], job['sim_name'])
+                jobs.update_job(job_id, outputs={'results_db': db_path, 'results_rows': counts})
+
+            if not counts['trips']:
                 return "No trip info found in the simulation output."
-                
-            # Convert to a pandas DataFrame and save as a temporary file
-            df = pd.DataFrame(records)
-            temp_parquet_path = os.path.join(output_dir, f"{sim_name}_results.parquet")
-            df.to_parquet(temp_parquet_path)
 
-            # Register this new parquet file as a data source
+            # Register the database as a single data source
             source_id = f"sumo_{job_id[:8]}"
             self.data_sources[source_id] = {
-                'source_type': 'parquet',
-                'url': temp_parquet_path,
+                'source_type': 'duckdb',
+                'url': db_path,
                 'active': True
             }
-            return f"Results loaded successfully. Use the new data source_id '{source_id}' with a table name of '{temp_parquet_path}' for analysis."
+            tables = ', '.join(f"'{table}' ({rows} rows)" for table, rows in counts.items())
+            return f"Results loaded successfully. Use the new data source_id '{source_id}' with the tables {tables} for analysis."
 
         except Exception as e:
             return f"Error loading results for job {job_id}: {e}"
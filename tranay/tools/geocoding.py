@@ -0,0 +1,177 @@
+# tranay/tools/geocoding.py
+
+"""
+Place name → bbox lookups through Nominatim, behind a persistent cache.
+
+Results are kept in `geocode.db` in the tranay user data directory for
+TRANAY_GEOCODE_TTL seconds (30 days by default). Places listed in the gazetteer
+CSV named by TRANAY_GAZETTEER never expire, so a deployment can answer its
+usual places offline. Its rows are `name,south,west,north,east`, e.g.
+`Massy,48.7184,2.2268,48.7432,2.3142`, loaded once per process.
+
+Nominatim requests are spaced NOMINATIM_RATE per second apart by all the
+processes sharing the data directory, through a slot reserved in the same database.
+"""
+
+import csv
+from functools import lru_cache
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import platformdirs
+
+
+USER_DATA_DIR = Path(platformdirs.user_data_dir('tranay', 'tranay'))
+GEOCODE_DB = USER_DATA_DIR / 'geocode.db'
+
+GAZETTEER = os.getenv('TRANAY_GAZETTEER')
+GEOCODE_TTL = float(os.getenv('TRANAY_GEOCODE_TTL', 30 * 24 * 3600))
+NOT_FOUND_TTL = 24 * 3600    # seconds a failed lookup is remembered
+NOMINATIM_RATE = 1.0         # requests per second allowed by the Nominatim usage policy
+USER_AGENT = 'tranay_sumo_handler'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    name       TEXT PRIMARY KEY,
+    bbox       TEXT,
+    source     TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name    TEXT PRIMARY KEY,
+    next_at REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+logger = logging.getLogger(__name__)
+
+
+def _acquire_slot(name: str, rate: float):
+    """
+    Block until the next of `rate` calls per second named `name` may go through.
+    The next free slot is kept in geocode.db, so the limit holds across the
+    processes (studio, MCP server, Celery workers) sharing the data directory.
+    """
+    conn = _connect()
+    # IMMEDIATE takes the write lock up front, so two processes cannot read the same slot
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        now = time.time()
+        row = conn.execute('SELECT next_at FROM rate_limits WHERE name = ?', (name,)).fetchone()
+        slot = max(now, row[0]) if row else now
+        conn.execute(
+            'INSERT OR REPLACE INTO rate_limits (name, next_at) VALUES (?, ?)',
+            (name, slot + 1 / rate),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _connect() -> sqlite3.Connection:
+    """One connection per thread, so cached lookups skip the connection setup."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(USER_DATA_DIR, exist_ok=True)
+        conn = sqlite3.connect(GEOCODE_DB, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+        if GAZETTEER:
+            _seed_configured_gazetteer()
+    return conn
+
+
+def normalize_place(name: str) -> str:
+    """'  MASSY ' and 'massy' share a cache entry."""
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+def cached_bbox(name: str) -> tuple[str | None, bool]:
+    """
+    Cached lookup of a place: (bbox or None when the place was not found, hit).
+    """
+    row = _connect().execute(
+        'SELECT bbox FROM places WHERE name = ? AND (expires_at IS NULL OR expires_at > ?)',
+        (normalize_place(name), time.time()),
+    ).fetchone()
+    return (row[0], True) if row else (None, False)
+
+
+def save_bbox(name: str, bbox: str | None, source: str = 'nominatim', ttl: float | None = None):
+    """Remember a lookup; `ttl=None` keeps it forever."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO places (name, bbox, source, expires_at) VALUES (?, ?, ?, ?)',
+            (normalize_place(name), bbox, source, None if ttl is None else time.time() + ttl),
+        )
+
+
+@lru_cache(maxsize=1)
+def _geocoder():
+    from geopy.geocoders import Nominatim
+
+    return Nominatim(user_agent=USER_AGENT)
+
+
+def geocode_bbox(name: str) -> str:
+    """
+    Bbox of a place as 'south,west,north,east', from the cache or Nominatim.
+    Raises ValueError if not found.
+    """
+    bbox, hit = cached_bbox(name)
+    if not hit:
+        _acquire_slot('nominatim', NOMINATIM_RATE)
+        place = _geocoder().geocode(name, exactly_one=True, addressdetails=False)
+        if place:
+            south, north, west, east = map(float, place.raw["boundingbox"])
+            bbox = f"{south},{west},{north},{east}"
+        save_bbox(name, bbox, ttl=GEOCODE_TTL if place else NOT_FOUND_TTL)
+    if bbox is None:
+        raise ValueError(f"Location '{name}' not found")
+    return bbox
+
+
+def seed_gazetteer(path: str | Path) -> int:
+    """
+    Load `name,south,west,north,east` rows (an optional header is skipped) as
+    permanent cache entries. Returns the number of places loaded.
+    """
+    rows = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) != 5 or row[0].startswith('#'):
+                continue
+            try:
+                coords = [float(c) for c in row[1:]]
+            except ValueError:
+                continue  # header
+            rows.append((normalize_place(row[0]), ','.join(map(str, coords)), 'gazetteer', None))
+
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO places (name, bbox, source, expires_at) VALUES (?, ?, ?, ?)',
+            rows,
+        )
+    return len(rows)
+
+
+@lru_cache(maxsize=1)
+def _seed_configured_gazetteer() -> int:
+    # Checked once per process: a bad path must not fail every lookup
+    try:
+        return seed_gazetteer(GAZETTEER)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        logger.error('Cannot load the gazetteer TRANAY_GAZETTEER=%s: %s', GAZETTEER, e)
+        return 0
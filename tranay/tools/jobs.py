@@ -0,0 +1,160 @@
+# tranay/tools/jobs.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import platformdirs
+
+
+USER_DATA_DIR = Path(platformdirs.user_data_dir('tranay', 'tranay'))
+JOBS_DB = USER_DATA_DIR / 'jobs.db'
+
+TERMINAL_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    sim_name    TEXT,
+    config_path TEXT,
+    state       TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    outputs     TEXT,
+    error       TEXT,
+    task_ids    TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state_idx ON jobs (state);
+CREATE INDEX IF NOT EXISTS jobs_sim_name_idx ON jobs (sim_name);
+CREATE INDEX IF NOT EXISTS jobs_created_at_idx ON jobs (created_at);
+"""
+
+_COLUMNS = ('sim_name', 'config_path', 'state', 'started_at', 'finished_at', 'outputs', 'error')
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the registry shared by the studio, MCP server and Celery workers."""
+    global _schema_ready
+    if not _schema_ready:
+        # WAL mode is stored in the database file, so setup runs once per process
+        with _schema_lock:
+            if not _schema_ready:
+                os.makedirs(USER_DATA_DIR, exist_ok=True)
+                conn = sqlite3.connect(JOBS_DB, timeout=30)
+                try:
+                    conn.execute('PRAGMA journal_mode=WAL;')
+                    conn.executescript(_SCHEMA)
+                    columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+                    if 'task_ids' not in columns:
+                        # Registries created before Celery task ids were recorded
+                        conn.execute('ALTER TABLE jobs ADD COLUMN task_ids TEXT')
+                finally:
+                    conn.close()
+                _schema_ready = True
+
+    conn = sqlite3.connect(JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _to_dict(row: sqlite3.Row | None) -> dict | None:
+    if row is None:
+        return None
+    job = dict(row)
+    job['outputs'] = json.loads(job['outputs']) if job['outputs'] else {}
+    job['task_ids'] = json.loads(job['task_ids']) if job['task_ids'] else [job['job_id']]
+    return job
+
+
+def create_job(
+    job_id: str, sim_name: str, config_path: str, state: str = 'PENDING', task_ids: list[str] | None = None,
+):
+    """
+    Record a job. `task_ids` are the Celery tasks doing its work, when the job
+    is not a single task whose id is `job_id`.
+    """
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                'INSERT INTO jobs (job_id, sim_name, config_path, state, created_at, task_ids) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                # A fast worker may already have reported progress for this job
+                'ON CONFLICT (job_id) DO UPDATE SET '
+                'sim_name = excluded.sim_name, config_path = excluded.config_path, task_ids = excluded.task_ids',
+                (job_id, sim_name, config_path, state, time.time(), json.dumps(task_ids) if task_ids else None),
+            )
+    finally:
+        conn.close()
+
+
+def update_job(job_id: str, **fields):
+    """
+    Update columns of a job. `outputs` is merged into the stored artifacts
+    rather than replacing them.
+    """
+    unknown = set(fields) - set(_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+
+    conn = _connect()
+    try:
+        with conn:
+            if 'outputs' in fields:
+                row = conn.execute('SELECT outputs FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+                outputs = json.loads(row['outputs']) if row and row['outputs'] else {}
+                outputs.update(fields['outputs'] or {})
+                fields['outputs'] = json.dumps(outputs)
+
+            # Workers may report on a job the registry has not seen yet
+            conn.execute(
+                'INSERT OR IGNORE INTO jobs (job_id, state, created_at) VALUES (?, ?, ?)',
+                (job_id, 'PENDING', time.time()),
+            )
+            if fields:
+                assignments = ', '.join(f'{col} = ?' for col in fields)
+                conn.execute(
+                    f'UPDATE jobs SET {assignments} WHERE job_id = ?',
+                    (*fields.values(), job_id),
+                )
+    finally:
+        conn.close()
+
+
+def get_job(job_id: str) -> dict | None:
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return _to_dict(row)
+    finally:
+        conn.close()
+
+
+def list_jobs(state: str | None = None, sim_name: str | None = None, limit: int = 50) -> list[dict]:
+    """List jobs, newest first, optionally filtered by state and/or simulation name."""
+    clauses, params = [], []
+    if state:
+        clauses.append('state = ?')
+        params.append(state.upper())
+    if sim_name:
+        clauses.append('sim_name = ?')
+        params.append(sim_name)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f'SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?',
+            (*params, limit),
+        ).fetchall()
+        return [_to_dict(row) for row in rows]
+    finally:
+        conn.close()
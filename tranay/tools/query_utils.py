@@ -1,24 +1,38 @@
-import clickhouse_connect
-import duckdb
+import functools
 import numpy as np
 import os
 import pandas as pd
-import sqlalchemy
-from sqlalchemy.orm import Session
 import time
 from typing import List
 from tranay.tools import config
-import pymongo
 import json
 
-from tranay.tools import api_client
+# Database drivers (clickhouse_connect, duckdb, pymongo, sqlalchemy) are imported
+# by the branch handling their source type, so each is only loaded once it is used
+
+from tranay.tools import api_client, tracing
+
+
+@functools.lru_cache(maxsize=None)
+def sql_engine(url: str):
+    """One engine, and so one connection pool, per database for the life of the process."""
+    import sqlalchemy
+    return sqlalchemy.create_engine(url, pool_pre_ping=True)
+
+
+@functools.lru_cache(maxsize=None)
+def mongo_client(url: str):
+    """MongoClient keeps its own thread-safe connection pool, so one per URL is shared."""
+    import pymongo
+    return pymongo.MongoClient(url)
 
 
 def list_tables(source):
     try:
         match source['source_type']:
             case "mongodb":
-                client = pymongo.MongoClient(source['url'])
+                import pymongo
+                client = mongo_client(source['url'])
                 db_name = pymongo.uri_parser.parse_uri(source['url'])['database']
                 if not db_name:
                     return "Error: Database name missing in connection string."
@@ -71,7 +85,8 @@ def describe_table(source, table_name):
             return "Could not retrieve a sample document from the API."
         
         case 'mongodb':
-            client = pymongo.MongoClient(source['url'])
+            import pymongo
+            client = mongo_client(source['url'])
             db_name = pymongo.uri_parser.parse_uri(source['url'])['database']
             if not db_name:
                 return "Error: Database name missing in connection string."
@@ -104,6 +119,13 @@ def describe_table(source, table_name):
 
 def execute_query(source: dict, query: str):
     """Run the query using the appropriate engine and read only config"""
+    with tracing.span('query.execute', backend=source['source_type']) as span:
+        result = _execute_query(source, query)
+        span.set(**tracing.payload_size(result))
+        return result
+
+
+def _execute_query(source: dict, query: str):
     url = source['url']
                 
     match source['source_type']:
@@ -127,7 +149,8 @@ def execute_query(source: dict, query: str):
                 return f"Error processing API query: {e}"
         
         case "mongodb":
-            client = pymongo.MongoClient(source['url'])
+            import pymongo
+            client = mongo_client(source['url'])
             db_name = pymongo.uri_parser.parse_uri(source['url'])['database']
             if not db_name:
                 raise Exception("Database name missing from MongoDB connection string.")
@@ -154,13 +177,16 @@ def execute_query(source: dict, query: str):
             return pd.DataFrame(list(cursor))
         
         case "sqlite":
-            with sqlalchemy.create_engine(url).connect() as conn:
+            import sqlalchemy
+            with sql_engine(url).connect() as conn:
                 conn.execute(sqlalchemy.text('PRAGMA query_only = ON;'))
                 result = conn.execute(sqlalchemy.text(query))
                 return pd.DataFrame(result)
 
         case "mysql":
-            engine = sqlalchemy.create_engine(url)
+            import sqlalchemy
+            from sqlalchemy.orm import Session
+            engine = sql_engine(url)
             with Session(engine) as session:
                 session.autoflush = False
                 session.autocommit = False
@@ -170,7 +196,8 @@ def execute_query(source: dict, query: str):
                 return pd.DataFrame(result)
 
         case "postgresql":
-            engine = sqlalchemy.create_engine(url)
+            import sqlalchemy
+            engine = sql_engine(url)
             with engine.connect() as conn:
                 conn = conn.execution_options(
                     isolation_level="SERIALIZABLE",
@@ -182,20 +209,24 @@ def execute_query(source: dict, query: str):
                     return pd.DataFrame(result)
 
         case "clickhouse":
+            import clickhouse_connect
             client = clickhouse_connect.get_client(dsn=url)
             client.query('SET readonly=1;')
             return client.query_df(query, use_extended_dtypes=False)
 
         case "duckdb":
+            import duckdb
             conn = duckdb.connect(url, read_only=True)
             return conn.execute(query).df()
 
         case "csv":
+            import duckdb
             conn = duckdb.connect(database=':memory:')
             conn.execute(f"CREATE VIEW CSV AS SELECT * FROM read_csv('{url}')")
             return conn.execute(query).df()
 
         case "parquet":
+            import duckdb
             conn = duckdb.connect(database=':memory:')
             conn.execute(f"CREATE VIEW PARQUET AS SELECT * FROM read_parquet('{url}')")
             return conn.execute(query).df()
@@ -2,78 +2,408 @@
 
 from __future__ import annotations
 
+import contextvars
+import copy
+import heapq
+import json
+import math
 import os
+import re
 import sys
-import time
-import hashlib
 import subprocess
+import tempfile
+import threading
+import time
 import xml.parsers.expat
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, Mapping, Sequence, Tuple
 
-import requests
-from geopy.geocoders import Nominatim
+from . import artifacts, geocoding, tracing
+
+# duckdb and the polars-based sumo_env parsers are imported where they are
+# used, so loading the tools (e.g. to list them in an MCP client) stays fast
+from sumo_env.utils.xml import (
+    create_sub_elem,
+    generate_empty_add,
+    iterparse_elements,
+    iterparse_stream,
+    root,
+    write_xml_to_file,
+)
 
 #––– Configuration –––#
-OVERPASS_MIRRORS: Tuple[str, ...] = (
+OVERPASS_MIRRORS: Tuple[str, ...] = tuple(filter(None, os.getenv("TRANAY_OVERPASS_MIRRORS", "").split(","))) or (
     "https://overpass-api.de/api/interpreter",
     "https://overpass.kumi.systems/api/interpreter",
     "https://overpass.openstreetmap.fr/api/interpreter",
 )
-OVERPASS_TIMEOUT = 300       # seconds for HTTP requests
-MAX_BBOX_AREA = 0.25         # degrees² (~1 000 km²)
+OVERPASS_TIMEOUT = 300       # seconds between bytes of an Overpass response
+OVERPASS_CONNECT_TIMEOUT = 10
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # bytes written per chunk of a streamed download
+MAX_BBOX_AREA = 4.0          # degrees² (~40 000 km²), fetched as TILE_SIZE tiles
+TILE_SIZE = 0.25             # degrees; larger bboxes are fetched per tile of this grid
+OVERPASS_CONCURRENCY = 2     # tiles downloaded at once (Overpass allows ~2 slots per IP)
 SUMO_TOOLS_DIR = os.getenv("SUMO_TOOLS_DIR", "/usr/share/sumo/tools")
 PYTHON = sys.executable      # path to the current Python interpreter
+RESULTS_ROW_GROUP = 100_000  # output rows buffered per Parquet row group
+MEANDATA_PERIOD = 300        # seconds per edgeData and induction loop aggregation interval
+DETECTOR_EDGES = 50          # most important edges of a network equipped with induction loops
+RESULTS_REF_DATETIME = datetime(1970, 1, 1)  # timestamp of simulation second 0
+BBOX_PRECISION = 6           # decimals kept when normalizing a bbox (~0.1 m)
+
+VALIDATE_CHUNK_SIZE = 1 << 20  # bytes fed to Expat at a time
+
+NETCONVERT_OPTIONS: Tuple[str, ...] = (
+    "--geometry.remove",
+    "--junctions.join",
+    "--tls.guess-signals",
+    "--tls.discard-simple",
+    "--tls.join",
+)
+# Ramp guessing is costly and only matters where these roads exist
+RAMP_HIGHWAYS = frozenset({"motorway", "motorway_link", "trunk", "trunk_link"})
+TRIPS_END = 3600             # seconds of generated demand
+TRIPS_PERIOD = 1.0           # seconds between departures, all vehicle classes together
+TRIPS_SEED = 42
+TRIP_ATTRIBUTES = "departLane=\"best\" departSpeed=\"max\""
+# vClass values accepted by randomTrips' --vehicle-class (SUMO 1.20)
+SUMO_VEHICLE_CLASSES = frozenset({
+    "private", "emergency", "authority", "army", "vip", "pedestrian", "passenger",
+    "hov", "taxi", "bus", "coach", "delivery", "truck", "trailer", "motorcycle",
+    "moped", "bicycle", "evehicle", "tram", "rail_urban", "rail", "rail_electric",
+    "rail_fast", "ship", "subway", "aircraft", "wheelchair", "scooter", "drone",
+    "container", "cable_car", "custom1", "custom2",
+})
+
+# Stages of a scenario build, in order; see `run_scenario_stage`
+SCENARIO_STAGES = ("osm", "net", "trips", "routes", "config")
+TOOL_SAMPLE_INTERVAL = 0.1   # seconds between peak RSS samples of a running SUMO tool
+
+# Peak RSS (MB) of the tools run by the current scenario stage
+_tool_peaks: contextvars.ContextVar[list | None] = contextvars.ContextVar("tranay_tool_peaks", default=None)
+
+# Tables of the per-run results database: table → (sort order, indexed columns)
+RESULT_TABLES = {
+    "trips": ("depart, id", ("depart", "id", "v_type")),
+    "edge_data": ("begin, edge_id, lane_id", ("begin", "edge_id")),
+    "induction_loops": ("timestamp, sensor_id", ("timestamp", "sensor_id")),
+}
 
 #––– Helpers –––#
 def get_bbox_from_location_name(location_name: str) -> str:
     """
     Geocode via Nominatim and return bbox as 'south,west,north,east'.
+    Lookups are cached and rate limited, see `geocoding`.
     Raises ValueError if not found.
     """
-    locator = Nominatim(user_agent="tranay_sumo_handler")
-    place = locator.geocode(location_name, exactly_one=True, addressdetails=False)
-    if not place:
-        raise ValueError(f"Location '{location_name}' not found")
-    south, north, west, east = map(float, place.raw["boundingbox"])
-    return f"{south},{west},{north},{east}"
+    return geocoding.geocode_bbox(location_name)
 
-def _download_osm(bbox: str, dest: Path) -> None:
+def normalize_bbox(bbox: str) -> str:
+    """
+    Canonical 'south,west,north,east' form of a bbox, so equivalent spellings
+    ('48.7,2.2,…' vs '48.70, 2.20, …') share cached artifacts.
     """
-    Download OSM XML for the given bbox, rotating through mirrors and checking content-type.
-    Caches result into `dest`.
+    coords = [round(float(c), BBOX_PRECISION) for c in bbox.split(",")]
+    if len(coords) != 4:
+        raise ValueError(f"BBox {bbox!r} must be 'south,west,north,east'")
+    return ",".join(f"{c:.{BBOX_PRECISION}f}" for c in coords)
+
+@lru_cache(maxsize=1)
+def sumo_version() -> str:
     """
+    Version line of the installed netconvert; part of the cache key of every
+    artifact built by a SUMO tool.
+    """
+    try:
+        out = subprocess.run(["netconvert", "--version"], capture_output=True, text=True).stdout
+    except OSError:
+        return "unknown"
+    return next((line.strip() for line in out.splitlines() if line.strip()), "unknown")
+
+def bbox_tiles(bbox: str) -> list[tuple[int, int]]:
+    """
+    Cells of the global TILE_SIZE grid covering the bbox, as (row, column).
+    The grid is fixed so overlapping regions share their tiles.
+    """
+    south, west, north, east = map(float, bbox.split(","))
+
+    def cells(low: float, high: float) -> range:
+        first = math.floor(round(low / TILE_SIZE, 9))
+        return range(first, max(math.ceil(round(high / TILE_SIZE, 9)), first + 1))
+
+    return [(row, col) for row in cells(south, north) for col in cells(west, east)]
+
+def tile_bbox(tile: tuple[int, int]) -> str:
+    row, col = tile
+    return normalize_bbox(
+        f"{row * TILE_SIZE},{col * TILE_SIZE},{(row + 1) * TILE_SIZE},{(col + 1) * TILE_SIZE}"
+    )
+
+def tile_key(tile: tuple[int, int]) -> str:
+    return artifacts.artifact_key("osm-tile", bbox=tile_bbox(tile))
+
+def _fetch_tiles(tiles: Sequence[tuple[int, int]], out_dir: Path) -> list[Path]:
+    """
+    OSM extracts of the tiles, hardlinked from the cache into `out_dir` so that
+    eviction cannot delete them before they are merged. Missing tiles are
+    downloaded, at most OVERPASS_CONCURRENCY at a time.
+    """
+    def fetch(tile: tuple[int, int]) -> Path:
+        def download(dest: Path):
+            _download_osm(tile_bbox(tile), dest)
+            _validate_xml(dest)
+
+        local = out_dir / f"{tile_key(tile)}.osm.xml"
+        artifacts.get_or_build(tile_key(tile), local, download, suffix=".osm.xml")
+        return local
+
+    with ThreadPoolExecutor(max_workers=OVERPASS_CONCURRENCY, thread_name_prefix="osm-tile") as pool:
+        return list(pool.map(fetch, tiles))
+
+def _merge_osm(sources: Sequence[Path], dest: Path) -> None:
+    """
+    Merge OSM extracts into one file, keeping each node and way once. Ways
+    crossing a tile border come with all their nodes in every tile they touch.
+    Elements are streamed, so only the ids seen are held in memory.
+    """
+    import xml.etree.ElementTree as ET
+
+    tmp = dest.with_name(f".{dest.name}.part")
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="tranay">\n')
+        # OSM consumers expect every node before the ways referencing it
+        for kind in ("node", "way"):
+            seen: set[str] = set()
+            for source in sources:
+                doc_root = None
+                for event, elem in ET.iterparse(source, events=("start", "end")):
+                    if event == "start":
+                        if doc_root is None:
+                            doc_root = elem
+                        continue
+                    if elem.tag == kind and elem.get("id") not in seen:
+                        seen.add(elem.get("id"))
+                        elem.tail = None
+                        out.write(ET.tostring(elem, encoding="unicode"))
+                        out.write("\n")
+                    if elem.tag in ("node", "way", "relation"):
+                        doc_root.clear()
+        out.write("</osm>\n")
+    os.replace(tmp, dest)
+
+def _overpass_query(bbox: str) -> str:
     south, west, north, east = bbox.split(",")
-    query = f"""
+    return f"""
 [out:xml][timeout:180];
 (way[highway]({south},{west},{north},{east});>;);
 out body;
 """
-    last_err = None
-    for url in OVERPASS_MIRRORS:
+
+_mirror_slots: dict[str, threading.BoundedSemaphore] = {}
+_mirror_slots_lock = threading.Lock()
+
+def _mirror_slot(url: str) -> threading.BoundedSemaphore:
+    """Queries this process may have running on a mirror at once, shared by all downloads."""
+    with _mirror_slots_lock:
+        return _mirror_slots.setdefault(url, threading.BoundedSemaphore(OVERPASS_CONCURRENCY))
+
+def _download_osm(
+    bbox: str,
+    dest: Path,
+    mirrors: Sequence[str] | None = None,
+    compress: bool = True,
+) -> None:
+    """
+    Download OSM XML for the given bbox into `dest`, racing the mirrors. The
+    first mirror answering with XML wins and the requests to the others are
+    closed at once, which ends their queries on the Overpass side; the winner
+    streams its body to a temporary file renamed onto `dest`. A winner failing
+    mid-transfer hands the race back to the mirrors that have not failed.
+    Each mirror runs at most OVERPASS_CONCURRENCY of our queries at a time, so
+    tiles downloaded in parallel wait for a slot rather than pile up.
+    `compress` asks for gzip transfer encoding, decoded while streaming.
+    """
+    import asyncio
+
+    mirrors = tuple(mirrors or OVERPASS_MIRRORS)
+    query = _overpass_query(bbox)
+    errors: dict[str, str] = {}
+    candidates = list(mirrors)
+    while candidates:
+        if asyncio.run(_race_mirrors(query, dest, candidates, compress, errors)):
+            return
+        candidates = [url for url in candidates if url not in errors]
+    details = "; ".join(f"{url} → {err}" for url, err in errors.items())
+    raise RuntimeError(f"Overpass download failed on all {len(mirrors)} mirrors: {details}")
+
+async def _race_mirrors(
+    query: str,
+    dest: Path,
+    mirrors: Sequence[str],
+    compress: bool,
+    errors: dict[str, str],
+) -> bool:
+    """
+    One round of the race of `_download_osm`. Returns True once `dest` is
+    written; mirrors failing are recorded in `errors`, those cancelled are not.
+    """
+    import asyncio
+    import httpx
+
+    headers = {"Accept-Encoding": "gzip" if compress else "identity"}
+    timeout = httpx.Timeout(OVERPASS_TIMEOUT, connect=OVERPASS_CONNECT_TIMEOUT)
+    tasks: list[asyncio.Task] = []
+
+    async def attempt(index: int, url: str) -> bool:
+        slot = _mirror_slot(url)
+        # Polled, so that a request still waiting for its slot can be cancelled
+        while not slot.acquire(blocking=False):
+            await asyncio.sleep(0.05)
         try:
-            resp = requests.post(url, data={"data": query}, timeout=OVERPASS_TIMEOUT)
-            ct = resp.headers.get("Content-Type", "").lower()
-            if resp.ok and "xml" in ct:
-                dest.write_bytes(resp.content)
-                return
-            last_err = f"{url} → {resp.status_code} / {resp.headers.get('Content-Type')}"
-        except Exception as e:
-            last_err = str(e)
-        time.sleep(2)
-    raise RuntimeError(f"Overpass download failed after {len(OVERPASS_MIRRORS)} mirrors; last error: {last_err}")
-
-def _validate_xml(path: Path) -> None:
-    """
-    Ensure the downloaded file is well-formed XML via Expat.
-    """
-    data = path.read_bytes()
+            async with client.stream("POST", url, data={"data": query}) as resp:
+                ct = resp.headers.get("Content-Type", "").lower()
+                if not (resp.is_success and "xml" in ct):
+                    errors[url] = f"{resp.status_code} / {resp.headers.get('Content-Type')}"
+                    return False
+                # No await since the check above, so exactly one mirror gets here first
+                for task in tasks:
+                    if task is not asyncio.current_task():
+                        task.cancel()
+
+                part = dest.with_name(f".{dest.name}.{index}.part")
+                try:
+                    with tracing.span("osm.download", mirror=url) as span, open(part, "wb") as f:
+                        async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                        span.set(bytes=f.tell())
+                    os.replace(part, dest)
+                    return True
+                except (httpx.HTTPError, OSError) as e:
+                    errors[url] = f"failed mid-transfer: {e}"
+                    return False
+                finally:
+                    part.unlink(missing_ok=True)
+        except httpx.HTTPError as e:
+            errors[url] = str(e) or type(e).__name__
+            return False
+        finally:
+            slot.release()
+
+    async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
+        tasks.extend(asyncio.create_task(attempt(i, url)) for i, url in enumerate(mirrors))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return any(result is True for result in results)
+
+def _validate_xml(path: Path) -> dict:
+    """
+    Ensure the downloaded file is well-formed OSM XML, feeding Expat the file
+    in chunks so memory stays flat. The same pass counts nodes, ways and ways
+    per highway type.
+    Raises RuntimeError on malformed XML or an Overpass error remark.
+    """
+    stats = {"bytes": path.stat().st_size, "nodes": 0, "ways": 0, "highways": Counter()}
+    state = {"in_way": False, "remark": None}
+
+    def start(name: str, attrs: dict):
+        if name == "node":
+            stats["nodes"] += 1
+        elif name == "way":
+            stats["ways"] += 1
+            state["in_way"] = True
+        elif name == "tag" and state["in_way"] and attrs.get("k") == "highway":
+            stats["highways"][attrs.get("v")] += 1
+        elif name == "remark":
+            state["remark"] = ""
+
+    def end(name: str):
+        if name == "way":
+            state["in_way"] = False
+
+    def text(data: str):
+        if state["remark"] is not None:
+            state["remark"] += data
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text
     try:
-        xml.parsers.expat.ParserCreate().Parse(data, True)
+        with open(path, "rb") as f:
+            while chunk := f.read(VALIDATE_CHUNK_SIZE):
+                parser.Parse(chunk, False)
+        parser.Parse(b"", True)
     except xml.parsers.expat.ExpatError as e:
         raise RuntimeError(f"Invalid OSM XML: {e}")
 
-def _build_net(osm: Path, net: Path) -> None:
+    # Overpass reports timeouts and memory exhaustion inside a 200 response
+    if state["remark"] is not None and "error" in state["remark"].lower():
+        raise RuntimeError(f"Overpass returned a partial extract: {state['remark'].strip()}")
+    stats["highways"] = dict(stats["highways"].most_common())
+    return stats
+
+def netconvert_options(osm_stats: dict, boundary: str | None = None) -> Tuple[str, ...]:
+    """
+    netconvert options suited to the extract: ramps are only guessed when it
+    has motorways or trunk roads, and `boundary` ('west,south,east,north')
+    clips the network.
+    """
+    options = NETCONVERT_OPTIONS
+    if RAMP_HIGHWAYS & osm_stats["highways"].keys():
+        options += ("--ramps.guess",)
+    if boundary:
+        options += ("--keep-edges.in-geo-boundary", boundary)
+    return options
+
+def estimate_route_cost(osm_stats: dict, trips: int) -> int:
+    """
+    Relative duarouter effort, comparable between scenarios: every trip
+    searches a graph growing with the number of roads.
+    """
+    return trips * sum(osm_stats["highways"].values())
+
+def _vm_hwm_mb(pid: int | str = "self") -> float | None:
+    """Peak RSS of a live process, from /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _run_tool(cmd: list[str], label: str) -> None:
+    """
+    Run a SUMO tool, raising RuntimeError with its stderr when it fails.
+    Its peak RSS, sampled while it runs, is reported to the scenario stage
+    running it.
+    """
+    peaks = _tool_peaks.get()
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr)
+        peak = 0.0
+        while True:
+            try:
+                proc.wait(timeout=TOOL_SAMPLE_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                peak = max(peak, _vm_hwm_mb(proc.pid) or 0.0)
+        if peaks is not None:
+            peaks.append(peak)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(
+                f"{label} failed (code {proc.returncode}):\n{stderr.read().decode(errors='replace')}"
+            )
+
+def _build_net(osm: Path, net: Path, options: Sequence[str]) -> None:
     """
     Invoke netconvert to turn OSM into a SUMO network.
     """
@@ -81,52 +411,202 @@ def _build_net(osm: Path, net: Path) -> None:
         "netconvert",
         "--osm-files", str(osm),
         "-o", str(net),
-        "--geometry.remove",
-        "--ramps.guess",
-        "--junctions.join",
-        "--tls.guess-signals",
-        "--tls.discard-simple",
-        "--tls.join",
+        *options,
     ]
+    _run_tool(cmd, "netconvert")
+
+def parse_vehicle_classes(spec: str) -> dict[str, float]:
+    """
+    'passenger:0.8,truck:0.2' → {'passenger': 0.8, 'truck': 0.2}; classes
+    without a share split the rest evenly. Shares are normalized to sum to 1.
+    Raises ValueError for an unknown SUMO vClass, a share that is not positive,
+    or classes without a share when the others already take it all.
+    """
+    classes = {}
+    for item in filter(None, (i.strip() for i in spec.split(","))):
+        name, _, share = (part.strip() for part in item.partition(":"))
+        if name not in SUMO_VEHICLE_CLASSES:
+            raise ValueError(
+                f"Unknown vehicle class '{name}'; SUMO knows: {', '.join(sorted(SUMO_VEHICLE_CLASSES))}"
+            )
+        try:
+            value = float(share) if share else None
+        except ValueError:
+            raise ValueError(f"Share of vehicle class '{name}' is not a number: {share!r}") from None
+        if value is not None and not 0 < value < math.inf:
+            raise ValueError(f"Share of vehicle class '{name}' must be positive: {share!r}")
+        classes[name] = value
+    if not classes:
+        raise ValueError("No vehicle class given")
+    given = sum(v for v in classes.values() if v is not None)
+    unset = [k for k, v in classes.items() if v is None]
+    if unset and given >= 1.0:
+        raise ValueError(
+            f"Shares given sum to {given:g}, leaving nothing for {', '.join(unset)}: {spec!r}"
+        )
+    for name in unset:
+        classes[name] = (1.0 - given) / len(unset)
+    total = sum(classes.values())
+    return {name: share / total for name, share in classes.items()}
+
+def _top_level_elements(path: Path) -> Iterator:
+    """Stream the children of the root of a SUMO XML file, freeing each once consumed."""
+    import xml.etree.ElementTree as ET
+
+    doc_root = None
+    depth = 0
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if doc_root is None:
+                doc_root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield elem
+            doc_root.clear()
+
+def _serialize(elem) -> str:
+    import xml.etree.ElementTree as ET
+
+    elem.tail = None
+    return ET.tostring(elem, encoding="unicode")
+
+def _merge_by_depart(sources: Sequence[Path], dest: Path) -> None:
+    """
+    Merge trip or route files, each sorted by departure, into one sorted file
+    (SUMO requires it). vTypes are written once, before any vehicle.
+    """
+    vtypes = {}
+    for source in sources:
+        for elem in _top_level_elements(source):
+            if elem.tag != "vType":
+                break
+            vtypes.setdefault(elem.get("id"), _serialize(elem))
+
+    def vehicles(source: Path):
+        for elem in _top_level_elements(source):
+            if elem.tag != "vType":
+                yield float(elem.get("depart", 0)), _serialize(elem)
+
+    tmp = dest.with_name(f".{dest.name}.part")
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<routes>\n')
+        for vtype in vtypes.values():
+            out.write(f"    {vtype}\n")
+        for _, vehicle in heapq.merge(*map(vehicles, sources), key=lambda item: item[0]):
+            out.write(f"    {vehicle}\n")
+        out.write("</routes>\n")
+    os.replace(tmp, dest)
+
+def _split_by_depart(trips: Path, out_dir: Path, shards: int, end: float) -> list[Path]:
+    """
+    Split a sorted trips file into `shards` files of consecutive departure
+    windows in `out_dir`, each with all the vTypes.
+    """
+    paths = [out_dir / f"shard{i}.trips.xml" for i in range(shards)]
+    files = [open(p, "w", encoding="utf-8") for p in paths]
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"netconvert failed (code {e.returncode}):\n{e.stderr}")
+        for f in files:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<routes>\n')
+        window = end / shards
+        for elem in _top_level_elements(trips):
+            text = f"    {_serialize(elem)}\n"
+            if elem.tag == "vType":
+                for f in files:
+                    f.write(text)
+            else:
+                shard = min(int(float(elem.get("depart", 0)) // window), shards - 1)
+                files[shard].write(text)
+        for f in files:
+            f.write("</routes>\n")
+    finally:
+        for f in files:
+            f.close()
+    return paths
 
-def _build_routes(net: Path, trips: Path, routes: Path) -> None:
+def _build_trips(net: Path, trips: Path, demand: Mapping) -> None:
     """
-    Generate random trips and convert them into routes.
+    Generate random trips on the network, one randomTrips.py run per vehicle
+    class (in parallel) with a period scaled to its share of the demand.
+    `demand` holds end, period, fringe_factor, vehicle_classes and seed.
     """
-    # 1) randomTrips.py → trips.xml
     rt_script = Path(SUMO_TOOLS_DIR) / "randomTrips.py"
-    rt_cmd = [
-        PYTHON,
-        str(rt_script),
-        "-n", str(net),
-        "-o", str(trips),
-        "-b", "0", "-e", "3600",
-        "-p", "1.0",
-        "--trip-attributes", "departLane=\"best\" departSpeed=\"max\"",
-        "--seed", "42",
-    ]
-    try:
-        subprocess.run(rt_cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"randomTrips.py failed (code {e.returncode}):\n{e.stderr}")
-
-    # 2) duarouter → routes.xml
-    dr_cmd = [
-        "duarouter",
-        "-n", str(net),
-        "-t", str(trips),
-        "-o", str(routes),
-    ]
-    try:
-        subprocess.run(dr_cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"duarouter failed (code {e.returncode}):\n{e.stderr}")
 
-def generate_sumocfg_text(net_file: str, rou_file: str) -> str:
+    def run(index: int, vclass: str, share: float) -> Path:
+        out = trips.with_name(f"{vclass}.{trips.name}")
+        rt_cmd = [
+            PYTHON,
+            str(rt_script),
+            "-n", str(net),
+            "-o", str(out),
+            "-b", "0", "-e", str(demand["end"]),
+            "-p", str(demand["period"] / share),
+            "--fringe-factor", str(demand["fringe_factor"]),
+            "--vehicle-class", vclass,
+            "--prefix", f"{vclass}_",
+            "--trip-attributes", TRIP_ATTRIBUTES,
+            "--seed", str(demand["seed"] + index),
+        ]
+        _run_tool(rt_cmd, f"randomTrips.py for {vclass}")
+        return out
+
+    classes = list(demand["vehicle_classes"].items())
+    with ThreadPoolExecutor(max_workers=len(classes)) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, run, i, vclass, share)
+            for i, (vclass, share) in enumerate(classes)
+        ]
+        outputs = [f.result() for f in futures]
+    if len(outputs) == 1:
+        os.replace(outputs[0], trips)
+    else:
+        _merge_by_depart(outputs, trips)
+
+def _build_routes(
+    net: Path,
+    trips: Path,
+    routes: Path,
+    end: float = TRIPS_END,
+    threads: int | None = None,
+    shards: int = 1,
+) -> None:
+    """
+    Convert trips into routes with duarouter using `threads` routing threads
+    (all CPUs by default). With `shards` > 1, the trips are split in departure
+    windows routed by parallel duarouter processes, sharing the threads, and
+    the route files are merged. The shard files are written next to `routes`,
+    in the staging directory of the artifact, never in the simulation directory.
+    """
+    threads = threads or os.cpu_count() or 1
+
+    def route(trips_file: Path, routes_file: Path, routing_threads: int):
+        dr_cmd = [
+            "duarouter",
+            "-n", str(net),
+            "-t", str(trips_file),
+            "-o", str(routes_file),
+            "--routing-threads", str(routing_threads),
+        ]
+        _run_tool(dr_cmd, "duarouter")
+
+    if shards <= 1:
+        route(trips, routes, threads)
+        return
+
+    # Shards go next to the routes being built, i.e. in the artifact staging directory
+    shard_trips = _split_by_depart(trips, routes.parent, shards, end)
+    shard_routes = [p.with_name(p.name.replace(".trips.xml", ".rou.xml")) for p in shard_trips]
+    with ThreadPoolExecutor(max_workers=shards) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, route, t, r, max(1, threads // shards))
+            for t, r in zip(shard_trips, shard_routes)
+        ]
+        for future in futures:
+            future.result()
+    _merge_by_depart(shard_routes, routes)
+
+def generate_sumocfg_text(net_file: str, rou_file: str, end: float = TRIPS_END) -> str:
     """
     Return a complete .sumocfg content, linking net + route files.
     """
@@ -137,56 +617,360 @@ def generate_sumocfg_text(net_file: str, rou_file: str) -> str:
     </input>
     <time>
         <begin value="0"/>
-        <end value="3600"/>
+        <end value="{end}"/>
     </time>
 </configuration>
 """
 
+#––– Simulation outputs –––#
+def simulation_output_paths(output_dir: str, sim_name: str) -> dict[str, str]:
+    """
+    Paths of the XML outputs of a run. Induction loop output goes to the
+    'detectors' path, see `write_outputs_additional`.
+    """
+    return {
+        "tripinfo": os.path.join(output_dir, f"{sim_name}_tripinfo.xml"),
+        "edgedata": os.path.join(output_dir, f"{sim_name}_edgedata.xml"),
+        "detectors": os.path.join(output_dir, f"{sim_name}_detectors.xml"),
+    }
+
+def detector_lanes(net_file: Path, max_edges: int = DETECTOR_EDGES) -> list[tuple[str, float]]:
+    """
+    (lane id, length) of every lane of the `max_edges` most important edges of
+    a network, by road priority then speed. Internal junction edges are skipped.
+    """
+    candidates = []
+    for edge in iterparse_elements(str(net_file), "edge"):
+        lanes = edge.findall("lane")
+        if edge.get("function") or not lanes:
+            continue
+        rank = (int(edge.get("priority", 0)), max(float(lane.get("speed", 0)) for lane in lanes))
+        candidates.append((rank, [(lane.get("id"), float(lane.get("length", 0))) for lane in lanes]))
+    best = heapq.nlargest(max_edges, candidates, key=lambda item: item[0])
+    return [lane for _, lanes in best for lane in lanes]
+
+def write_outputs_additional(config_file: str, output_dir: str, sim_name: str) -> str:
+    """
+    Write an additional file requesting periodic edgeData output and induction
+    loops (one mid-lane on each lane of the main edges, see `detector_lanes`)
+    writing to the 'detectors' output.
+    Returns the value for `--additional-files`, keeping any additionals of the config.
+    """
+    from sumo_env.models.induction_loop import InductionLoop
+
+    outputs = simulation_output_paths(output_dir, sim_name)
+    add_path = Path(output_dir) / f"{sim_name}_outputs.add.xml"
+    add = create_sub_elem(generate_empty_add(), "edgeData", {
+        "id": "edgedata",
+        "file": outputs["edgedata"],
+        "period": str(MEANDATA_PERIOD),
+    })
+
+    # Paths inside the config are relative to it, on the command line to the cwd
+    cfg_dir = Path(config_file).resolve().parent
+    config = root(Path(config_file))
+    net = config.find("input/net-file")
+    if net is not None:
+        for lane_id, length in detector_lanes(cfg_dir / net.get("value")):
+            add.append(InductionLoop(
+                id=f"loop_{lane_id}",
+                lane_id=lane_id,
+                pos=round(length / 2, 2),
+                file=Path(outputs["detectors"]),
+                period=MEANDATA_PERIOD,
+                friendly_pos=True,
+            ).to_xml())
+    write_xml_to_file(add, str(add_path))
+
+    existing = config.find("input/additional-files")
+    files = []
+    if existing is not None:
+        files = [str(cfg_dir / f) for f in re.split(r"[,\s]+", existing.get("value", "")) if f]
+    return ",".join([*files, str(add_path)])
+
+def results_to_duckdb(output_dir: str, sim_name: str) -> tuple[str, dict[str, int]]:
+    """
+    Load every output of a finished run into one DuckDB database: a table per output,
+    sorted on time and indexed on its time and id columns. XML is streamed through Parquet row
+    groups, so memory stays bounded regardless of the run size.
+    Returns the database path and the row count of each table.
+    """
+    import duckdb
+    from sumo_env.models.induction_loop import (
+        measurements_to_parquet,
+        parse_sumo_measurements_stream,
+    )
+    from sumo_env.outputs.traffic.dataframe import intervals_to_parquet
+    from sumo_env.outputs.traffic.parser import parse_meandata_stream
+    from sumo_env.outputs.trips.dataframe import tripinfos_to_parquet
+    from sumo_env.outputs.trips.parser import parse_tripinfos_stream
+
+    out = Path(output_dir)
+    paths = simulation_output_paths(output_dir, sim_name)
+
+    def optional(path: str, parse):
+        return parse(path) if os.path.exists(path) else iter(())
+
+    writers = {
+        "trips": lambda dest: tripinfos_to_parquet(
+            parse_tripinfos_stream(iterparse_stream(paths["tripinfo"])),
+            dest, RESULTS_ROW_GROUP,
+        ),
+        "edge_data": lambda dest: intervals_to_parquet(
+            optional(paths["edgedata"], lambda p: parse_meandata_stream(iterparse_stream(p))),
+            dest, RESULTS_ROW_GROUP,
+        ),
+        "induction_loops": lambda dest: measurements_to_parquet(
+            optional(paths["detectors"], lambda p: parse_sumo_measurements_stream(Path(p), RESULTS_REF_DATETIME)),
+            dest, RESULTS_ROW_GROUP,
+        ),
+    }
+
+    db_path = out / f"{sim_name}_results.duckdb"
+    tmp_db = Path(f"{db_path}.tmp")
+    tmp_db.unlink(missing_ok=True)
+    counts = {}
+    conn = duckdb.connect(str(tmp_db))
+    try:
+        for table, (order_by, index_cols) in RESULT_TABLES.items():
+            parquet = out / f"{sim_name}_{table}.parquet"
+            counts[table] = writers[table](parquet)
+            # The path comes from sim_name, so it is bound rather than spliced into the SQL
+            conn.execute(
+                f"CREATE TABLE {table} AS SELECT * FROM read_parquet(?) ORDER BY {order_by}",
+                [str(parquet)],
+            )
+            for col in index_cols:
+                conn.execute(f"CREATE INDEX {table}_{col}_idx ON {table} ({col})")
+            parquet.unlink()
+    finally:
+        conn.close()
+
+    os.replace(tmp_db, db_path)
+    return str(db_path), counts
+
 #––– Orchestrator –––#
-def create_scenario_from_bbox(
+def _reset_peak_rss() -> None:
+    """Reset the peak RSS of this process (Linux >= 4.0), so each stage gets its own peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _peak_rss_mb() -> float:
+    peak = _vm_hwm_mb()
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        # Windows: neither /proc nor getrusage, the peak is not measured
+        return 0.0
+    # Without /proc this is the peak of the whole process
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+def plan_scenario(
     *,
     sim_name: str,
     sim_dir: str,
-    bbox: str
-) -> str:
-    """
-    1. Validate bbox area
-    2. Download & cache OSM
-    3. XML validation
-    4. netconvert → .net.xml
-    5. randomTrips + duarouter → .rou.xml
-    6. write .sumocfg
-    Returns the path to the generated .sumocfg
+    bbox: str,
+    end: float = TRIPS_END,
+    period: float = TRIPS_PERIOD,
+    fringe_factor: float = 1.0,
+    vehicle_classes: Mapping[str, float] | None = None,
+    seed: int = TRIPS_SEED,
+    routing_threads: int | None = None,
+    route_shards: int = 1,
+) -> dict:
     """
-    sim_path = Path(sim_dir)
-    sim_path.mkdir(parents=True, exist_ok=True)
+    Validate the request and return the initial state of a scenario build.
+    The state is JSON serializable, so each stage can run as its own (Celery)
+    task: `run_scenario_stage(state, stage)` for every SCENARIO_STAGES entry,
+    in order, each returning the state for the next.
 
-    # 1) BBOX sanity-check
+    Demand lasts `end` seconds with a departure every `period` seconds, split
+    between `vehicle_classes` ({vClass: share}, passenger cars by default);
+    see `_build_routes` for `routing_threads` and `route_shards`.
+    """
+    bbox = normalize_bbox(bbox)
     south, west, north, east = map(float, bbox.split(","))
     if (north - south) * (east - west) > MAX_BBOX_AREA:
         raise ValueError(f"BBox {bbox} too large (> {MAX_BBOX_AREA}°²)")
 
-    # 2) Download / cache
-    cache_name = f"osm_{hashlib.sha1(bbox.encode()).hexdigest()[:8]}.xml"
-    osm_path = sim_path / cache_name
-    if not osm_path.exists():
-        _download_osm(bbox, osm_path)
+    sim_path = Path(sim_dir)
+    return {
+        "sim_name": sim_name,
+        "sim_dir": str(sim_path),
+        "bbox": bbox,
+        # Areas beyond a tile are fetched per tile of a fixed grid, so regions
+        # overlapping earlier ones only download their missing tiles, and the
+        # network is clipped back to the bbox
+        "tiles": bbox_tiles(bbox) if (north - south) * (east - west) > TILE_SIZE ** 2 else [],
+        "demand": {
+            "end": end,
+            "period": period,
+            "fringe_factor": fringe_factor,
+            "vehicle_classes": dict(vehicle_classes or {"passenger": 1.0}),
+            "seed": seed,
+        },
+        "routing_threads": routing_threads,
+        "route_shards": route_shards,
+        "paths": {
+            "net": str(sim_path / f"{sim_name}.net.xml"),
+            "trips": str(sim_path / f"{sim_name}.trips.xml"),
+            "routes": str(sim_path / f"{sim_name}.rou.xml"),
+            "config": str(sim_path / f"{sim_name}.sumocfg"),
+        },
+        "keys": {},
+        "timings": {},
+    }
+
+# Each stage builds its artifact from the keys and paths of the previous ones
+# and returns whether it came from the cache. Keys hash every input of the
+# artifact and chain, so e.g. the routes of a new bbox never match those of
+# another network; SUMO's version is read where the tools run.
+
+def _stage_osm(state: dict) -> bool:
+    """Download (per tile for large areas) and validate the extract."""
+    bbox, tiles = state["bbox"], [tuple(t) for t in state["tiles"]]
+    if tiles:
+        osm_key = artifacts.artifact_key("osm", tiles=[tile_key(t) for t in tiles])
+    else:
+        osm_key = artifacts.artifact_key("osm", bbox=bbox)
+
+    # Validation happens before the download enters the cache; its statistics
+    # are cached next to the extract
+    osm_stats = {}
+
+    def download(dest: Path):
+        if tiles:
+            # `dest` is in a staging directory removed once the extract is cached
+            _merge_osm(_fetch_tiles(tiles, dest.parent), dest)
+        else:
+            _download_osm(bbox, dest)
+        osm_stats.update(_validate_xml(dest))
+
+    osm_path = Path(state["sim_dir"]) / f"osm_{osm_key.split('-')[1][:8]}.xml"
+    hit = artifacts.get_or_build(osm_key, osm_path, download, suffix=".osm.xml")
+    stats_path, _ = artifacts.ensure(
+        osm_key, ".stats.json",
+        lambda dest: dest.write_text(json.dumps(osm_stats or _validate_xml(osm_path))),
+    )
+    state["osm_stats"] = json.loads(stats_path.read_text())
+    if not state["osm_stats"]["highways"]:
+        raise ValueError(f"BBox {bbox} contains no roads")
+
+    state["keys"]["osm"] = osm_key
+    state["paths"]["osm"] = str(osm_path)
+    return hit
+
+def _stage_net(state: dict) -> bool:
+    """netconvert → .net.xml, with options suited to the extract."""
+    south, west, north, east = state["bbox"].split(",")
+    options = netconvert_options(state["osm_stats"], f"{west},{south},{east},{north}" if state["tiles"] else None)
+    key = artifacts.artifact_key("net", osm=state["keys"]["osm"], options=options, sumo=sumo_version())
+    state["keys"]["net"] = key
+    state["netconvert_options"] = list(options)
+    return artifacts.get_or_build(
+        key, Path(state["paths"]["net"]), lambda dest: _build_net(Path(state["paths"]["osm"]), dest, options),
+    )
+
+def _stage_trips(state: dict) -> bool:
+    """randomTrips → .trips.xml"""
+    key = artifacts.artifact_key(
+        "trips", net=state["keys"]["net"], demand=state["demand"], attributes=TRIP_ATTRIBUTES, sumo=sumo_version(),
+    )
+    state["keys"]["trips"] = key
+    return artifacts.get_or_build(
+        key, Path(state["paths"]["trips"]), lambda dest: _build_trips(Path(state["paths"]["net"]), dest, state["demand"]),
+    )
 
-    # 3) XML validation
-    _validate_xml(osm_path)
+def _stage_routes(state: dict) -> bool:
+    """duarouter → .rou.xml"""
+    # Threads and shards change how fast routes are computed, not the routes
+    key = artifacts.artifact_key("routes", net=state["keys"]["net"], trips=state["keys"]["trips"], sumo=sumo_version())
+    state["keys"]["routes"] = key
+    paths = state["paths"]
+    return artifacts.get_or_build(key, Path(paths["routes"]), lambda dest: _build_routes(
+        Path(paths["net"]), Path(paths["trips"]), dest,
+        state["demand"]["end"], state["routing_threads"], state["route_shards"],
+    ))
 
-    # 4) Build network
-    net_path = sim_path / f"{sim_name}.net.xml"
-    _build_net(osm_path, net_path)
+def _stage_config(state: dict) -> bool:
+    """Write the .sumocfg, and what went into the scenario next to it."""
+    paths = state["paths"]
+    cfg_text = generate_sumocfg_text(Path(paths["net"]).name, Path(paths["routes"]).name, state["demand"]["end"])
+    Path(paths["config"]).write_text(cfg_text, encoding="utf-8")
 
-    # 5) Generate routes
-    trips_path = sim_path / f"{sim_name}.trips.xml"
-    rou_path   = sim_path / f"{sim_name}.rou.xml"
-    _build_routes(net_path, trips_path, rou_path)
+    demand = state["demand"]
+    report = {
+        "bbox": state["bbox"],
+        "tiles": len(state["tiles"]),
+        "osm": state["osm_stats"],
+        "netconvert_options": state["netconvert_options"],
+        "demand": demand,
+        "route_cost": estimate_route_cost(state["osm_stats"], int(demand["end"] / demand["period"])),
+        "route_shards": state["route_shards"],
+        "artifacts": state["keys"],
+        "timings": state["timings"],
+    }
+    report_path = Path(state["sim_dir"]) / f"{state['sim_name']}.scenario.json"
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return False
 
-    # 6) Write SUMO config
-    cfg_path = sim_path / f"{sim_name}.sumocfg"
-    cfg_text = generate_sumocfg_text(net_path.name, rou_path.name)
-    cfg_path.write_text(cfg_text, encoding="utf-8")
+_STAGE_BUILDERS = {
+    "osm": _stage_osm,
+    "net": _stage_net,
+    "trips": _stage_trips,
+    "routes": _stage_routes,
+    "config": _stage_config,
+}
 
-    return str(cfg_path)
+def run_scenario_stage(state: dict, stage: str) -> dict:
+    """
+    Run one stage of a scenario build and return the updated state, with the
+    wall time, peak RSS of this process and of the SUMO tools it ran, and
+    whether its artifact was already up to date, under `timings[stage]`.
+    A failed build resumes where it stopped when run again: the artifacts of
+    completed stages are found in the cache under the same keys.
+    """
+    state = copy.deepcopy(state)
+    Path(state["sim_dir"]).mkdir(parents=True, exist_ok=True)
+
+    _reset_peak_rss()
+    peaks = []
+    token = _tool_peaks.set(peaks)
+    start = time.perf_counter()
+    try:
+        with tracing.span("scenario.stage", stage=stage) as span:
+            cached = _STAGE_BUILDERS[stage](state)
+            span.set(cached=cached)
+    finally:
+        _tool_peaks.reset(token)
+    state["timings"][stage] = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "cached": cached,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "tools_peak_rss_mb": round(max(peaks, default=0.0), 1),
+    }
+    return state
+
+def create_scenario_from_bbox(*, sim_name: str, sim_dir: str, bbox: str, **options) -> str:
+    """
+    Build a scenario in this process, stage after stage:
+    1. Download OSM, per tile for large areas, and validate it
+    2. netconvert → .net.xml
+    3. randomTrips → .trips.xml
+    4. duarouter → .rou.xml
+    5. write .sumocfg and a .scenario.json report (OSM statistics, options, stage timings)
+    Steps 1-4 are served from the shared artifact cache when their inputs
+    (bbox, tool options, SUMO version, demand) were built before. `options`
+    are those of `plan_scenario`.
+    Returns the path to the generated .sumocfg
+    """
+    state = plan_scenario(sim_name=sim_name, sim_dir=sim_dir, bbox=bbox, **options)
+    for stage in SCENARIO_STAGES:
+        state = run_scenario_stage(state, stage)
+    return state["paths"]["config"]
@@ -0,0 +1,245 @@
+# tranay/tools/tracing.py
+
+"""
+Lightweight tracing for finding where the time of an answer goes (LLM, tools,
+databases, the tranay API or image rendering).
+
+Spans are aggregated in memory for `prometheus_metrics()` and, when configured,
+exported in the OpenTelemetry OTLP/JSON format:
+- TRANAY_TRACE_FILE: append one ExportTraceServiceRequest per line, the format
+  read by the collector's `otlpjsonfile` receiver.
+- TRANAY_OTLP_ENDPOINT: POST batches to an OTLP/HTTP collector, e.g. http://localhost:4318
+"""
+
+import atexit
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+
+
+SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'tranay')
+TRACE_FILE = os.environ.get('TRANAY_TRACE_FILE')
+OTLP_ENDPOINT = os.environ.get('TRANAY_OTLP_ENDPOINT')
+# Longest the exit of the process waits for queued spans to be written
+FLUSH_TIMEOUT = 2.0
+
+# Attributes turned into Prometheus labels, besides the span name
+METRIC_LABELS = ('backend', 'tool', 'model')
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current = contextvars.ContextVar('tranay_span', default=None)
+_lock = threading.Lock()
+_metrics = defaultdict(lambda: {
+    'count': 0, 'errors': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+    'buckets': [0] * len(DURATION_BUCKETS),
+})
+_export_queue = None
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+
+    def __init__(self, name: str, attributes: dict, parent: 'Span | None'):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: BaseException | None = None):
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.error = f'{type(error).__name__}: {error}'
+        _record(self)
+        _export(self)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block as a child of the current span. Row counts and sizes are
+    recorded by setting the `rows` and `bytes` attributes on the yielded span.
+    """
+    current = Span(name, attributes, _current.get())
+    token = _current.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Async generators may be finalized from another context
+            pass
+        current.end(error)
+
+
+def payload_size(value) -> dict:
+    """`rows` and approximate `bytes` attributes of a tool or query result."""
+    if hasattr(value, 'memory_usage') and hasattr(value, 'shape'):
+        return {'rows': value.shape[0], 'bytes': int(value.memory_usage(index=True, deep=False).sum())}
+    if isinstance(value, (str, bytes)):
+        return {'bytes': len(value)}
+    if isinstance(value, (list, tuple)):
+        return {'rows': len(value)}
+    if hasattr(value, 'data') and isinstance(value.data, str):
+        # e.g. an MCP ImageContent carrying base64 data
+        return {'bytes': len(value.data)}
+    return {}
+
+
+def _record(span: Span):
+    key = (span.name, tuple(str(span.attributes.get(label, '')) for label in METRIC_LABELS))
+    with _lock:
+        metric = _metrics[key]
+        metric['count'] += 1
+        metric['errors'] += span.error is not None
+        metric['seconds'] += span.duration
+        metric['rows'] += int(span.attributes.get('rows') or 0)
+        metric['bytes'] += int(span.attributes.get('bytes') or 0)
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if span.duration <= bound:
+                metric['buckets'][i] += 1
+
+
+def prometheus_metrics() -> str:
+    """Span metrics of this process in the Prometheus text exposition format."""
+    lines = [
+        '# HELP tranay_span_duration_seconds Duration of traced operations.',
+        '# TYPE tranay_span_duration_seconds histogram',
+    ]
+    counters = {
+        'tranay_span_errors_total': ('errors', 'Traced operations that raised an error.'),
+        'tranay_span_rows_total': ('rows', 'Rows returned by traced operations.'),
+        'tranay_span_bytes_total': ('bytes', 'Bytes returned by traced operations.'),
+    }
+    with _lock:
+        metrics = {key: {**m, 'buckets': list(m['buckets'])} for key, m in _metrics.items()}
+
+    def labels(name, values, **extra):
+        pairs = [('span', name), *zip(METRIC_LABELS, values), *extra.items()]
+        return ','.join(f'{k}="{_escape(v)}"' for k, v in pairs if v != '')
+
+    for (name, values), m in sorted(metrics.items()):
+        for bound, count in zip(DURATION_BUCKETS, m['buckets']):
+            lines.append(f'tranay_span_duration_seconds_bucket{{{labels(name, values, le=f"{bound:g}")}}} {count}')
+        lines.append(f'tranay_span_duration_seconds_bucket{{{labels(name, values, le="+Inf")}}} {m["count"]}')
+        lines.append(f'tranay_span_duration_seconds_sum{{{labels(name, values)}}} {m["seconds"]}')
+        lines.append(f'tranay_span_duration_seconds_count{{{labels(name, values)}}} {m["count"]}')
+
+    for metric, (field, help_text) in counters.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for (name, values), m in sorted(metrics.items()):
+            lines.append(f'{metric}{{{labels(name, values)}}} {m[field]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def to_otlp(spans: list[Span]) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest for finished spans."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+        'scopeSpans': [{
+            'scope': {'name': 'tranay'},
+            'spans': [{
+                'traceId': s.trace_id,
+                'spanId': s.span_id,
+                **({'parentSpanId': s.parent_id} if s.parent_id else {}),
+                'name': s.name,
+                'kind': 1,
+                'startTimeUnixNano': str(s.start_ns),
+                'endTimeUnixNano': str(s.start_ns + int(s.duration * 1e9)),
+                'attributes': [
+                    _otlp_attribute(k, v) for k, v in s.attributes.items() if v is not None
+                ],
+                'status': {'code': 2, 'message': s.error} if s.error else {'code': 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+def _export(span: Span):
+    global _export_queue
+    if not (TRACE_FILE or OTLP_ENDPOINT):
+        return
+    with _lock:
+        if _export_queue is None:
+            _export_queue = queue.Queue()
+            threading.Thread(target=_export_worker, name='tranay-trace-export', daemon=True).start()
+            atexit.register(_flush)
+    _export_queue.put(span)
+
+
+def _export_worker():
+    """Write finished spans in batches, off the traced threads."""
+    while True:
+        batch = [_export_queue.get()]
+        time.sleep(0.5)
+        while True:
+            try:
+                batch.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+        _write(batch)
+        for _ in batch:
+            _export_queue.task_done()
+
+
+def _write(batch: list[Span]):
+    request = to_otlp(batch)
+    try:
+        if TRACE_FILE:
+            with open(TRACE_FILE, 'a') as f:
+                f.write(json.dumps(request) + '\n')
+        if OTLP_ENDPOINT:
+            import httpx
+            httpx.post(f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=request, timeout=5)
+    except Exception as e:
+        logger.warning('Trace export of %d spans failed: %s', len(batch), e)
+
+
+def _flush(timeout: float = FLUSH_TIMEOUT):
+    """Wait for queued spans to be written, giving up after `timeout` seconds."""
+    if _export_queue is None:
+        return
+    deadline = time.monotonic() + timeout
+    with _export_queue.all_tasks_done:
+        while _export_queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning('Trace export: dropping %d unsent spans at exit', _export_queue.unfinished_tasks)
+                return
+            _export_queue.all_tasks_done.wait(remaining)
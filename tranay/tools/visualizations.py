@@ -5,16 +5,25 @@ from typing import Any, List, Union, Annotated
 import json
 import pandas as pd
 
-from mcp.types import ImageContent
-import plotly.express as px
 from pydantic import Field
 
-from tranay.tools import query_utils
+from tranay.tools import query_utils, tracing
+
+
+def _px():
+    """plotly.express, imported on the first plot rather than when the tools are loaded."""
+    import plotly.express as px
+    return px
 
 
 def _fig_to_image(fig):
     """Converts a Plotly figure to a base64 encoded image content object."""
-    fig_encoded = b64encode(fig.to_image(format='png')).decode()
+    from mcp.types import ImageContent
+
+    with tracing.span('plot.render') as span:
+        png = fig.to_image(format='png')
+        span.set(bytes=len(png))
+    fig_encoded = b64encode(png).decode()
     return ImageContent(
         type='image',
         data=fig_encoded,
@@ -95,7 +104,7 @@ class Visualizations:
                     if df.empty: return f"The dataframe_query '{dataframe_query}' resulted in no data."
                 except Exception as e: return f"Error applying dataframe_query: {e}"
 
-            fig = px.scatter(df, x=x, y=y, color=color, title=title)
+            fig = _px().scatter(df, x=x, y=y, color=color, title=title)
             fig.update_xaxes(autotickangles=[0, 45, 60, 90])
             return _fig_to_image(fig)
         except Exception as e:
@@ -129,7 +138,7 @@ class Visualizations:
                     if df.empty: return f"The dataframe_query '{dataframe_query}' resulted in no data."
                 except Exception as e: return f"Error applying dataframe_query: {e}"
 
-            fig = px.line(df, x=x, y=y, color=color, title=title)
+            fig = _px().line(df, x=x, y=y, color=color, title=title)
             fig.update_xaxes(autotickangles=[0, 45, 60, 90])
             return _fig_to_image(fig)
         except Exception as e:
@@ -163,7 +172,7 @@ class Visualizations:
                     if df.empty: return f"The dataframe_query '{dataframe_query}' resulted in no data."
                 except Exception as e: return f"Error applying dataframe_query: {e}"
 
-            fig = px.histogram(df, x=column, color=color, nbins=nbins, title=title)
+            fig = _px().histogram(df, x=column, color=color, nbins=nbins, title=title)
             fig.update_xaxes(autotickangles=[0, 45, 60, 90])
             return _fig_to_image(fig)
         except Exception as e:
@@ -197,7 +206,7 @@ class Visualizations:
                     if df.empty: return f"The dataframe_query '{dataframe_query}' resulted in no data."
                 except Exception as e: return f"Error applying dataframe_query: {e}"
 
-            fig = px.strip(df, x=x, y=y, color=color, title=title)
+            fig = _px().strip(df, x=x, y=y, color=color, title=title)
             fig.update_xaxes(autotickangles=[0, 45, 60, 90])
             return _fig_to_image(fig)
         except Exception as e:
@@ -231,7 +240,7 @@ class Visualizations:
                     if df.empty: return f"The dataframe_query '{dataframe_query}' resulted in no data."
                 except Exception as e: return f"Error applying dataframe_query: {e}"
 
-            fig = px.box(df, x=x, y=y, color=color, title=title)
+            fig = _px().box(df, x=x, y=y, color=color, title=title)
             fig.update_xaxes(autotickangles=[0, 45, 60, 90])
             return _fig_to_image(fig)
         except Exception as e:
@@ -266,7 +275,7 @@ class Visualizations:
                     if df.empty: return f"The dataframe_query '{dataframe_query}' resulted in no data."
                 except Exception as e: return f"Error applying dataframe_query: {e}"
 
-            fig = px.bar(df, x=x, y=y, color=color, orientation=orientation, title=title)
+            fig = _px().bar(df, x=x, y=y, color=color, orientation=orientation, title=title)
             fig.update_xaxes(autotickangles=[0, 45, 60, 90])
             return _fig_to_image(fig)
         except Exception as e: